@@ -0,0 +1,31 @@
+import numpy as np
+from crystal_dda.shapes import Crystal
+from crystal_dda.aggregate import Aggregate
+from crystal_dda.geometry import euler_matrix
+from .common import production_polygon, c, peak_alloc
+
+class BuildAggregate:
+    params = [1, 10, 30]
+    param_names = ['nmember']
+    timeout = 120
+
+    def setup(self, nmember):
+        self.cr = Crystal(production_polygon(), c)
+        self.cr.create_dipoles(0.02)
+        rng = np.random.default_rng(0)
+        self.offsets = rng.uniform(-3., 3., [nmember, 3])
+        self.rotations = [euler_matrix(*angles) for angles in rng.uniform(0., 360., [nmember, 3])]
+
+    def build(self):
+        ag = Aggregate(0.02)
+        for offset, rotation in zip(self.offsets, self.rotations):
+            ag.add(self.cr, offset=offset, rotation=rotation)
+        ag.build()
+        return ag
+
+    def time_build(self, nmember):
+        self.build()
+
+    def track_alloc_build(self, nmember):
+        return peak_alloc(self.build)
+    track_alloc_build.unit = 'bytes'
@@ -0,0 +1,104 @@
+import numpy as np
+from crystal_dda.shapes import Crystal, _fill_band
+from crystal_dda.geometry import in_polygon, scanline_fill, points_in_polygon, cell_fractions
+from .common import production_polygon, c, peak_alloc
+
+class InPolygon:
+    params = [0.02, 0.01, 0.005]
+    param_names = ['dip_len']
+
+    def setup(self, dip_len):
+        poly = production_polygon()
+        self.x = np.array(poly.x)
+        self.y = np.array(poly.y)
+        dmax = poly.size()
+        self.xg = np.linspace(-dmax/2., dmax/2., int(dmax/dip_len)+1)
+        xg2, yg2 = np.meshgrid(self.xg, self.xg, indexing='ij')
+        self.xpoints = xg2.flatten()
+        self.ypoints = yg2.flatten()
+
+    def time_in_polygon(self, dip_len):
+        in_polygon(self.x, self.y, self.xpoints, self.ypoints)
+
+    def time_scanline_fill(self, dip_len):
+        scanline_fill(self.x, self.y, self.xg, self.xg)
+
+    def time_points_in_polygon(self, dip_len):
+        points_in_polygon(self.x, self.y, self.xpoints, self.ypoints)
+
+    def time_cell_fractions(self, dip_len):
+        cell_fractions(self.x, self.y, self.xg, self.xg)
+
+class CreateDipoles:
+    params = [[0.02, 0.01, 0.005], ['scanline', 'path']]
+    param_names = ['dip_len', 'method']
+    timeout = 120
+
+    def setup(self, dip_len, method):
+        self.poly = production_polygon()
+
+    def create_dipoles(self, dip_len, method):
+        cr = Crystal(self.poly, c)
+        cr.create_dipoles(dip_len, method=method)
+        return cr
+
+    def time_create_dipoles(self, dip_len, method):
+        self.create_dipoles(dip_len, method)
+
+    def peakmem_create_dipoles(self, dip_len, method):
+        self.create_dipoles(dip_len, method)
+
+    def track_alloc_create_dipoles(self, dip_len, method):
+        return peak_alloc(self.create_dipoles, dip_len, method)
+    track_alloc_create_dipoles.unit = 'bytes'
+
+class CreateDipolesSymmetric:
+    params = [[0.01, 0.005, 0.002], [False, True]]
+    param_names = ['dip_len', 'symmetric']
+
+    def setup(self, dip_len, symmetric):
+        self.poly = production_polygon(20)
+
+    def time_create_dipoles(self, dip_len, symmetric):
+        cr = Crystal(self.poly, c)
+        cr.create_dipoles(dip_len, symmetric=symmetric)
+
+class CreateDipolesRotated:
+    params = [[0.02, 0.01], [(0., 0., 0.), (30., 60., 10.), (0., 90., 0.)]]
+    param_names = ['dip_len', 'angles']
+    timeout = 120
+
+    def setup(self, dip_len, angles):
+        self.poly = production_polygon()
+
+    def create_dipoles_rotated(self, dip_len, angles):
+        cr = Crystal(self.poly, c)
+        cr.create_dipoles_rotated(dip_len, *angles)
+        return cr
+
+    def time_create_dipoles_rotated(self, dip_len, angles):
+        self.create_dipoles_rotated(dip_len, angles)
+
+    def track_alloc_create_dipoles_rotated(self, dip_len, angles):
+        return peak_alloc(self.create_dipoles_rotated, dip_len, angles)
+    track_alloc_create_dipoles_rotated.unit = 'bytes'
+
+class CreateDipolesWorkers:
+    params = [[0.005, 0.002], ['scanline', 'path'], [1, 2, 4]]
+    param_names = ['dip_len', 'method', 'workers']
+    timeout = 300
+
+    def setup(self, dip_len, method, workers):
+        self.poly = production_polygon()
+        dmax = self.poly.size()
+        self.xg = np.linspace(-dmax/2., dmax/2., int(dmax/dip_len)+1)
+
+    def time_create_dipoles_arrays(self, dip_len, method, workers):
+        cr = Crystal(self.poly, c)
+        cr.create_dipoles(dip_len, method=method, workers=workers)
+        cr.dipole_arrays()
+
+    def time_fill_band(self, dip_len, method, workers):
+        # a middle band of the 4*workers bands, which takes a shrinking share of the serial fill time
+        j0 = len(self.xg)//2
+        _fill_band(self.poly.x, self.poly.y, self.xg, j0, j0+len(self.xg)//(4*workers), method)
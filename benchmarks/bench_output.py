@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+from crystal_dda.shapes import Crystal
+from crystal_dda.packed import PackedDipoles
+from .common import production_polygon, c, peak_alloc
+
+class WriteDipoles:
+    params = [0.02, 0.01]
+    param_names = ['dip_len']
+    timeout = 120
+
+    def setup(self, dip_len):
+        self.cr = Crystal(production_polygon(), c)
+        self.cr.create_dipoles(dip_len)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.tmp_dir, 'crystal.txt')
+
+    def teardown(self, dip_len):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_write_dipoles(self, dip_len):
+        self.cr.write_dipoles(self.file_name)
+
+    def peakmem_write_dipoles(self, dip_len):
+        self.cr.write_dipoles(self.file_name)
+
+    def track_alloc_write_dipoles(self, dip_len):
+        return peak_alloc(self.cr.write_dipoles, self.file_name)
+    track_alloc_write_dipoles.unit = 'bytes'
+
+class StreamDipoles:
+    params = [0.02, 0.01]
+    param_names = ['dip_len']
+    timeout = 120
+
+    def setup(self, dip_len):
+        self.cr = Crystal(production_polygon(), c)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.tmp_dir, 'crystal.txt')
+
+    def teardown(self, dip_len):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_stream_dipoles(self, dip_len):
+        self.cr.stream_dipoles(self.file_name, dip_len)
+
+    def track_alloc_stream_dipoles(self, dip_len):
+        return peak_alloc(self.cr.stream_dipoles, self.file_name, dip_len)
+    track_alloc_stream_dipoles.unit = 'bytes'
+
+class PackedFile:
+    params = [0.02, 0.01]
+    param_names = ['dip_len']
+    timeout = 120
+
+    def setup(self, dip_len):
+        self.cr = Crystal(production_polygon(), c)
+        self.cr.create_dipoles(dip_len)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.packed_name = os.path.join(self.tmp_dir, 'crystal.dpk')
+        self.file_name = os.path.join(self.tmp_dir, 'crystal.txt')
+        self.cr.write_packed(self.packed_name)
+
+    def teardown(self, dip_len):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_write_packed(self, dip_len):
+        self.cr.write_packed(self.packed_name)
+
+    def time_packed_to_text(self, dip_len):
+        PackedDipoles(self.packed_name).write_dipoles(self.file_name)
+
+    def track_size_packed(self, dip_len):
+        return os.path.getsize(self.packed_name)
+    track_size_packed.unit = 'bytes'
+
+class CreateMesh:
+    params = [1, 8, 15]
+    param_names = ['nsb']
+
+    def setup(self, nsb):
+        self.cr = Crystal(production_polygon(nsb), c)
+
+    def time_create_mesh(self, nsb):
+        self.cr.create_mesh()
+
+    def time_mesh_arrays(self, nsb):
+        self.cr.mesh_arrays()
+
+class ImportTime:
+    def timeraw_import_shapes(self):
+        return 'import crystal_dda.shapes'
+
+    def timeraw_import_batch(self):
+        return 'import crystal_dda.batch'
@@ -0,0 +1,81 @@
+import numpy as np
+from crystal_dda.polygons import Polygon, PolygonBatch
+from crystal_dda.polygon_utils import hexagon, branched_planar
+from crystal_dda.geometry import afrac_dda_subregion
+from .common import production_polygon
+
+class BranchedPlanarBuild:
+    params = [1, 4, 8, 15]
+    param_names = ['nsb']
+
+    def time_branched_planar(self, nsb):
+        branched_planar(3., 3., 0.3, 0.2, 0.3, 0.6, nsb)
+
+class PolygonSize:
+    params = [1, 4, 8, 15]
+    param_names = ['nsb']
+
+    def setup(self, nsb):
+        poly = production_polygon(nsb)
+        self.x = np.array(poly.x)
+        self.y = np.array(poly.y)
+
+    def time_size(self, nsb):
+        # use a new polygon for each call, since polygons may cache their size
+        Polygon(self.x, self.y).size()
+
+class AfracSubregion:
+    params = ['exact', 'random']
+    param_names = ['method']
+
+    def setup(self, method):
+        self.xhex, self.yhex = hexagon(1.)
+        poly = production_polygon()
+        self.x = np.array(poly.x)
+        self.y = np.array(poly.y)
+
+    def time_afrac_dda_subregion(self, method):
+        afrac_dda_subregion(self.xhex, self.yhex, self.x, self.y, method=method)
+
+class PolygonWithin:
+    params = [1, 8, 15, 40]
+    param_names = ['nsb']
+
+    def setup(self, nsb):
+        poly = production_polygon(nsb)
+        self.x = np.array(poly.x)
+        self.y = np.array(poly.y)
+        self.points = np.random.default_rng(0).uniform(-1.5, 1.5, [100000, 2])
+        self.poly = Polygon(self.x, self.y)
+        self.poly.within(self.points[:1])
+
+    def time_within_first(self, nsb):
+        # includes building the edge index
+        Polygon(self.x, self.y).within(self.points)
+
+    def time_within_repeat(self, nsb):
+        self.poly.within(self.points)
+
+class PolygonBatchOps:
+    params = [['hexagon', 'stellar', 'branched_planar'], [100, 1000]]
+    param_names = ['habit', 'npoly']
+
+    def setup(self, habit, npoly):
+        rng = np.random.default_rng(0)
+        self.a = rng.uniform(1., 3., npoly)
+        self.args = {'hexagon':(self.a,), 'stellar':(rng.uniform(0.1, 0.9, npoly), self.a),
+                     'branched_planar':(self.a, 3., 0.3, 0.2, 0.3, 0.6, 8)}[habit]
+        self.points = rng.uniform(-1.5, 1.5, [1000, 2])
+        self.batch = getattr(PolygonBatch, habit)(*self.args)
+
+    def time_build(self, habit, npoly):
+        getattr(PolygonBatch, habit)(*self.args)
+
+    def time_size_area(self, habit, npoly):
+        batch = getattr(PolygonBatch, habit)(*self.args)
+        batch.size()
+        batch.area
+
+    def time_within(self, habit, npoly):
+        self.batch.within(self.points)
+
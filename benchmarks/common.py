@@ -0,0 +1,18 @@
+import tracemalloc
+from crystal_dda.polygons import BranchedPlanar
+
+# production-size branched planar crystal (3 mm maximum dimension) and half thickness
+def production_polygon(nsb=8):
+    return BranchedPlanar(3., 3., 0.3, 0.2, 0.3, 0.6, nsb)
+
+c = 0.05
+
+# peak memory allocated by python and numpy while running a function
+def peak_alloc(func, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak
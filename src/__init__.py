@@ -1,2 +1,3 @@
 #import crystal_dda.geometry, crystal_dda.polygons, crystal_dda.polygon_utils, crystal_dda.shapes
 #__all__ = ['geometry','polygons','polygon_utils','shapes']
+__version__ = '0.0.1'
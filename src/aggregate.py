@@ -0,0 +1,280 @@
+import numpy as np
+from crystal_dda.writers import write_columns
+from crystal_dda.instrument import stage
+
+# number of set bits of each byte value
+_nbits = np.unpackbits(np.arange(256, dtype=np.uint8)[:,None], axis=1).sum(axis=1)
+
+class Aggregate:
+    '''
+    Class to combine the dipoles of several crystals, each shifted and rotated, into one set of ADDA
+    dipole indices.
+
+    Members are rasterized one z layer at a time into a shared occupancy grid with one bit per dipole,
+    and overlapping dipoles are merged by a bitwise OR. Each aggregate dipole is occupied if the nearest
+    dipole of a member (after undoing the member shift and rotation) is occupied, so the memory use is
+    the packed grid plus one layer of one member.
+
+    Parameters
+    ----------
+    dip_len : float
+        The dipole spacing of the aggregate.
+
+    Returns
+    -------
+    Aggregate
+        The returned `Aggregate` object.
+    '''
+    def __init__(self, dip_len):
+        self.dip_len = dip_len
+        self.members = []
+        self.grid = None
+        self.lo = None
+        self.hi = None
+
+    def add(self, crystal, offset=(0., 0., 0.), rotation=None):
+        '''
+        Add a filled crystal to the aggregate.
+
+        Parameters
+        ----------
+        crystal : Crystal
+            The crystal, with dipoles from `create_dipoles` or `set_dipoles`.
+        offset : array_like, optional
+            The physical position in the aggregate of the central dipole of the crystal.
+        rotation : array_like, optional
+            The (3,3) rotation matrix of the crystal (e.g., from `geometry.euler_matrix`), applied before the offset.
+
+        Returns
+        -------
+        None
+        '''
+        if crystal.dipoles is None:
+            raise ValueError('aggregate members must be filled; try running create_dipoles() first.')
+        dips = crystal.dipoles
+        rot = np.eye(3) if rotation is None else np.asarray(rotation, dtype=float)
+        offset = np.asarray(offset, dtype=float)
+
+        # aggregate index range of the rotated member box (padded by one member dipole)
+        if dips.nfoot==0:
+            return
+        lo, hi = self._local_box(dips)
+        corners = np.array(np.meshgrid(*zip(lo, hi), indexing='ij')).reshape(3, -1)
+        corners = rot@corners+offset[:,None]
+        pad = dips.dip_len
+        klo = np.floor((np.min(corners, axis=1)-pad)/self.dip_len).astype(int)
+        khi = np.ceil((np.max(corners, axis=1)+pad)/self.dip_len).astype(int)
+
+        self.members.append((dips, rot, offset, klo, khi))
+        self.lo = klo if self.lo is None else np.minimum(self.lo, klo)
+        self.hi = khi if self.hi is None else np.maximum(self.hi, khi)
+        self.grid = None
+        return
+
+    def _local_box(self, dips):
+        # physical box of member dipole centers about the central member dipole
+        ic, kc = self._center(dips)
+        lo = np.array([np.min(dips.i)-ic, np.min(dips.j)-ic, -kc])
+        hi = np.array([np.max(dips.i)-ic, np.max(dips.j)-ic, dips.ndipz-1-kc])
+        if dips.kmin is not None:
+            lo[2] = np.min(dips.kmin)-kc
+            hi[2] = np.max(dips.kmax)-kc
+        return lo*dips.dip_len, hi*dips.dip_len
+
+    def _center(self, dips):
+        # grid and layer index of the central member dipole
+        return (len(dips.xg)-1)//2, (dips.ndipz-1)//2
+
+    def build(self):
+        '''
+        Rasterize the members into the packed occupancy grid (done on first use of the dipoles).
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        grid : ndarray
+            The (nz,ny,nx/8) uint8 array of occupancy bits packed along the x axis, covering the aggregate
+            indices from `lo` to `hi`.
+        '''
+        if self.grid is not None:
+            return self.grid
+        if len(self.members)==0:
+            raise ValueError('the aggregate has no members; try running add() first.')
+        nx, ny, nz = self.hi-self.lo+1
+        self.grid = np.zeros([nz, ny, (nx+7)//8], dtype=np.uint8)
+        for member in self.members:
+            with stage('rasterize') as st:
+                st.npoint = self._rasterize(*member)
+        return self.grid
+
+    def _rasterize(self, dips, rot, offset, klo, khi):
+        # member footprint and layer ranges on its dipole grid
+        nxy = len(dips.xg)
+        foot = np.zeros([nxy, nxy], dtype=bool)
+        foot[dips.i, dips.j] = True
+        if dips.kmin is not None:
+            # layer runs sorted by column and first layer (columns may have several runs)
+            run = dips.i.astype(np.int64)*nxy+dips.j
+            runkey = run*dips.ndipz+dips.kmin
+            order = np.argsort(runkey)
+            run, runkey, kmax = run[order], runkey[order], dips.kmax[order]
+
+        # member grid coordinates q = inv@p+shift of aggregate points p, which are linear in the x index
+        # n of the points in each row (q = slope*n+intercept)
+        ic, kc = self._center(dips)
+        inv = rot.T/dips.dip_len
+        shift = np.array([ic, ic, kc])-inv@offset
+        qlo = np.full([3,1], -0.5)
+        qhi = np.array([nxy, nxy, dips.ndipz])[:,None]-0.5
+        slope = inv[:,0]*self.dip_len
+        flat = np.abs(slope)<1e-12
+        y = np.arange(klo[1], khi[1]+1)*self.dip_len
+        nx = khi[0]-klo[0]+1
+
+        x0 = klo[0]-self.lo[0]
+        npoint = 0
+        for kz in range(klo[2], khi[2]+1):
+            # range of n in each row with all member indices in bounds (rounded outwards)
+            intercept = inv[:,1,None]*y+(inv[:,2]*kz*self.dip_len+inv[:,0]*klo[0]*self.dip_len+shift)[:,None]
+            n1 = (qlo-intercept)/np.where(flat, 1., slope)[:,None]
+            n2 = (qhi-intercept)/np.where(flat, 1., slope)[:,None]
+            inrange = (intercept>=qlo)&(intercept<=qhi)
+            nstart = np.where(flat[:,None], np.where(inrange, 0, nx), np.floor(np.minimum(n1, n2)))
+            nend = np.where(flat[:,None], nx-1, np.ceil(np.maximum(n1, n2)))
+            nstart = np.maximum(np.max(nstart, axis=0), 0).astype(int)
+            nend = np.minimum(np.min(nend, axis=0), nx-1).astype(int)
+            count = np.maximum(nend-nstart+1, 0)
+            if np.sum(count)==0:
+                continue
+
+            # points of the rows
+            row = np.repeat(np.arange(len(y)), count)
+            n = np.arange(np.sum(count))-np.repeat(np.cumsum(count)-count-nstart, count)
+            q = np.rint(slope[:,None]*n+intercept[:,row]).astype(np.int64)
+            inside = np.all((q>=0)&(q<qhi), axis=0)
+            row, n, q = row[inside], n[inside], q[:,inside]
+            occ_in = foot[q[0], q[1]]
+            if dips.kmin is not None:
+                # last run of the column starting at or below the layer
+                qrun = q[0]*nxy+q[1]
+                irun = np.searchsorted(runkey, qrun*dips.ndipz+q[2], 'right')-1
+                found = irun>=0
+                irun = np.maximum(irun, 0)
+                occ_in &= found&(run[irun]==qrun)&(kmax[irun]>=q[2])
+            row, n = row[occ_in], n[occ_in]
+            if len(row)==0:
+                continue
+
+            # union of the packed occupied rows with the grid
+            r0, r1 = np.min(row), np.max(row)
+            b0, b1 = (x0+np.min(n))//8, (x0+np.max(n))//8
+            occ = np.zeros([r1-r0+1, 8*(b1-b0+1)], dtype=bool)
+            occ[row-r0, x0+n-8*b0] = True
+            iy = klo[1]-self.lo[1]+r0
+            self.grid[kz-self.lo[2], iy:iy+occ.shape[0], b0:b1+1] |= np.packbits(occ, axis=1)
+            npoint = npoint+len(row)
+        return npoint
+
+    @property
+    def ndip(self):
+        '''
+        The number of aggregate dipoles.
+        '''
+        return int(np.sum(_nbits[self.build()], dtype=np.int64))
+
+    def layers(self):
+        '''
+        Iterate over the occupied z layers of the aggregate.
+
+        Parameters
+        ----------
+        None
+
+        Yields
+        ------
+        ix : ndarray
+            The x dipole indices of the layer (with min index values of 1 over the aggregate).
+        iy : ndarray
+            The y dipole indices of the layer.
+        iz : int
+            The z dipole index of the layer.
+        '''
+        grid = self.build()
+        nx = self.hi[0]-self.lo[0]+1
+        xmin, ymin, zmin = self.bbox[:,0]
+        for iz in range(grid.shape[0]):
+            if not np.any(grid[iz]):
+                continue
+            iy, ix = np.nonzero(np.unpackbits(grid[iz], axis=1, count=nx))
+            yield ix-xmin+1, iy-ymin+1, iz-zmin+1
+
+    @property
+    def bbox(self):
+        '''
+        The (3,2) array of grid indices (from 0) of the first and last occupied dipoles along the x, y and
+        z axes.
+        '''
+        grid = self.build()
+        nx = self.hi[0]-self.lo[0]+1
+        bbox = np.zeros([3,2], dtype=int)
+        if not np.any(grid):
+            return bbox
+        xbits = np.unpackbits(np.bitwise_or.reduce(grid, axis=(0,1)), count=nx)
+        ybits = np.any(grid, axis=(0,2))
+        zbits = np.any(grid, axis=(1,2))
+        for axis, bits in enumerate([xbits, ybits, zbits]):
+            ind = np.flatnonzero(bits)
+            bbox[axis] = [ind[0], ind[-1]]
+        return bbox
+
+    def arrays(self):
+        '''
+        Build the full 3d dipole index arrays, ordered by z layer, then y and then x.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        ix : ndarray
+            The x dipole indices.
+        iy : ndarray
+            The y dipole indices.
+        iz : ndarray
+            The z dipole indices.
+        '''
+        layers = list(self.layers())
+        if len(layers)==0:
+            return np.array([], dtype=int), np.array([], dtype=int), np.array([], dtype=int)
+        ix = np.concatenate([layer[0] for layer in layers])
+        iy = np.concatenate([layer[1] for layer in layers])
+        iz = np.concatenate([np.full(len(layer[0]), layer[2]) for layer in layers])
+        return ix, iy, iz
+
+    def write_dipoles(self, file_name):
+        '''
+        Write the aggregate dipole indices to a file, one z layer at a time.
+
+        Parameters
+        ----------
+        file_name : str
+            The output file name (gzip compressed if it ends in '.gz').
+
+        Returns
+        -------
+        None
+        '''
+        bbox = self.bbox
+        dx, dy, dz = bbox[:,1]-bbox[:,0]+1
+        header = "#generated by crystal-dda\n"+\
+                 "#shape: 'read'\n"+\
+                f"#box size: {dx:.0f}x{dy:.0f}x{dz:.0f}\n"
+        chunks = ((ix, iy, np.full(len(ix), iz)) for ix, iy, iz in self.layers())
+        with stage('write') as st:
+            write_columns(file_name, chunks, ('%d','%d','%d'), header=header)
+            st.npoint = self.ndip
+        return
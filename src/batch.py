@@ -0,0 +1,190 @@
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+from crystal_dda.polygons import BranchedPlanar
+from crystal_dda.shapes import Crystal
+from crystal_dda.dipoles import DipoleSet
+from crystal_dda.geometry import afrac_branched
+
+# branched planar shape parameters in each row of a batch table
+shape_keys = ['a', 'amax', 'ac', 'ft', 'fb', 'fg', 'nsb']
+
+def table_rows(params):
+    '''
+    Get the rows of a table of branched planar shape parameters.
+
+    Parameters
+    ----------
+    params : list of dict, dict of array_like, or structured ndarray
+        The shape parameter table, with the values of `a`, `amax`, `ac`, `ft`, `fb`, `fg` and `nsb` for
+        each crystal, given either as rows or as columns.
+
+    Returns
+    -------
+    rows : list of dict
+        The shape parameters of each crystal.
+    '''
+    # get column names for column tables
+    if getattr(params, 'dtype', None) is not None and params.dtype.names is not None:
+        keys = params.dtype.names
+    elif hasattr(params, 'keys'):
+        keys = list(params.keys())
+    else:
+        keys = None
+
+    if keys is not None:
+        columns = {k:np.asarray(params[k]) for k in shape_keys}
+        nrow = len(columns['a'])
+        params = [{k:columns[k][i] for k in shape_keys} for i in range(nrow)]
+
+    rows = []
+    for row in params:
+        shape = {k:float(row[k]) for k in shape_keys}
+        shape['nsb'] = int(row['nsb'])
+        rows.append(shape)
+    return rows
+
+def generate_item(index, shape, c, dip_len, file_name=None, method='scanline', share=False):
+    '''
+    Create, fill and optionally write one branched planar crystal of a batch.
+
+    Parameters
+    ----------
+    index : int
+        The index of the crystal in the batch.
+    shape : dict
+        The branched planar shape parameters.
+    c : float
+        The crystal basal-length dimension.
+    dip_len : float
+        The dipole spacing.
+    file_name : str, optional
+        The output dipole file name. If None, no file is written.
+    method : str, optional
+        The `Crystal.create_dipoles` fill method.
+    share : bool, optional
+        If True, return the dipole footprint in a shared memory block instead of as a `DipoleSet`.
+
+    Returns
+    -------
+    item : dict
+        The crystal metadata and dipoles.
+    '''
+    time0 = time.perf_counter()
+    poly = BranchedPlanar(**shape)
+    time1 = time.perf_counter()
+    cr = Crystal(poly, c)
+    cr.create_dipoles(dip_len, method=method)
+    time2 = time.perf_counter()
+    if file_name is not None:
+        cr.write_dipoles(file_name)
+    time3 = time.perf_counter()
+
+    item = {'index':index, 'params':shape, 'c':c, 'dip_len':dip_len,
+            'ndip':cr.ndip, 'file':file_name,
+            'afrac':afrac_branched(**shape),
+            'time':{'polygon':time1-time0, 'fill':time2-time1,
+                    'write':time3-time2, 'total':time3-time0}}
+
+    dips = cr.dipoles
+    if share:
+        # copy footprint indices to shared memory to be released by the parent process (the block stays
+        # registered with the parent's resource tracker until it is unlinked)
+        nbyte = 2*dips.nfoot*dips.i.itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(nbyte, 1))
+        ij = np.ndarray([2, dips.nfoot], dtype=dips.i.dtype, buffer=shm.buf)
+        ij[0,:] = dips.i
+        ij[1,:] = dips.j
+        item['shared'] = (shm.name, dips.i.dtype.str, dips.nfoot, dips.xg, dips.ndipz)
+        del ij
+        shm.close()
+    else:
+        item['dipoles'] = dips
+    return item
+
+def attach_dipoles(item):
+    '''
+    Move the dipole footprint of a batch item out of shared memory and into a `DipoleSet`.
+    '''
+    name, dtype, nfoot, xg, ndipz = item.pop('shared')
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        ij = np.ndarray([2, nfoot], dtype=dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    item['dipoles'] = DipoleSet(ij[0], ij[1], xg, item['dip_len'], ndipz)
+    return item
+
+def release_dipoles(item):
+    '''
+    Unlink the shared memory block of a batch item without attaching its dipoles.
+    '''
+    shm = shared_memory.SharedMemory(name=item.pop('shared')[0])
+    shm.close()
+    shm.unlink()
+    return
+
+def generate_batch(params, c, dip_len, out_dir=None, workers=None, method='scanline',
+                   file_format='crystal_{index:05d}.txt'):
+    '''
+    Create, fill and optionally write a batch of branched planar crystals on a process pool.
+
+    Parameters
+    ----------
+    params : list of dict, dict of array_like, or structured ndarray
+        The table of branched planar shape parameters (`a`, `amax`, `ac`, `ft`, `fb`, `fg`, `nsb`).
+    c : float or array_like
+        The crystal basal-length dimension, for all crystals or for each crystal.
+    dip_len : float or array_like
+        The dipole spacing, for all crystals or for each crystal.
+    out_dir : str, optional
+        The directory for the output dipole files. If None, no files are written.
+    workers : int, optional
+        The number of worker processes (default is the number of cpus). With 1 worker the batch is
+        run in the calling process.
+    method : str, optional
+        The `Crystal.create_dipoles` fill method.
+    file_format : str, optional
+        The format of the output file names, given the crystal `index`.
+
+    Returns
+    -------
+    items : list of dict
+        The metadata of each crystal in table order: `index`, `params`, `c`, `dip_len`, `ndip`, `file`,
+        the analytic area fraction `afrac`, the stage timings `time`, and the `dipoles` `DipoleSet`.
+    '''
+    rows = table_rows(params)
+    nrow = len(rows)
+    c = np.broadcast_to(c, [nrow]).tolist()
+    dip_len = np.broadcast_to(dip_len, [nrow]).tolist()
+    if out_dir is None:
+        file_names = [None]*nrow
+    else:
+        file_names = [os.path.join(out_dir, file_format.format(index=i)) for i in range(nrow)]
+    if workers is None:
+        workers = os.cpu_count()
+
+    args = [range(nrow), rows, c, dip_len, file_names, [method]*nrow]
+    if workers<=1:
+        return list(map(generate_item, *args))
+
+    # start the resource tracker before the workers so that they share it with this process
+    resource_tracker.ensure_running()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(generate_item, *arg, True) for arg in zip(*args)]
+        items = []
+        try:
+            for future in futures:
+                items.append(attach_dipoles(future.result()))
+        finally:
+            # on errors, wait for the remaining items and release their shared memory
+            for future in futures[len(items):]:
+                if future.cancel() or future.exception() is not None:
+                    continue
+                item = future.result()
+                if 'shared' in item:
+                    release_dipoles(item)
+    return items
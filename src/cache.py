@@ -0,0 +1,252 @@
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import tempfile
+import zipfile
+import numpy as np
+import crystal_dda
+from crystal_dda.dipoles import DipoleSet
+
+def dipole_key(poly, c, dip_len):
+    '''
+    Get the canonical hash of the inputs that define the dipoles of a crystal.
+
+    Parameters
+    ----------
+    poly : Polygon
+        The crystal polygon.
+    c : float
+        The crystal basal-length dimension.
+    dip_len : float
+        The dipole spacing.
+
+    Returns
+    -------
+    key : str
+        The sha256 hex digest of the shape class, shape parameters, `c`, `dip_len` and library version.
+    '''
+    params = {k:np.asarray(v).tolist() for k, v in poly.params.items()}
+    record = {'shape':type(poly).__name__, 'params':params, 'c':float(c), 'dip_len':float(dip_len),
+              'version':crystal_dda.__version__}
+    text = json.dumps(record, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class DipoleCache:
+    '''
+    An on-disk cache of crystal dipole sets (and written dipole files) keyed by `dipole_key`, with
+    least-recently-used eviction when the cache grows beyond `max_bytes`.
+
+    Entries are written to a temporary file and atomically renamed, so separate processes can share
+    a cache directory; an entry that is removed or unreadable is treated as a cache miss.
+
+    Parameters
+    ----------
+    directory : str
+        The cache directory (created if it does not exist).
+    max_bytes : int, optional
+        The maximum total size of the cache entries.
+
+    Returns
+    -------
+    DipoleCache
+        The returned `DipoleCache` object.
+    '''
+    def __init__(self, directory, max_bytes=2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, suffix='.npz'):
+        '''
+        Get the file path of a cache entry.
+
+        Parameters
+        ----------
+        key : str
+            The entry key.
+        suffix : str, optional
+            The entry file suffix ('.npz' for dipole sets and '.txt.gz' for dipole files).
+
+        Returns
+        -------
+        path : str
+            The entry file path.
+        '''
+        return os.path.join(self.directory, key+suffix)
+
+    def get(self, key):
+        '''
+        Load a dipole set from the cache.
+
+        Parameters
+        ----------
+        key : str
+            The entry key.
+
+        Returns
+        -------
+        dipoles : DipoleSet or None
+            The cached dipole set, or None if the key is not in the cache.
+        '''
+        path = self.path(key)
+        try:
+            with np.load(path) as f:
+                columns = [f['kmin'], f['kmax']] if 'kmin' in f else []
+                dipoles = DipoleSet(f['i'], f['j'], f['xg'], float(f['dip_len']), int(f['ndipz']), *columns)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+        self._touch(path)
+        return dipoles
+
+    def put(self, key, dipoles):
+        '''
+        Store a dipole set in the cache as its compressed footprint (and column layer ranges).
+
+        Parameters
+        ----------
+        key : str
+            The entry key.
+        dipoles : DipoleSet
+            The dipole set.
+
+        Returns
+        -------
+        None
+        '''
+        columns = {}
+        if dipoles.kmin is not None:
+            columns = {'kmin':dipoles.kmin, 'kmax':dipoles.kmax}
+        def write(f):
+            np.savez_compressed(f, i=dipoles.i, j=dipoles.j, xg=dipoles.xg,
+                                dip_len=dipoles.dip_len, ndipz=dipoles.ndipz, **columns)
+        self._store(self.path(key), write)
+        return
+
+    def get_file(self, key, file_name):
+        '''
+        Copy a cached dipole file to `file_name`.
+
+        Parameters
+        ----------
+        key : str
+            The entry key.
+        file_name : str
+            The output file name (gzip compressed if it ends in '.gz').
+
+        Returns
+        -------
+        hit : bool
+            True if the file was in the cache.
+        '''
+        path = self.path(key, '.txt.gz')
+        try:
+            if str(file_name).endswith('.gz'):
+                shutil.copyfile(path, file_name)
+            else:
+                with gzip.open(path, 'rb') as fin, open(file_name, 'wb') as fout:
+                    shutil.copyfileobj(fin, fout)
+        except (OSError, EOFError):
+            return False
+        self._touch(path)
+        return True
+
+    def put_file(self, key, file_name):
+        '''
+        Store a written dipole file in the cache.
+
+        Parameters
+        ----------
+        key : str
+            The entry key.
+        file_name : str
+            The dipole file name (gzip compressed if it ends in '.gz').
+
+        Returns
+        -------
+        None
+        '''
+        def write(f):
+            if str(file_name).endswith('.gz'):
+                with open(file_name, 'rb') as fin:
+                    shutil.copyfileobj(fin, f)
+            else:
+                with open(file_name, 'rb') as fin, gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as fout:
+                    shutil.copyfileobj(fin, fout)
+        self._store(self.path(key, '.txt.gz'), write)
+        return
+
+    def nbytes(self):
+        '''
+        Get the total size of the cache entries.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        nbytes : int
+            The total size of the cache entries in bytes.
+        '''
+        return sum([size for path, size, mtime in self._entries()])
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache size is at most `max_bytes`.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        '''
+        entries = sorted(self._entries(), key=lambda entry:entry[2])
+        nbytes = sum([size for path, size, mtime in entries])
+        for path, size, mtime in entries:
+            if nbytes<=self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            nbytes -= size
+        return
+
+    def _entries(self):
+        # (path, size, last use time) of each entry, skipping entries removed by other processes
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def _store(self, path, write):
+        # write to a hidden temporary file and rename it into place in one step
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.evict()
+        return
+
+    def _touch(self, path):
+        # mark entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return
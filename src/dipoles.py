@@ -0,0 +1,240 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+def layer_ranges(h, dip_len, ndipz):
+    '''
+    Get the z layers within a half thickness of the midplane for each footprint column.
+
+    Parameters
+    ----------
+    h : ndarray
+        The half thickness of each column.
+    dip_len : float
+        The dipole spacing.
+    ndipz : int
+        The number of dipole layers, centered on the midplane.
+
+    Returns
+    -------
+    kmin : ndarray
+        The first layer index (from 0) of each column.
+    kmax : ndarray
+        The last layer index of each column (less than `kmin` for empty columns).
+    '''
+    kmid = (ndipz-1)/2.
+    hk = np.asarray(h, dtype=float)/dip_len
+    kmin = np.maximum(np.ceil(kmid-hk), 0).astype(int)
+    kmax = np.minimum(np.floor(kmid+hk), ndipz-1).astype(int)
+    return kmin, kmax
+
+class DipoleSet:
+    '''
+    The set of dipole indices for a crystal, stored as a 2d footprint on the dipole grid that is
+    extruded along the z axis, either through all layers or through a range of layers for each
+    footprint column.
+
+    Parameters
+    ----------
+    i : ndarray
+        The grid x indices of the footprint points.
+    j : ndarray
+        The grid y indices of the footprint points.
+    xg : ndarray
+        The physical grid coordinates along the x and y axes.
+    dip_len : float
+        The dipole spacing.
+    ndipz : int
+        The number of dipole layers along the z axis.
+    kmin : ndarray, optional
+        The first layer index (from 0) of each footprint column. If None, all columns span all layers.
+        A column may be listed more than once, with a separate run of layers for each listing.
+    kmax : ndarray, optional
+        The last layer index of each footprint column.
+    weight : ndarray, optional
+        The area fraction of the grid cell of each footprint point that is inside the crystal polygon.
+
+    Returns
+    -------
+    DipoleSet
+        The returned `DipoleSet` object.
+    '''
+    def __init__(self, i, j, xg, dip_len, ndipz, kmin=None, kmax=None, weight=None):
+        # store footprint with the smallest integer type that holds the grid indices
+        if len(xg)<=np.iinfo(np.int16).max:
+            dtype = np.int16
+        else:
+            dtype = np.int32
+        self.i = np.asarray(i, dtype=dtype)
+        self.j = np.asarray(j, dtype=dtype)
+        self.xg = xg
+        self.dip_len = dip_len
+        self.ndipz = ndipz
+        if kmin is None:
+            self.kmin = None
+            self.kmax = None
+        else:
+            # layer ranges need a type that holds the layer indices, which may exceed the grid size
+            if ndipz>np.iinfo(dtype).max:
+                dtype = np.int32
+            self.kmin = np.asarray(kmin, dtype=dtype)
+            self.kmax = np.asarray(kmax, dtype=dtype)
+        self.weight = None if weight is None else np.asarray(weight, dtype=float)
+
+    @property
+    def nfoot(self):
+        '''
+        The number of dipoles in the 2d footprint.
+        '''
+        return len(self.i)
+
+    @property
+    def ndip(self):
+        '''
+        The total number of dipoles.
+        '''
+        if self.kmin is None:
+            return self.nfoot*self.ndipz
+        return int(np.sum(self.column_sizes()))
+
+    @property
+    def bbox(self):
+        '''
+        The (3,2) array of minimum and maximum dipole indices along the x, y and z axes.
+        '''
+        if self.nfoot==0:
+            return np.zeros([3,2])
+        xlim = self.xg[[np.min(self.i), np.max(self.i)]]/self.dip_len
+        ylim = self.xg[[np.min(self.j), np.max(self.j)]]/self.dip_len
+        if self.kmin is None:
+            zlim = [1., self.ndipz]
+        else:
+            zlim = [np.min(self.kmin)+1., np.max(self.kmax)+1.]
+        bbox = np.array([xlim-xlim[0]+1, ylim-ylim[0]+1, zlim])
+        return bbox
+
+    def column_sizes(self):
+        '''
+        Get the number of dipoles in each footprint column.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        nz : ndarray
+            The number of dipoles in each column.
+        '''
+        if self.kmin is None:
+            return np.full([self.nfoot], self.ndipz)
+        return np.maximum(self.kmax.astype(int)-self.kmin+1, 0)
+
+    def footprint(self):
+        '''
+        Get the dimensionless x and y dipole indices of the 2d footprint (with min index values of 1).
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        ix : ndarray
+            The x dipole indices of the footprint.
+        iy : ndarray
+            The y dipole indices of the footprint.
+        '''
+        ix = self.xg[self.i]/self.dip_len
+        iy = self.xg[self.j]/self.dip_len
+        if self.nfoot>0:
+            ix = ix-np.min(ix)+1
+            iy = iy-np.min(iy)+1
+        return ix, iy
+
+    def layers(self):
+        '''
+        Iterate over the z layers of the dipole set.
+
+        Parameters
+        ----------
+        None
+
+        Yields
+        ------
+        ix : ndarray
+            The x dipole indices of the layer.
+        iy : ndarray
+            The y dipole indices of the layer.
+        iz : int
+            The z dipole index of the layer.
+        '''
+        ix, iy = self.footprint()
+        for iz in range(1, self.ndipz+1):
+            if self.kmin is None:
+                yield ix, iy, iz
+            else:
+                incol = (self.kmin<iz)&(self.kmax>=iz-1)
+                yield ix[incol], iy[incol], iz
+
+    def arrays(self, workers=None):
+        '''
+        Build the full 3d dipole index arrays, ordered by footprint point and then by z layer.
+
+        Parameters
+        ----------
+        workers : int, optional
+            The number of threads that rescale and extrude bands of footprint points into the arrays. If
+            None or 1, the arrays are built serially (with the same result).
+
+        Returns
+        -------
+        ix : ndarray
+            The x dipole indices.
+        iy : ndarray
+            The y dipole indices.
+        iz : ndarray
+            The z dipole indices.
+        '''
+        if workers is not None and workers>1 and self.nfoot>0:
+            return self._arrays_banded(workers)
+
+        ix, iy = self.footprint()
+        if self.kmin is None:
+            ix = np.repeat(ix, self.ndipz)
+            iy = np.repeat(iy, self.ndipz)
+            iz = np.tile(np.arange(self.ndipz)+1, self.nfoot)
+            return ix, iy, iz
+
+        # count up from the first layer of each column
+        nz = self.column_sizes()
+        start = np.cumsum(nz)-nz
+        ix = np.repeat(ix, nz)
+        iy = np.repeat(iy, nz)
+        iz = np.arange(np.sum(nz))-np.repeat(start-self.kmin-1, nz)
+        return ix, iy, iz
+
+    def _arrays_banded(self, workers):
+        # rescale and extrude bands of footprint points into slices of the preallocated arrays (the min
+        # footprint index is at the min grid index, since the grid coordinates increase)
+        xmin = self.xg[np.min(self.i)]/self.dip_len
+        ymin = self.xg[np.min(self.j)]/self.dip_len
+        nz = self.column_sizes()
+        offset = np.concatenate(([0], np.cumsum(nz)))
+        ix = np.empty([offset[-1]])
+        iy = np.empty([offset[-1]])
+        iz = np.empty([offset[-1]], dtype=int)
+
+        def extrude(f0, f1):
+            d0, d1 = offset[f0], offset[f1]
+            ix[d0:d1] = np.repeat(self.xg[self.i[f0:f1]]/self.dip_len-xmin+1, nz[f0:f1])
+            iy[d0:d1] = np.repeat(self.xg[self.j[f0:f1]]/self.dip_len-ymin+1, nz[f0:f1])
+            if self.kmin is None:
+                iz[d0:d1] = np.tile(np.arange(self.ndipz)+1, f1-f0)
+            else:
+                start = offset[f0:f1]-d0
+                iz[d0:d1] = np.arange(d1-d0)-np.repeat(start-self.kmin[f0:f1]-1, nz[f0:f1])
+
+        bands = np.linspace(0, self.nfoot, min(4*workers, self.nfoot)+1).astype(int)
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(extrude, bands[:-1], bands[1:]))
+        return ix, iy, iz
@@ -1,8 +1,8 @@
 import numpy as np
-from matplotlib import path
 
-# function to take polygon and points and return indicator
+# function to take polygon and points and return indicator (matplotlib is only imported when used)
 def in_polygon(xpoly, ypoly, xpoints, ypoints):
+    from matplotlib import path
     p = path.Path([(xpoly[i], ypoly[i]) for i in range(len(xpoly))])
     points = np.empty([len(xpoints), 2])
     points[:,0] = xpoints
@@ -10,6 +10,202 @@ def in_polygon(xpoly, ypoly, xpoints, ypoints):
     indicator = p.contains_points(points)
     return indicator
 
+# function to get polygon indicator on square grid (xg[i], xg[j]) for polygon with mirror symmetry
+# about the x and y axes; the square lattice does not share the 60 degree rotations of hexagonal
+# polygons, so only one quadrant of points is tested (with scanline_fill or matplotlib's path) and
+# the result is mirrored to the others
+def fill_symmetric(xpoly, ypoly, xg, method='scanline'):
+    ngrid = len(xg)
+    nhalf = ngrid//2
+    if method=='scanline':
+        fill_grid = lambda xs, ys: scanline_fill(xpoly, ypoly, xs, ys)
+    else:
+        def fill_grid(xs, ys):
+            xs2, ys2 = np.meshgrid(xs, ys, indexing='ij')
+            return in_polygon(xpoly, ypoly, xs2.flatten(), ys2.flatten()).reshape(xs2.shape)
+
+    # test quadrant points and mirror over both axes
+    inquad = fill_grid(xg[nhalf:], xg[nhalf:])
+    inhalf = np.concatenate((inquad[::-1][:nhalf], inquad), axis=0)
+    indicator = np.concatenate((inhalf[:,::-1][:,:nhalf], inhalf), axis=1)
+
+    # retest points on grid center lines, where polygon vertices on the axes are only
+    # symmetric to rounding error
+    if ngrid%2==1:
+        indicator[nhalf,:] = fill_grid(xg[nhalf:nhalf+1], xg)[0,:]
+        indicator[:,nhalf] = fill_grid(xg, xg[nhalf:nhalf+1])[:,0]
+    return indicator
+
+# function to get the spans of grid points inside a polygon along rows of constant y, with
+# rows yg[row] covering xg[start:end]; edge crossings are found once per row and use the same
+# crossing rule as matplotlib's contains_points so that boundary points are classified alike
+def scanline_spans(xpoly, ypoly, xg, yg):
+    x0 = np.asarray(xpoly, dtype=float)
+    y0 = np.asarray(ypoly, dtype=float)
+    x1 = np.roll(x0, -1)
+    y1 = np.roll(y0, -1)
+    nx = len(xg)
+
+    # get rows crossed by each edge (y0 < yg <= y1 or y1 < yg <= y0)
+    jstart = np.searchsorted(yg, np.minimum(y0, y1), 'right')
+    jend = np.searchsorted(yg, np.maximum(y0, y1), 'right')
+    ncross = jend-jstart
+    edge = np.repeat(np.arange(len(x0)), ncross)
+    row = np.arange(np.sum(ncross))-np.repeat(np.cumsum(ncross)-ncross, ncross)+\
+          np.repeat(jstart, ncross)
+
+    # get crossing points and first grid index right of each crossing
+    x0 = x0[edge]
+    y0 = y0[edge]
+    x1 = x1[edge]
+    y1 = y1[edge]
+    ty = yg[row]
+    yflag = y1>=ty
+    xcross = x1-(y1-ty)*(x0-x1)/(y0-y1)
+    ind = np.where(yflag, np.searchsorted(xg, xcross, 'right'),
+                          np.searchsorted(xg, xcross, 'left'))
+
+    # correct rounding of the crossing point with the exact crossing test
+    def crossed(i):
+        tx = xg[np.clip(i, 0, nx-1)]
+        return ((y1-ty)*(x0-x1)>=(x1-tx)*(y0-y1))==yflag
+    ind = np.where((ind>0)&~crossed(ind-1), ind-1, ind)
+    ind = np.where((ind<nx)&crossed(ind), ind+1, ind)
+
+    # pair sorted crossings in each row into inside spans
+    order = np.lexsort((ind, row))
+    row = row[order][0::2]
+    start = ind[order][0::2]
+    end = ind[order][1::2]
+    nonempty = end>start
+    return row[nonempty], start[nonempty], end[nonempty]
+
+# function to get polygon indicator on grid (xg[i], yg[j]) with scanline rasterization
+def scanline_fill(xpoly, ypoly, xg, yg):
+    row, start, end = scanline_spans(xpoly, ypoly, xg, yg)
+    nspan = end-start
+    offset = np.repeat(row*len(xg)+start-(np.cumsum(nspan)-nspan), nspan)
+    indicator = np.zeros([len(yg), len(xg)], dtype=bool)
+    indicator.flat[offset+np.arange(np.sum(nspan))] = True
+    return indicator.T
+
+# function to get polygon indicator of arbitrary points without matplotlib, with the crossing rule
+# of scanline_spans; points are sorted by y so each edge is only tested against the points in its
+# y range. polygons may be concatenated with start indices offsets to get the (npoly,npoint)
+# indicator of every point in each polygon
+def points_in_polygon(xpoly, ypoly, xpoints, ypoints, offsets=None):
+    x0 = np.asarray(xpoly, dtype=float)
+    y0 = np.asarray(ypoly, dtype=float)
+    if offsets is None:
+        x1 = np.roll(x0, -1)
+        y1 = np.roll(y0, -1)
+    else:
+        inext = next_vertex(offsets)
+        x1 = x0[inext]
+        y1 = y0[inext]
+    xpoints = np.asarray(xpoints, dtype=float)
+    ypoints = np.asarray(ypoints, dtype=float)
+    order = np.argsort(ypoints)
+    ysort = ypoints[order]
+
+    # get points crossed by each edge (y0 < ty <= y1 or y1 < ty <= y0)
+    kstart = np.searchsorted(ysort, np.minimum(y0, y1), 'right')
+    kend = np.searchsorted(ysort, np.maximum(y0, y1), 'right')
+    ncross = kend-kstart
+    edge = np.repeat(np.arange(len(x0)), ncross)
+    point = order[np.arange(np.sum(ncross))-np.repeat(np.cumsum(ncross)-ncross, ncross)+\
+                  np.repeat(kstart, ncross)]
+
+    # count crossings right of each point
+    x0 = x0[edge]
+    y0 = y0[edge]
+    x1 = x1[edge]
+    y1 = y1[edge]
+    tx = xpoints[point]
+    ty = ypoints[point]
+    crossed = ((y1-ty)*(x0-x1)>=(x1-tx)*(y0-y1))==(y1>=ty)
+    if offsets is None:
+        indicator = np.bincount(point[crossed], minlength=len(xpoints))%2==1
+    else:
+        npoly = len(offsets)-1
+        poly = offsets_to_ids(offsets)[edge]
+        indicator = np.bincount(poly[crossed]*len(xpoints)+point[crossed],
+                                minlength=npoly*len(xpoints)).reshape(npoly, len(xpoints))%2==1
+    return indicator
+
+# build an index of polygon edges for repeated point in polygon tests, with the polygon y range split into
+# nband equal row bands (one per edge by default) and each edge listed in the bands that its y range overlaps
+def edge_index(xpoly, ypoly, nband=None):
+    x0 = np.asarray(xpoly, dtype=float)
+    y0 = np.asarray(ypoly, dtype=float)
+    x1 = np.roll(x0, -1)
+    y1 = np.roll(y0, -1)
+    if nband is None:
+        nband = max(len(x0), 1)
+    ymin, ymax = np.min(y0), np.max(y0)
+    height = (ymax-ymin)/nband if ymax>ymin else 1.
+    index = {'x0':x0, 'y0':y0, 'x1':x1, 'y1':y1, 'ymin':ymin, 'ymax':ymax, 'height':height,
+             'nband':nband}
+
+    # edges sorted by band, with band b listing edges[offsets[b]:offsets[b+1]]
+    b0 = index_band(index, np.minimum(y0, y1))
+    nb = index_band(index, np.maximum(y0, y1))-b0+1
+    edge = np.repeat(np.arange(len(x0)), nb)
+    band = np.arange(np.sum(nb))-np.repeat(np.cumsum(nb)-nb-b0, nb)
+    index['edges'] = edge[np.argsort(band, kind='stable')]
+    index['offsets'] = np.concatenate(([0], np.cumsum(np.bincount(band, minlength=nband))))
+    return index
+
+# get the row band of an edge index containing each y value
+def index_band(index, y):
+    return np.clip(np.floor((y-index['ymin'])/index['height']), 0, index['nband']-1).astype(int)
+
+# function to get polygon indicator of arbitrary points from an edge index, testing only the edges in the
+# row band of each point with the crossing rule of points_in_polygon (in chunks of points)
+def points_in_index(index, xpoints, ypoints, chunk_size=65536):
+    xpoints = np.asarray(xpoints, dtype=float)
+    ypoints = np.asarray(ypoints, dtype=float)
+    indicator = np.zeros([len(xpoints)], dtype=bool)
+    inrange = np.flatnonzero((ypoints>index['ymin'])&(ypoints<=index['ymax']))
+    for c0 in range(0, len(inrange), chunk_size):
+        # edges of the band of each point
+        chunk = inrange[c0:c0+chunk_size]
+        band = index_band(index, ypoints[chunk])
+        start = index['offsets'][band]
+        nedge = index['offsets'][band+1]-start
+        edge = index['edges'][np.arange(np.sum(nedge))+np.repeat(start-(np.cumsum(nedge)-nedge), nedge)]
+        point = np.repeat(np.arange(len(chunk)), nedge)
+
+        # count crossings right of each point by the edges crossing its row (y0 < ty <= y1 or y1 < ty <= y0)
+        x0 = index['x0'][edge]
+        y0 = index['y0'][edge]
+        x1 = index['x1'][edge]
+        y1 = index['y1'][edge]
+        tx = xpoints[chunk][point]
+        ty = ypoints[chunk][point]
+        inrow = (np.minimum(y0, y1)<ty)&(np.maximum(y0, y1)>=ty)
+        crossed = inrow&(((y1-ty)*(x0-x1)>=(x1-tx)*(y0-y1))==(y1>=ty))
+        indicator[chunk] = np.bincount(point[crossed], minlength=len(chunk))%2==1
+    return indicator
+
+# rotation matrix for z-y-z euler angles in degrees (as used for particle orientations in adda),
+# with rounding errors of the trigonometric functions removed so quarter turns are exact
+def euler_matrix(alpha, beta, gamma):
+    a, b, g = np.radians([alpha, beta, gamma])
+    rz1 = np.array([[np.cos(a), -np.sin(a), 0.], [np.sin(a), np.cos(a), 0.], [0., 0., 1.]])
+    ry = np.array([[np.cos(b), 0., np.sin(b)], [0., 1., 0.], [-np.sin(b), 0., np.cos(b)]])
+    rz2 = np.array([[np.cos(g), -np.sin(g), 0.], [np.sin(g), np.cos(g), 0.], [0., 0., 1.]])
+    rot = rz1@ry@rz2
+    rot[np.abs(rot)<1.e-15] = 0.
+    return rot
+
+# function to test if points are within (or on) hexagon of side length a
+def in_hexagon(a, xpoints, ypoints):
+    xabs = np.abs(xpoints)
+    yabs = np.abs(ypoints)
+    indicator = (yabs<=np.sqrt(3.)/2.*a)&(np.sqrt(3.)*xabs+yabs<=np.sqrt(3.)*a)
+    return indicator
+
 # rotation
 def rotate(x, y, angle):
     angle = angle*np.pi/180.
@@ -41,10 +237,10 @@ def afrac_stellar(fbranch):
     return afrac
 
 # determine main branch fraction width (give same width as sub-branches, or 1)
+# (parameters may be arrays, which are broadcast against each other)
 def frac_main_branch(amax, ac, ft, fb, nsb):
-    wt = ft/2.*amax
     wsb = 1./((nsb)/fb+1.)*(amax-ac)
-    wmb = min(max(wsb/np.sqrt(3.), ac/2.), min(wsb/np.sqrt(3.), ac/2.))
+    wmb = np.minimum(np.maximum(wsb/np.sqrt(3.), ac/2.), np.minimum(wsb/np.sqrt(3.), ac/2.))
     fmb = wmb/(ac/2.)
     return fmb
 
@@ -65,48 +261,447 @@ def area_star(a, fmb, fb, ft, ac, ag, amax):
     return area
 
 # get deposition area fraction of branched planar
+# (parameters may be arrays, which are broadcast against each other)
 def dep_afrac_branched(a, amax, ac, ft, fb, fg, nsb):
     # deal with fg = 1
-    fg = min(fg, 0.99999999)
+    fg = np.minimum(fg, 0.99999999)
 
     # calculate ag and fmb
     fmb = frac_main_branch(amax, ac, ft, fb, nsb)
     ag = fg*amax+(1.-fg)*ac
 
-    # calculate area fraction (deposition)
-    if a <= ac:
-        afrac_dep = 1.
-    elif (a>ac)&(a<=ag):
-        afrac_dep = fb+ac/a*fmb*(1.-fb)
-    else:
-        afrac_dep = fb/(amax-ag)*(ft*amax-ag+ag*amax*(1.-ft)/a)+\
-                    (1.-fb)*fmb*ac/a
-    return afrac_dep
+    # calculate area fraction (deposition) for each size region
+    with np.errstate(divide='ignore', invalid='ignore'):
+        afrac_gap = fb+ac/a*fmb*(1.-fb)
+        afrac_star = fb/(amax-ag)*(ft*amax-ag+ag*amax*(1.-ft)/a)+\
+                     (1.-fb)*fmb*ac/a
+    afrac_dep = np.where(a<=ac, 1., np.where(a<=ag, afrac_gap, afrac_star))
+    return afrac_dep[()]
 
 # get area fraction of branched planar
+# (parameters may be arrays, which are broadcast against each other)
 def afrac_branched(a, amax, ac, ft, fb, fg, nsb):
     # deal with fg = 1 and calculate crystal values
-    fg = min(fg, 0.99999999)
+    fg = np.minimum(fg, 0.99999999)
     fmb = frac_main_branch(amax, ac, ft, fb, nsb)
     ag = fg*amax+(1.-fg)*ac
     
-    # calculate area fraction
-    if a <= ac:
-        afrac = 1.
-    elif (a>ac)&(a<=ag):
-        afrac = (area_bound(ac)+area_gap(a, fmb, fb, ac))/area_bound(a)
+    # calculate area fraction for each size region
+    with np.errstate(divide='ignore', invalid='ignore'):
+        afrac_gap = (area_bound(ac)+area_gap(a, fmb, fb, ac))/area_bound(a)
+        afrac_star = (area_bound(ac)+area_gap(ag, fmb, fb, ac)
+                     +area_star(a, fmb, fb, ft, ac, ag, amax))/area_bound(a)
+    afrac = np.where(a<=ac, 1., np.where(a<=ag, afrac_gap, afrac_star))
+    return afrac[()]
+
+# get convex hull of points in counterclockwise order (monotone chain), without collinear points
+def convex_hull(x, y):
+    order = np.lexsort((y, x))
+    points = list(zip(np.asarray(x, dtype=float)[order].tolist(),
+                      np.asarray(y, dtype=float)[order].tolist()))
+    def half_hull(points):
+        hull = []
+        for p in points:
+            while len(hull)>=2 and ((hull[-1][0]-hull[-2][0])*(p[1]-hull[-2][1])-
+                                    (hull[-1][1]-hull[-2][1])*(p[0]-hull[-2][0]))<=0.:
+                hull.pop()
+            hull.append(p)
+        return hull
+    if len(set(points))<=1:
+        hull = np.array(points[:1]).reshape(-1, 2)
     else:
-        afrac = (area_bound(ac)+area_gap(ag, fmb, fb, ac)
-                +area_star(a, fmb, fb, ft, ac, ag, amax))/area_bound(a)
-    return afrac
+        lower = half_hull(points)
+        upper = half_hull(points[::-1])
+        hull = np.array(lower[:-1]+upper[:-1]).reshape(-1, 2)
+    return hull[:,0], hull[:,1]
+
+# get maximum distance between points with rotating calipers on the convex hull (or the maximum
+# distances of concatenated polygons with start indices offsets, from diameter_batch)
+def diameter(x, y, offsets=None):
+    if offsets is not None:
+        return diameter_batch(x, y, offsets)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    xh, yh = convex_hull(x, y)
+    nhull = len(xh)
+    xh = xh.tolist()
+    yh = yh.tolist()
+
+    # twice the area of triangle (i, inext, j) and squared distance between hull points
+    def area2(i, inext, j):
+        return abs((xh[inext]-xh[i])*(yh[j]-yh[i])-(yh[inext]-yh[i])*(xh[j]-xh[i]))
+    def dist2(i, j):
+        dx = xh[i]-xh[j]
+        dy = yh[i]-yh[j]
+        return dx*dx+dy*dy
+
+    # advance antipodal point for each hull edge
+    dmax2 = 0.
+    j = 1%nhull
+    for i in range(nhull*(nhull>=3)):
+        inext = (i+1)%nhull
+        while area2(i, inext, (j+1)%nhull)>area2(i, inext, j):
+            j = (j+1)%nhull
+        jnext = (j+1)%nhull
+        dmax2 = max(dmax2, dist2(i, j), dist2(inext, j), dist2(i, jnext), dist2(inext, jnext))
+    if nhull<3:
+        dmax2 = max([dist2(0, j) for j in range(nhull)])
+
+    # vertices that differ from hull vertices by rounding error may be farther apart, so take the
+    # maximum distance exactly for points whose farthest hull vertex is about as far as dmax
+    far2 = np.max((x[:,None]-np.array(xh))**2.+(y[:,None]-np.array(yh))**2., axis=1)
+    for i in np.nonzero(far2>=dmax2*(1.-1.e-9))[0]:
+        dmax2 = max(dmax2, np.max((x[i]-x)**2.+(y[i]-y)**2.))
+    return np.sqrt(dmax2)
+
+# get maximum distance between points of each concatenated (nonempty) polygon. the largest width of the
+# polygon along ndir directions is a lower bound, and only the pairs of points whose distance from the
+# bounding box center plus the largest distance from the center reaches that bound are compared
+def diameter_batch(x, y, offsets, ndir=8):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    offsets = np.asarray(offsets)
+    ids = offsets_to_ids(offsets)
+    start = offsets[:-1]
+
+    # largest width along the directions
+    low = np.zeros([len(start)])
+    for angle in np.arange(ndir)*np.pi/ndir:
+        proj = np.cos(angle)*x+np.sin(angle)*y
+        low = np.maximum(low, np.maximum.reduceat(proj, start)-np.minimum.reduceat(proj, start))
+
+    # points that may be an end of the maximum distance
+    xc = (np.minimum.reduceat(x, start)+np.maximum.reduceat(x, start))/2.
+    yc = (np.minimum.reduceat(y, start)+np.maximum.reduceat(y, start))/2.
+    r = np.hypot(x-xc[ids], y-yc[ids])
+    rmax = np.maximum.reduceat(r, start)
+    keep = np.flatnonzero(r+rmax[ids]>=low[ids]*(1.-1.e-9))
+
+    # compare all pairs of kept points of each polygon
+    nkeep = np.bincount(ids[keep], minlength=len(start))
+    first = np.cumsum(nkeep)-nkeep
+    npair = nkeep[ids[keep]]
+    p = np.repeat(keep, npair)
+    q = keep[np.arange(np.sum(npair))-np.repeat(np.cumsum(npair)-npair-first[ids[keep]], npair)]
+    dmax2 = np.zeros([len(start)])
+    np.maximum.at(dmax2, ids[p], (x[p]-x[q])**2.+(y[p]-y[q])**2.)
+    return np.sqrt(dmax2)
+
+# get polygon id of each vertex of concatenated polygons with start indices offsets
+def offsets_to_ids(offsets):
+    npoint = np.diff(offsets)
+    return np.repeat(np.arange(len(npoint)), npoint)
+
+# get index of next vertex (wrapping around each polygon) for concatenated polygons
+def next_vertex(offsets):
+    nonempty = np.diff(offsets)>0
+    ind = np.arange(offsets[-1])+1
+    ind[offsets[1:][nonempty]-1] = offsets[:-1][nonempty]
+    return ind
+
+# get area of polygon (or areas of concatenated polygons) with the shoelace formula
+def polygon_area(x, y, offsets=None):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if offsets is None:
+        return 0.5*np.abs(np.sum(x*np.roll(y, -1)-np.roll(x, -1)*y))
+    inext = next_vertex(offsets)
+    cross = x*y[inext]-x[inext]*y
+    area = 0.5*np.abs(np.bincount(offsets_to_ids(offsets), weights=cross,
+                                  minlength=len(offsets)-1))
+    return area
+
+# clip concatenated polygons to the half plane nx*x+ny*y <= d (Sutherland-Hodgman step), where
+# nx, ny and d are scalars or arrays with a value for each polygon
+def clip_halfplane(x, y, offsets, nx, ny, d):
+    ids = offsets_to_ids(offsets)
+    npoly = len(offsets)-1
+    nx = np.broadcast_to(nx, [npoly])[ids]
+    ny = np.broadcast_to(ny, [npoly])[ids]
+    d = np.broadcast_to(d, [npoly])[ids]
+
+    # test each vertex and its previous vertex
+    iprev = np.empty([len(x)], dtype=int)
+    iprev[next_vertex(offsets)] = np.arange(len(x))
+    dist = nx*x+ny*y-d
+    inside = dist<=0.
+    prev_inside = inside[iprev]
+
+    # each edge entering or leaving the half plane adds an intersection point before the vertex
+    cross = inside!=prev_inside
+    nout = cross.astype(int)+inside
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = dist[iprev]/(dist[iprev]-dist)
+        xint = x[iprev]+t*(x-x[iprev])
+        yint = y[iprev]+t*(y-y[iprev])
+
+    # place intersections and inside vertices
+    start = np.cumsum(nout)-nout
+    xclip = np.empty([np.sum(nout)])
+    yclip = np.empty([np.sum(nout)])
+    xclip[start[cross]] = xint[cross]
+    yclip[start[cross]] = yint[cross]
+    xclip[(start+cross)[inside]] = x[inside]
+    yclip[(start+cross)[inside]] = y[inside]
+    offsets_clip = np.concatenate(([0], np.cumsum(np.bincount(ids, weights=nout,
+                                                              minlength=npoly).astype(int))))
+    return xclip, yclip, offsets_clip
+
+# clip concatenated polygons to a convex polygon
+def clip_polygon(x, y, xclip, yclip, offsets=None):
+    if offsets is None:
+        offsets = np.array([0, len(x)])
+
+    # get edges of clipping polygon in counterclockwise order
+    xclip = np.asarray(xclip, dtype=float)
+    yclip = np.asarray(yclip, dtype=float)
+    if np.sum(xclip*np.roll(yclip, -1)-np.roll(xclip, -1)*yclip)<0.:
+        xclip = xclip[::-1]
+        yclip = yclip[::-1]
+    dx = np.roll(xclip, -1)-xclip
+    dy = np.roll(yclip, -1)-yclip
+
+    # clip to the inside (left) of each edge
+    for i in range(len(xclip)):
+        if (dx[i]!=0.)|(dy[i]!=0.):
+            x, y, offsets = clip_halfplane(x, y, offsets, dy[i], -dx[i],
+                                           dy[i]*xclip[i]-dx[i]*yclip[i])
+    return x, y, offsets
+
+# get the area fraction inside a polygon of each grid cell crossed by the polygon edges, with cells of the
+# grid spacing centered on the points (xg[i], yg[j]) of uniform grids; other cells are entirely inside or
+# outside the polygon. the polygon is clipped to each row of cells, the cells crossed by the edges of the
+# row polygon are found from the x range of each edge (leaving out edges along the row boundaries), and
+# the row polygon is clipped to each of those cells
+def cell_fractions(xpoly, ypoly, xg, yg, rtol=1.e-12):
+    x = np.asarray(xpoly, dtype=float)
+    y = np.asarray(ypoly, dtype=float)
+    nx, ny = len(xg), len(yg)
+    dx, dy = xg[1]-xg[0], yg[1]-yg[0]
+    xe, ye = xg[0]-dx/2., yg[0]-dy/2.
+
+    # clip copies of the polygon to the rows of cells it spans
+    j0 = max(int(np.floor((np.min(y)-ye)/dy)), 0)
+    j1 = min(int(np.floor((np.max(y)-ye)/dy)), ny-1)
+    rows = np.arange(j0, j1+1)
+    ylo = ye+rows*dy
+    xr, yr, offsets = np.tile(x, len(rows)), np.tile(y, len(rows)), np.arange(len(rows)+1)*len(x)
+    xr, yr, offsets = clip_halfplane(xr, yr, offsets, 0., -1., -ylo)
+    xr, yr, offsets = clip_halfplane(xr, yr, offsets, 0., 1., ylo+dy)
+
+    # columns spanned by the row polygon edges that are not on the row boundaries
+    row = offsets_to_ids(offsets)
+    inext = next_vertex(offsets)
+    tol = rtol*dy
+    yrel = yr-ylo[row]
+    onbound = ((np.abs(yrel)<=tol)&(np.abs(yr[inext]-ylo[row])<=tol))|\
+              ((np.abs(yrel-dy)<=tol)&(np.abs(yr[inext]-ylo[row]-dy)<=tol))
+    c0 = np.clip(np.floor((np.minimum(xr, xr[inext])-xe)/dx).astype(int), 0, nx-1)[~onbound]
+    c1 = np.clip(np.floor((np.maximum(xr, xr[inext])-xe)/dx).astype(int), 0, nx-1)[~onbound]
+    ncol = c1-c0+1
+    col = np.arange(np.sum(ncol))-np.repeat(np.cumsum(ncol)-ncol-c0, ncol)
+    cells = np.unique(np.repeat(row[~onbound], ncol)*nx+col)
+    row, col = cells//nx, cells%nx
+
+    # clip the row polygons to each crossed cell
+    npoint = np.diff(offsets)[row]
+    ind = np.arange(np.sum(npoint))+np.repeat(offsets[row]-(np.cumsum(npoint)-npoint), npoint)
+    offsets = np.concatenate(([0], np.cumsum(npoint)))
+    xlo = xe+col*dx
+    xc, yc, offsets = clip_halfplane(xr[ind], yr[ind], offsets, -1., 0., -xlo)
+    xc, yc, offsets = clip_halfplane(xc, yc, offsets, 1., 0., xlo+dx)
+    frac = np.minimum(polygon_area(xc, yc, offsets)/(dx*dy), 1.)
+    return col, rows[row], frac
+
+# get indices of the distinct polygon vertices in counterclockwise order, dropping vertices within
+# a rounding tolerance of the next vertex (including a closing vertex equal to the first)
+def polygon_ring(x, y, rtol=1.e-12):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    tol = rtol*max(np.ptp(x), np.ptp(y))
+    ring = np.arange(len(x))
+    repeated = np.ones([len(x)], dtype=bool)
+    while np.any(repeated)&(len(ring)>1):
+        xr, yr = x[ring], y[ring]
+        repeated = (np.abs(xr-np.roll(xr, -1))<=tol)&(np.abs(yr-np.roll(yr, -1))<=tol)
+        # drop every other vertex in runs of repeated vertices and repeat until none remain
+        repeated &= ~np.roll(repeated, 1)
+        ring = ring[~repeated]
+    if np.sum(x[ring]*np.roll(y[ring], -1)-np.roll(x[ring], -1)*y[ring])<0.:
+        ring = ring[::-1]
+    return ring
+
+# triangulate simple polygon by ear clipping, returning the (ntri,3) counterclockwise vertex indices
+# of the triangles. each pass clips a set of ears that are not adjacent; vertices on straight runs of
+# edges are taken out of the polygon as they appear and added back at the end by splitting the
+# triangles on those edges. vertices where the polygon touches itself (within a rounding tolerance) do
+# not block ears
+def triangulate(x, y, rtol=1.e-12):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    ring = polygon_ring(x, y, rtol)
+    xr = x[ring]
+    yr = y[ring]
+    nring = len(ring)
+    tol = rtol*max(np.ptp(x), np.ptp(y))
+    atol = tol*max(np.ptp(x), np.ptp(y))
+    if nring<3 or polygon_area(xr, yr)<=atol:
+        return np.zeros([0,3], dtype=int)
+
+    # linked list of remaining vertices
+    iprev = np.roll(np.arange(nring), 1)
+    inext = np.roll(np.arange(nring), -1)
+    active = np.ones([nring], dtype=bool)
+    convex = np.zeros([nring], dtype=bool)
+    ear = np.zeros([nring], dtype=bool)
+
+    def cross(v):
+        a = iprev[v]
+        c = inext[v]
+        return (xr[v]-xr[a])*(yr[c]-yr[v])-(yr[v]-yr[a])*(xr[c]-xr[v])
+
+    # convex vertices are ears if no remaining non-convex vertex is in or on their triangle (testing
+    # the vertices in the x range of each triangle)
+    def is_ear(v):
+        other = np.nonzero(active&~convex)[0]
+        other = other[np.argsort(xr[other])]
+        pa, pb, pc = iprev[v], v, inext[v]
+        xmin = np.minimum(np.minimum(xr[pa], xr[pb]), xr[pc])-tol
+        xmax = np.maximum(np.maximum(xr[pa], xr[pb]), xr[pc])+tol
+        start = np.searchsorted(xr[other], xmin, 'left')
+        npair = np.searchsorted(xr[other], xmax, 'right')-start
+        tri = np.repeat(np.arange(len(v)), npair)
+        p = other[np.arange(np.sum(npair))-np.repeat(np.cumsum(npair)-npair-start, npair)]
+        pa, pb, pc = pa[tri], pb[tri], pc[tri]
+        def left(p0, p1):
+            return (xr[p1]-xr[p0])*(yr[p]-yr[p0])-(yr[p1]-yr[p0])*(xr[p]-xr[p0])>=-atol
+        def touches(p0):
+            return (np.abs(xr[p]-xr[p0])<=tol)&(np.abs(yr[p]-yr[p0])<=tol)
+        inside = left(pa, pb)&left(pb, pc)&left(pc, pa)&~touches(pa)&~touches(pb)&~touches(pc)
+        return np.bincount(tri[inside], minlength=len(v))==0
+
+    # take out vertices between collinear edges, returning the vertices with new neighbors
+    def straight(v):
+        dx0, dy0 = xr[v]-xr[iprev[v]], yr[v]-yr[iprev[v]]
+        dx1, dy1 = xr[inext[v]]-xr[v], yr[inext[v]]-yr[v]
+        return (np.abs(dx0*dy1-dy0*dx1)<=atol)&(dx0*dx1+dy0*dy1>0.)
+    removed = []
+    xl = xr.tolist()
+    yl = yr.tolist()
+    def remove_straight(v):
+        nonlocal nleft
+        queue = v[straight(v)].tolist()
+        changed = []
+        while len(queue)>0 and nleft>3:
+            b = queue.pop()
+            a = int(iprev[b])
+            c = int(inext[b])
+            dx0, dy0 = xl[b]-xl[a], yl[b]-yl[a]
+            dx1, dy1 = xl[c]-xl[b], yl[c]-yl[b]
+            if active[b] and abs(dx0*dy1-dy0*dx1)<=atol and dx0*dx1+dy0*dy1>0.:
+                removed.append((a, b, c))
+                inext[a] = c
+                iprev[c] = a
+                active[b] = False
+                nleft -= 1
+                queue.extend([a, c])
+                changed.extend([a, c])
+        changed = np.unique(np.concatenate((v, np.array(changed, dtype=int))))
+        return changed[active[changed]]
+
+    nleft = nring
+    v = remove_straight(np.arange(nring))
+    tris = []
+    while True:
+        # update convexity and ears of vertices with new neighbors, and retest all convex vertices if
+        # non-convex vertices that might block them have gone
+        unblocked = np.any(~convex[v])
+        convex[v] = cross(v)>atol
+        ear[v] = False
+        if unblocked:
+            v = np.nonzero(active&convex&~ear)[0]
+        else:
+            v = v[convex[v]]
+        ear[v] = is_ear(v)
+        if nleft<=3:
+            break
+
+        # without ears (only for degenerate polygons), clip the most convex vertex
+        if not np.any(ear):
+            v = np.nonzero(active)[0]
+            ear[v[np.argmax(cross(v))]] = True
+
+        # clip the first ear of each run of adjacent ears
+        v = np.nonzero(ear)[0]
+        clip = v[~ear[iprev[v]]]
+        if len(clip)==0:
+            clip = v[:1]
+        clip = clip[:nleft-3]
+        a = iprev[clip]
+        c = inext[clip]
+        tris.extend(np.stack((a, clip, c), axis=1).tolist())
+        inext[a] = c
+        iprev[c] = a
+        active[clip] = False
+        ear[clip] = False
+        convex[clip] = False
+        nleft -= len(clip)
+
+        v = remove_straight(np.unique(np.concatenate((a, c))))
+
+    v = np.nonzero(active)[0]
+    if len(v)==3:
+        tris.append([v[0], inext[v[0]], inext[inext[v[0]]]])
+
+    # add straight vertices back in reverse order, splitting the triangle on their edge
+    edges = {}
+    for t, (p, q, r) in enumerate(tris):
+        edges[(p, q)] = edges[(q, r)] = edges[(r, p)] = t
+    for a, b, c in removed[::-1]:
+        t = edges.pop((a, c))
+        r = sum(tris[t])-a-c
+        tris[t] = [a, b, r]
+        tris.append([b, c, r])
+        edges[(a, b)] = edges[(b, r)] = t
+        edges[(b, c)] = edges[(c, r)] = edges[(r, b)] = len(tris)-1
+    return ring[np.array(tris, dtype=int).reshape(-1, 3)]
+
+# calculate area fraction in hexagonal region within dda polygon; polygons may be concatenated with
+# start indices offsets (or given as lists of arrays) to get the area fraction of each. the 'exact'
+# method clips the polygons to the hexagon and the 'random' method tests numtrials random points
+def afrac_dda_subregion(xhex, yhex, xdda_poly, ydda_poly, offsets=None, method='exact',
+                        numtrials=20000, seed=None):
+    batch = (offsets is not None)|isinstance(xdda_poly, (list, tuple))
+    if isinstance(xdda_poly, (list, tuple)):
+        offsets = np.concatenate(([0], np.cumsum([len(xp) for xp in xdda_poly])))
+        xdda_poly = np.concatenate(xdda_poly)
+        ydda_poly = np.concatenate(ydda_poly)
+    elif offsets is None:
+        offsets = np.array([0, len(xdda_poly)])
+    xdda_poly = np.asarray(xdda_poly, dtype=float)
+    ydda_poly = np.asarray(ydda_poly, dtype=float)
+
+    if method=='exact':
+        xsub, ysub, offsets_sub = clip_polygon(xdda_poly, ydda_poly, xhex, yhex, offsets)
+        frac = polygon_area(xsub, ysub, offsets_sub)/polygon_area(xhex, yhex)
+    elif method=='random':
+        rng = np.random.default_rng(seed)
+        frac = np.array([afrac_dda_random(xhex, yhex, xdda_poly[offsets[i]:offsets[i+1]],
+                                          ydda_poly[offsets[i]:offsets[i+1]], numtrials, rng)
+                         for i in range(len(offsets)-1)])
+    else:
+        raise ValueError(f"unknown area fraction method '{method}'; use 'exact' or 'random'.")
+
+    if not batch:
+        frac = float(frac[0])
+    return frac
 
 # calculate area fraction in hexagonal region within dda polygon using random points
-def afrac_dda_subregion(xhex, yhex, xdda_poly, ydda_poly):
+def afrac_dda_random(xhex, yhex, xdda_poly, ydda_poly, numtrials, rng):
     # probability method for estimating area fraction
-    numtrials = 20000
     a = np.max(xhex)
-    rx = 2.*a*(np.random.rand(numtrials)-0.5)
-    ry = 2.*a*(np.random.rand(numtrials)-0.5)
+    rx = 2.*a*(rng.random(numtrials)-0.5)
+    ry = 2.*a*(rng.random(numtrials)-0.5)
 
     # determine random points in hexagon
     inhex = in_polygon(xhex, yhex, rx, ry)
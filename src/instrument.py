@@ -0,0 +1,176 @@
+import time
+import functools
+import tracemalloc
+import contextvars
+
+# recorder of the current context (None when instrumentation is off)
+_recorder = contextvars.ContextVar('crystal_dda_recorder', default=None)
+
+class Recorder:
+    '''
+    Record the wall time, point count and (optionally) peak memory allocation of each stage of the
+    crystal_dda calls made in a `with Recorder():` block.
+
+    Parameters
+    ----------
+    callback : callable, optional
+        A function called with the record dict of each stage as the stage finishes.
+    memory : bool, optional
+        If True, trace memory allocations with `tracemalloc` to get the peak allocation of each stage
+        (this slows down the traced code).
+
+    Returns
+    -------
+    Recorder
+        The returned `Recorder` object. Its `records` list holds a dict for each finished stage with the
+        `stage` name, wall `time` in seconds, `npoint` count and `peak_alloc` in bytes (None if memory is
+        not traced).
+    '''
+    def __init__(self, callback=None, memory=False):
+        self.callback = callback
+        self.memory = memory
+        self.records = []
+        self._stack = []
+        self._token = None
+        self._tracing = False
+
+    def __enter__(self):
+        self._token = _recorder.set(self)
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        return self
+
+    def __exit__(self, *exc):
+        _recorder.reset(self._token)
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        return False
+
+    def summary(self):
+        '''
+        Get the totals of the records for each stage.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        totals : dict
+            The `count` of records, total `time`, total `npoint` and maximum `peak_alloc` for each stage name,
+            in the order the stages first finished.
+        '''
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'count':0, 'time':0., 'npoint':0,
+                                                        'peak_alloc':None})
+            total['count'] += 1
+            total['time'] += record['time']
+            total['npoint'] += record['npoint']
+            if record['peak_alloc'] is not None:
+                total['peak_alloc'] = max(total['peak_alloc'] or 0, record['peak_alloc'])
+        return totals
+
+class _Stage:
+    # timed stage of a recorder
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.npoint = 0
+
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            # keep peak of enclosing stage before resetting the peak for this stage
+            current, peak = tracemalloc.get_traced_memory()
+            if len(self.recorder._stack)>0:
+                outer = self.recorder._stack[-1]
+                outer.peak = max(outer.peak, peak)
+            tracemalloc.reset_peak()
+            self.base = current
+            self.peak = current
+        self.recorder._stack.append(self)
+        self.time0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter()-self.time0
+        self.recorder._stack.pop()
+        peak_alloc = None
+        if tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], self.peak)
+            peak_alloc = peak-self.base
+            if len(self.recorder._stack)>0:
+                outer = self.recorder._stack[-1]
+                outer.peak = max(outer.peak, peak)
+        record = {'stage':self.name, 'time':elapsed, 'npoint':int(self.npoint),
+                  'peak_alloc':peak_alloc}
+        self.recorder.records.append(record)
+        if self.recorder.callback is not None:
+            self.recorder.callback(record)
+        return False
+
+class _NullStage:
+    # stage used when instrumentation is off
+    npoint = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+_null_stage = _NullStage()
+
+def stage(name):
+    '''
+    Get a context manager that records a stage with the current `Recorder` (doing nothing if there is none).
+    Set the `npoint` attribute of the returned object to record the stage point count.
+
+    Parameters
+    ----------
+    name : str
+        The stage name.
+
+    Returns
+    -------
+    stage : context manager
+        The stage to use in a `with` statement.
+    '''
+    recorder = _recorder.get()
+    if recorder is None:
+        return _null_stage
+    return _Stage(recorder, name)
+
+def instrumented(name, npoint=None):
+    '''
+    Decorate a function to record each call as a stage with the current `Recorder`.
+
+    Parameters
+    ----------
+    name : str
+        The stage name.
+    npoint : callable, optional
+        A function giving the stage point count from the returned value.
+
+    Returns
+    -------
+    decorator : callable
+        The function decorator.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder.get() is None:
+                return func(*args, **kwargs)
+            with stage(name) as st:
+                result = func(*args, **kwargs)
+                if npoint is not None:
+                    st.npoint = npoint(result)
+            return result
+        return wrapper
+    return decorator
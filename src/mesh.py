@@ -0,0 +1,136 @@
+import numpy as np
+from crystal_dda.geometry import polygon_ring, triangulate
+from crystal_dda.writers import open_text, format_rows
+
+def extrude(x, y, c):
+    '''
+    Create a closed triangle mesh of a polygon extruded between z = -c and z = c.
+
+    Parameters
+    ----------
+    x : ndarray
+        The set of x points defining the polygon.
+    y : ndarray
+        The set of y points defining the polygon.
+    c : float
+        The half thickness of the extruded polygon.
+
+    Returns
+    -------
+    points : ndarray
+        The (2N,3) array of mesh points, with the N distinct polygon points at z = c followed by the
+        same points at z = -c.
+    faces : ndarray
+        The (M,3) array of point indices of the mesh triangles, ordered counterclockwise when viewed
+        from outside the mesh.
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    ring = polygon_ring(x, y)
+    npoint = len(ring)
+
+    # map triangles of the polygon to the distinct polygon points
+    pos = np.zeros([len(x)], dtype=int)
+    pos[ring] = np.arange(npoint)
+    tris = pos[triangulate(x, y)]
+
+    points = np.empty([2*npoint,3])
+    points[:,0] = np.tile(x[ring], 2)
+    points[:,1] = np.tile(y[ring], 2)
+    points[:npoint,2] = c
+    points[npoint:,2] = -c
+
+    # top and bottom caps and two triangles for each side face
+    k0 = np.arange(npoint)
+    k1 = np.roll(k0, -1)
+    side = np.concatenate((np.stack((k0+npoint, k1+npoint, k1), axis=1),
+                           np.stack((k0+npoint, k1, k0), axis=1)))
+    faces = np.concatenate((tris, tris[:,::-1]+npoint, side))
+    return points, faces
+
+def face_normals(points, faces):
+    '''
+    Get the unit normal vectors of mesh triangles.
+
+    Parameters
+    ----------
+    points : ndarray
+        The (N,3) array of mesh points.
+    faces : ndarray
+        The (M,3) array of point indices of the mesh triangles.
+
+    Returns
+    -------
+    normals : ndarray
+        The (M,3) array of unit normals (by the right-hand rule over each triangle's points).
+    '''
+    p0, p1, p2 = points[faces[:,0]], points[faces[:,1]], points[faces[:,2]]
+    normals = np.cross(p1-p0, p2-p0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normals = normals/np.linalg.norm(normals, axis=1)[:,None]
+    return np.nan_to_num(normals)
+
+def write_stl(file_name, points, faces, binary=True, name='crystal'):
+    '''
+    Write a triangle mesh to an STL file.
+
+    Parameters
+    ----------
+    file_name : str
+        The output file name.
+    points : ndarray
+        The (N,3) array of mesh points.
+    faces : ndarray
+        The (M,3) array of point indices of the mesh triangles.
+    binary : bool, optional
+        If True, write a binary STL file, and otherwise an ASCII STL file.
+    name : str, optional
+        The solid name of ASCII files.
+
+    Returns
+    -------
+    None
+    '''
+    normals = face_normals(points, faces)
+    corners = points[faces]
+    if binary:
+        facets = np.zeros([len(faces)], dtype=[('normal', '<f4', 3), ('corners', '<f4', (3,3)),
+                                                ('attribute', '<u2')])
+        facets['normal'] = normals
+        facets['corners'] = corners
+        with open(file_name, 'wb') as f:
+            f.write(name.encode('ascii')[:80].ljust(80, b' '))
+            f.write(np.array([len(faces)], dtype='<u4').tobytes())
+            f.write(facets.tobytes())
+    else:
+        facet = ' facet normal %e %e %e\n  outer loop\n'+\
+                '   vertex %e %e %e\n'*3+\
+                '  endloop\n endfacet\n'
+        values = np.concatenate((normals, corners.reshape(-1, 9)), axis=1)
+        with open_text(file_name) as f:
+            f.write(f'solid {name}\n')
+            f.write((facet*len(faces)) % tuple(values.ravel().tolist()))
+            f.write(f'endsolid {name}\n')
+    return
+
+def write_obj(file_name, points, faces):
+    '''
+    Write a triangle mesh to a Wavefront OBJ file.
+
+    Parameters
+    ----------
+    file_name : str
+        The output file name (gzip compressed if it ends in '.gz').
+    points : ndarray
+        The (N,3) array of mesh points.
+    faces : ndarray
+        The (M,3) array of point indices of the mesh triangles.
+
+    Returns
+    -------
+    None
+    '''
+    with open_text(file_name) as f:
+        f.write(format_rows(('v %.9g','%.9g','%.9g'), points.T))
+        f.write(format_rows(('f %d','%d','%d'), (faces+1).T))
+    return
@@ -0,0 +1,231 @@
+import json
+import numpy as np
+from crystal_dda.writers import write_extruded_chunks, write_columns
+from crystal_dda.instrument import stage
+
+# file signature and format version of packed dipole files
+magic = b'CDDAPACK'
+version = 1
+
+def _index_map(values):
+    # integer dipole indices as written to text files (the '%d' format truncates)
+    return np.trunc(values).astype(np.int64)
+
+def write_packed(file_name, dipoles, shape=None, params=None, c=None, slab_size=256):
+    '''
+    Write a dipole set to a packed binary file.
+
+    The file has the signature, the length of a JSON header, the header (with the grid shape, box size,
+    dipole spacing and shape parameters), the integer x and y dipole index of each grid column and row, and
+    the occupancy bits of the grid from `np.packbits`. Dipole sets that fill all layers of their footprint
+    store the 2d footprint (packed along y), and others store the 3d grid (packed along z).
+
+    Parameters
+    ----------
+    file_name : str
+        The output file name.
+    dipoles : DipoleSet
+        The dipole set.
+    shape : str, optional
+        The name of the crystal shape.
+    params : dict, optional
+        The crystal shape parameters.
+    c : float, optional
+        The crystal basal-length dimension.
+    slab_size : int, optional
+        The number of grid columns packed at a time for 3d grids.
+
+    Returns
+    -------
+    None
+    '''
+    if dipoles.nfoot==0:
+        raise ValueError('packed files require a dipole set with dipoles.')
+
+    # grid of the occupied columns and rows
+    i0, i1 = np.min(dipoles.i), np.max(dipoles.i)
+    j0, j1 = np.min(dipoles.j), np.max(dipoles.j)
+    xmap = _index_map(dipoles.xg[i0:i1+1]/dipoles.dip_len-dipoles.xg[i0]/dipoles.dip_len+1)
+    ymap = _index_map(dipoles.xg[j0:j1+1]/dipoles.dip_len-dipoles.xg[j0]/dipoles.dip_len+1)
+    nx, ny, nz = i1-i0+1, j1-j0+1, dipoles.ndipz
+    mode = 'footprint' if dipoles.kmin is None else 'grid'
+
+    header = {'version':version, 'mode':mode, 'shape':[int(nx), int(ny), int(nz)],
+              'box':dipoles.bbox[:,1].tolist(), 'dip_len':float(dipoles.dip_len), 'ndip':int(dipoles.ndip),
+              'crystal':shape, 'params':params, 'c':c}
+    text = json.dumps(header).encode('utf-8')
+
+    with stage('write_packed') as st, open(file_name, 'wb') as f:
+        f.write(magic)
+        f.write(np.array([len(text)], dtype='<u8').tobytes())
+        f.write(text)
+        f.write(xmap.astype('<i8').tobytes())
+        f.write(ymap.astype('<i8').tobytes())
+
+        i = dipoles.i.astype(np.int64)-i0
+        j = dipoles.j.astype(np.int64)-j0
+        if mode=='footprint':
+            occ = np.zeros([nx, ny], dtype=bool)
+            occ[i, j] = True
+            f.write(np.packbits(occ, axis=1).tobytes())
+        else:
+            # fill slabs of grid columns from the layer runs, sorted by column
+            order = np.argsort(i, kind='stable')
+            i, j = i[order], j[order]
+            kmin, kmax = dipoles.kmin[order], dipoles.kmax[order]
+            bounds = np.searchsorted(i, np.arange(0, nx+slab_size, slab_size))
+            for s, (r0, r1) in enumerate(zip(bounds[:-1], bounds[1:])):
+                nslab = min(slab_size, nx-s*slab_size)
+                occ = np.zeros([nslab, ny, nz], dtype=bool)
+                nrun = np.maximum(kmax[r0:r1].astype(np.int64)-kmin[r0:r1]+1, 0)
+                run = np.repeat(np.arange(r0, r1), nrun)
+                k = np.arange(np.sum(nrun))-np.repeat(np.cumsum(nrun)-nrun-kmin[r0:r1], nrun)
+                occ[i[run]-s*slab_size, j[run], k] = True
+                f.write(np.packbits(occ, axis=2).tobytes())
+        st.npoint = dipoles.ndip
+    return
+
+class PackedDipoles:
+    '''
+    Class to read the dipoles of a packed binary file (from `write_packed`), with the occupancy bits
+    memory mapped so that dipole indices are only unpacked when they are used.
+
+    Parameters
+    ----------
+    file_name : str
+        The packed dipole file name.
+
+    Returns
+    -------
+    PackedDipoles
+        The returned `PackedDipoles` object, with the file `header` dict.
+    '''
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, 'rb') as f:
+            if f.read(len(magic))!=magic:
+                raise ValueError(f'{file_name} is not a packed dipole file.')
+            nheader = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+            self.header = json.loads(f.read(nheader).decode('utf-8'))
+        if self.header['version']>version:
+            raise ValueError(f'{file_name} has packed file version {self.header["version"]}; '
+                             f'version {version} or lower is supported.')
+
+        nx, ny, nz = self.header['shape']
+        offset = len(magic)+8+nheader
+        self.xmap = np.memmap(file_name, dtype='<i8', mode='r', offset=offset, shape=(nx,))
+        self.ymap = np.memmap(file_name, dtype='<i8', mode='r', offset=offset+8*nx, shape=(ny,))
+        if self.mode=='footprint':
+            bits_shape = (nx, (ny+7)//8)
+        else:
+            bits_shape = (nx, ny, (nz+7)//8)
+        self.bits = np.memmap(file_name, dtype=np.uint8, mode='r', offset=offset+8*(nx+ny), shape=bits_shape)
+
+    @property
+    def mode(self):
+        '''
+        The stored occupancy, 'footprint' (2d footprint extruded over all layers) or 'grid' (3d grid).
+        '''
+        return self.header['mode']
+
+    @property
+    def ndip(self):
+        '''
+        The number of dipoles.
+        '''
+        return self.header['ndip']
+
+    @property
+    def dip_len(self):
+        '''
+        The dipole spacing.
+        '''
+        return self.header['dip_len']
+
+    def chunks(self, slab_size=256):
+        '''
+        Iterate over chunks of the 3d dipole indices, unpacking `slab_size` grid columns at a time, in the
+        order of the `Crystal.write_dipoles` file rows.
+
+        Parameters
+        ----------
+        slab_size : int, optional
+            The number of grid columns unpacked at a time.
+
+        Yields
+        ------
+        ix : ndarray
+            The x dipole indices of the chunk.
+        iy : ndarray
+            The y dipole indices of the chunk.
+        iz : ndarray
+            The z dipole indices of the chunk.
+        '''
+        nz = self.header['shape'][2]
+        for ix, iy, iz in self._slabs(slab_size):
+            if iz is None:
+                yield np.repeat(ix, nz), np.repeat(iy, nz), np.tile(np.arange(nz)+1, len(ix))
+            else:
+                yield ix, iy, iz
+
+    def arrays(self):
+        '''
+        Build the full 3d dipole index arrays.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        ix : ndarray
+            The x dipole indices.
+        iy : ndarray
+            The y dipole indices.
+        iz : ndarray
+            The z dipole indices.
+        '''
+        chunks = list(self.chunks())
+        return tuple([np.concatenate([chunk[k] for chunk in chunks]+[np.array([], dtype=np.int64)])
+                      for k in range(3)])
+
+    def write_dipoles(self, file_name, slab_size=256):
+        '''
+        Write the dipole indices to an ADDA 'read' shape file, streaming the rows from the packed bits. The
+        file is the same as that of `Crystal.write_dipoles` for the packed dipoles.
+
+        Parameters
+        ----------
+        file_name : str
+            The output file name (gzip compressed if it ends in '.gz').
+        slab_size : int, optional
+            The number of grid columns unpacked at a time.
+
+        Returns
+        -------
+        None
+        '''
+        dx, dy, dz = self.header['box']
+        header = "#generated by crystal-dda\n"+\
+                 "#shape: 'read'\n"+\
+                f"#box size: {dx:.0f}x{dy:.0f}x{dz:.0f}\n"
+        with stage('write') as st:
+            if self.mode=='footprint':
+                footprint = ((ix, iy) for ix, iy, iz in self._slabs(slab_size))
+                nz = self.header['shape'][2]
+                write_extruded_chunks(file_name, footprint, np.arange(nz)+1, ('%d','%d','%d'), header=header)
+            else:
+                write_columns(file_name, self.chunks(slab_size), ('%d','%d','%d'), header=header)
+            st.npoint = self.ndip
+        return
+
+    def _slabs(self, slab_size):
+        # unpacked footprint (or 3d grid) indices of slabs of grid columns
+        nx, ny, nz = self.header['shape']
+        for s0 in range(0, nx, slab_size):
+            if self.mode=='footprint':
+                i, j = np.nonzero(np.unpackbits(self.bits[s0:s0+slab_size], axis=1, count=ny))
+                yield self.xmap[i+s0], self.ymap[j], None
+            else:
+                i, j, k = np.nonzero(np.unpackbits(self.bits[s0:s0+slab_size], axis=2, count=nz))
+                yield self.xmap[i+s0], self.ymap[j], k+1
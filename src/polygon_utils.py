@@ -1,6 +1,6 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import crystal_dda.geometry as geom
+from crystal_dda.instrument import instrumented
 
 def hexagon(a):
     '''
@@ -18,10 +18,34 @@ def hexagon(a):
     y : ndarray
         The y coordinates of the hexagon.
     '''
-    xp = np.array([a, a/2., -a/2., -a, -a/2., a/2., a])
-    yp = np.array([0., a*np.sqrt(3.)/2., a*np.sqrt(3.)/2., 0.,
-                  -a*np.sqrt(3.)/2., -a*np.sqrt(3.)/2., 0.])
-    return xp, yp
+    x, y, offsets = hexagon_batch(a)
+    return x, y
+
+@instrumented('hexagon', npoint=lambda xy:len(xy[0]))
+def hexagon_batch(a):
+    '''
+    Create closed polygons for a batch of hexagons, concatenated with the vertices of polygon k given by
+    x[offsets[k]:offsets[k+1]] and y[offsets[k]:offsets[k+1]].
+
+    Parameters
+    ----------
+    a : array_like
+        The hexagon side lengths.
+
+    Returns
+    -------
+    x : ndarray
+        The x coordinates of the hexagons.
+    y : ndarray
+        The y coordinates of the hexagons.
+    offsets : ndarray
+        The (npoly+1) array of polygon start indices.
+    '''
+    a = np.ravel(np.asarray(a, dtype=float))
+    xp = np.stack([a, a/2., -a/2., -a, -a/2., a/2., a], axis=1)
+    yp = np.stack([np.zeros_like(a), a*np.sqrt(3.)/2., a*np.sqrt(3.)/2., np.zeros_like(a),
+                  -a*np.sqrt(3.)/2., -a*np.sqrt(3.)/2., np.zeros_like(a)], axis=1)
+    return xp.ravel(), yp.ravel(), np.arange(len(a)+1)*7
 
 def stellar_triangle(fbranch, p1, p2):
     '''
@@ -75,32 +99,57 @@ def stellar(fbranch, a):
     y : ndarray
         The y coordinates of the stellar crystal polygon.
     '''
-    # define hexagonal polygon
-    x, y = hexagon(a)
-    numhex = len(x)
-    numstellar = 25
-    xst = np.empty([numstellar])
-    yst = np.empty([numstellar])
-    xst[0] = x[0]
-    yst[0] = y[0]
-    stind = 0
-
-    # loop through segments of hexagon and insert points for stellar triangles
-    for i in range(numhex-1):
-        p1 = np.array([x[i], y[i]])
-        p2 = np.array([x[i+1], y[i+1]])
-        s1, s2, s3 = stellar_triangle(fbranch, p1, p2)
-        xst[stind+1] = s1[0]
-        xst[stind+2] = s3[0]
-        xst[stind+3] = s2[0]
-        xst[stind+4] = p2[0]
-
-        yst[stind+1] = s1[1]
-        yst[stind+2] = s3[1]
-        yst[stind+3] = s2[1]
-        yst[stind+4] = p2[1]
-        stind = stind+4
-    return xst, yst
+    x, y, offsets = stellar_batch(fbranch, a)
+    return x, y
+
+@instrumented('stellar', npoint=lambda xy:len(xy[0]))
+def stellar_batch(fbranch, a):
+    '''
+    Create closed polygons for a batch of stellar crystals, concatenated with the vertices of polygon k
+    given by x[offsets[k]:offsets[k+1]] and y[offsets[k]:offsets[k+1]].
+
+    The stellar triangle points of all hexagon sides are found at once (with the arithmetic of
+    `stellar_triangle`), and the parameters are broadcast against each other.
+
+    Parameters
+    ----------
+    fbranch : array_like
+        The fractions of the stellar crystal branch widths relative to the hexagon side lengths.
+    a : array_like
+        The parent hexagon side lengths.
+
+    Returns
+    -------
+    x : ndarray
+        The x coordinates of the stellar crystal polygons.
+    y : ndarray
+        The y coordinates of the stellar crystal polygons.
+    offsets : ndarray
+        The (npoly+1) array of polygon start indices.
+    '''
+    fbranch, a = [np.ravel(p) for p in np.broadcast_arrays(fbranch, a)]
+    fbranch = np.asarray(fbranch, dtype=float)[:,None]
+    x, y, offsets = hexagon_batch(a)
+    x = x.reshape(-1, 7)
+    y = y.reshape(-1, 7)
+
+    # normal and tangential directions of each hexagon side p1-p2
+    p1x, p1y, p2x, p2y = x[:,:-1], y[:,:-1], x[:,1:], y[:,1:]
+    p12x, p12y = p2x-p1x, p2y-p1y
+    segmag = np.sqrt(p12x**2.+p12y**2.)
+    nx, ny = -p12y/segmag, p12x/segmag
+    tx, ty = p12x/segmag, p12y/segmag
+
+    # stellar triangle points inserted before the end of each side
+    s1x = p1x+tx*fbranch*segmag/2.
+    s1y = p1y+ty*fbranch*segmag/2.
+    s2x = (p2x+p1x)/2.+tx*(1.-fbranch)*segmag/2.
+    s2y = (p2y+p1y)/2.+ty*(1.-fbranch)*segmag/2.
+    s3x = s2x+segmag*(1.-fbranch)*(nx*np.sqrt(3.)/2.-tx/2.)
+    s3y = s2y+segmag*(1.-fbranch)*(ny*np.sqrt(3.)/2.-ty/2.)
+    xst = np.concatenate((x[:,:1], np.stack([s1x, s3x, s2x, p2x], axis=2).reshape(-1, 24)), axis=1)
+    yst = np.concatenate((y[:,:1], np.stack([s1y, s3y, s2y, p2y], axis=2).reshape(-1, 24)), axis=1)
+    return xst.ravel(), yst.ravel(), np.arange(len(xst)+1)*25
 
 # create branched planar crystal
 def branched_planar(a, amax, ac, ft, fb, fg, nsb):
@@ -131,13 +180,55 @@ def branched_planar(a, amax, ac, ft, fb, fg, nsb):
     y : ndarray
         The y coordinates of the branched planar crystal polygon.
     '''
+    x, y, offsets = branched_planar_batch(a, amax, ac, ft, fb, fg, nsb)
+    return x, y
+
+@instrumented('branched_planar', npoint=lambda xy:len(xy[0]))
+def branched_planar_batch(a, amax, ac, ft, fb, fg, nsb):
+    '''
+    Create closed polygons for a batch of branched planar crystals.
+
+    The parameters are broadcast against each other, and the polygons are returned concatenated, with the
+    vertices of polygon k given by x[offsets[k]:offsets[k+1]] and y[offsets[k]:offsets[k+1]].
+    
+    Parameters
+    ----------
+    a : array_like
+        The crystal planar axis lengths.
+    amax : array_like
+        The maximum sizes that characterize the crystal geometry.
+    ac : array_like
+        The hexagonal core axis lengths.
+    ft : array_like
+        The main branch tip width fractions.
+    fb : array_like
+        The branch fractional coverages.
+    fg : array_like
+        The gap fractions of the crystals.
+    nsb : array_like
+        The numbers of subbranches of the crystals.
+        
+    Returns
+    -------
+    x : ndarray
+        The x coordinates of the branched planar crystal polygons.
+    y : ndarray
+        The y coordinates of the branched planar crystal polygons.
+    offsets : ndarray
+        The (npoly+1) array of polygon start indices.
+    '''
+    a, amax, ac, ft, fb, fg, nsb = np.broadcast_arrays(*[np.atleast_1d(p) for p in
+                                                         [a, amax, ac, ft, fb, fg, nsb]])
+    a, amax, ac, ft, fb, fg = [np.asarray(p, dtype=float) for p in [a, amax, ac, ft, fb, fg]]
+    nsb = nsb.astype(int)
+    npoly = len(a)
+
     # calculate shape quantities
     wsb = fb*(amax-ac)/nsb
     ssb = wsb*(1.-fb)/fb
 
     ag = fg*amax+(1.-fg)*ac
-    wmb = min(max(wsb/np.sqrt(3.), ac/2.), min(wsb/np.sqrt(3.), ac/2.))
-    wt = 1./2.*ft*amax
+    wmb = np.minimum(np.maximum(wsb/np.sqrt(3.), ac/2.), np.minimum(wsb/np.sqrt(3.), ac/2.))
 
     #----------------------------------------------------
     # p1 - midpoint of ice core edge
@@ -145,7 +236,7 @@ def branched_planar(a, amax, ac, ft, fb, fg, nsb):
     # p3 - intersection of main branch and tip
     # p4 - upper corner at amax
     #----------------------------------------------------
-    p1x = 0.
+    p1x = np.zeros([npoly])
     p1y = np.sqrt(3.)/2.*ac
     p2x = ac/2.-wmb
     p2y = p1y
@@ -154,84 +245,103 @@ def branched_planar(a, amax, ac, ft, fb, fg, nsb):
     p4x = amax/2.
     p4y = p3y
 
-    # create xcoor and ycoor of half sector
-    xcoor = np.array([p1x, p2x, p3x, p4x])
-    ycoor = np.array([p1y, p2y, p3y, p4y])
-
     mbound, bbound = geom.points2eqn(0., np.sqrt(3.)/2.*ag,
                                      amax/2.*(1.-ft), np.sqrt(3.)/2.*amax)
 
-    # get subbranch points
-    for i in range(nsb):
-        # points on main branch
-        sb1x = p2x+(i+0.25)*(wsb+ssb)/2.
-        sb1y = p2y+(i+0.25)*(wsb+ssb)*np.sqrt(3.)/2.
-        sb4x = sb1x+wsb/2.
-        sb4y = sb1y+wsb*np.sqrt(3.)/2.
-
-        # get equation of line defining each sub-branch edge (60 degrees from main branch)
-        m_sb = -np.sqrt(3.)
-        b_sb_low = -m_sb*sb1x+sb1y
-        b_sb_high = -m_sb*sb4x+sb4y
-
-        # points off main branch
-        sb2x, sb2y = geom.intersection(mbound, bbound, m_sb, b_sb_low)
-        sb3x, sb3y = geom.intersection(mbound, bbound, m_sb, b_sb_high)
-
-        # replace with point on x=0 if below bounding line from tip to ag
-        if sb2y>b_sb_low:
-            sb2y = b_sb_low
-            sb2x = 0.
-        if sb3y>b_sb_high:
-            sb3y = b_sb_high
-            sb3x = 0.
-
-        # insert sub-branch into coordinate arrays
-        sbxc = np.array([sb1x, sb2x, sb3x, sb4x])
-        sbyc = np.array([sb1y, sb2y, sb3y, sb4y])
-
-        xcoor = np.insert(xcoor, 2+i*4, sbxc)
-        ycoor = np.insert(ycoor, 2+i*4, sbyc)
-    
+    # get subbranch points for all crystals at once
+    poly_sb = np.repeat(np.arange(npoly), nsb)
+    isb = np.arange(len(poly_sb))-np.repeat(np.cumsum(nsb)-nsb, nsb)
+    p2x_sb = p2x[poly_sb]
+    p2y_sb = p2y[poly_sb]
+    wsb_sb = wsb[poly_sb]
+    ssb_sb = ssb[poly_sb]
+
+    # points on main branch
+    sb1x = p2x_sb+(isb+0.25)*(wsb_sb+ssb_sb)/2.
+    sb1y = p2y_sb+(isb+0.25)*(wsb_sb+ssb_sb)*np.sqrt(3.)/2.
+    sb4x = sb1x+wsb_sb/2.
+    sb4y = sb1y+wsb_sb*np.sqrt(3.)/2.
+
+    # get equation of line defining each sub-branch edge (60 degrees from main branch)
+    m_sb = -np.sqrt(3.)
+    b_sb_low = -m_sb*sb1x+sb1y
+    b_sb_high = -m_sb*sb4x+sb4y
+
+    # points off main branch
+    sb2x, sb2y = geom.intersection(mbound[poly_sb], bbound[poly_sb], m_sb, b_sb_low)
+    sb3x, sb3y = geom.intersection(mbound[poly_sb], bbound[poly_sb], m_sb, b_sb_high)
+
+    # replace with point on x=0 if below bounding line from tip to ag
+    sb2x = np.where(sb2y>b_sb_low, 0., sb2x)
+    sb2y = np.where(sb2y>b_sb_low, b_sb_low, sb2y)
+    sb3x = np.where(sb3y>b_sb_high, 0., sb3x)
+    sb3y = np.where(sb3y>b_sb_high, b_sb_high, sb3y)
+
+    # fill half sectors [p1, p2, subbranches, p3, p4] of all crystals
+    nhalf = 4+4*nsb
+    hoff = np.cumsum(nhalf)-nhalf
+    xcoor = np.empty([np.sum(nhalf)])
+    ycoor = np.empty([np.sum(nhalf)])
+    for ind, px, py in zip([0, 1, nhalf-2, nhalf-1], [p1x, p2x, p3x, p4x], [p1y, p2y, p3y, p4y]):
+        xcoor[hoff+ind] = px
+        ycoor[hoff+ind] = py
+
+    ind_sb = hoff[poly_sb]+2+4*isb
+    for q, sbx, sby in zip(range(4), [sb1x, sb2x, sb3x, sb4x], [sb1y, sb2y, sb3y, sb4y]):
+        xcoor[ind_sb+q] = sbx
+        ycoor[ind_sb+q] = sby
+
     # add intersection points that come from subsetting full polygon at y = sqrt(3)/2*a
-    npoint = len(xcoor)
+    poly_half = np.repeat(np.arange(npoly), nhalf)
     ya = np.sqrt(3.)/2.*a
-    
-    for i in range(npoint-1):
-    
-        # test if line segment intersects subset line
-        if ((ycoor[i]<ya)&(ycoor[i+1]>=ya))|((ycoor[i]>ya)&(ycoor[i+1]<=ya)):
-            dy = ycoor[i+1]-ycoor[i]
-            if dy==0.:
-                xa = 0.5*(xcoor[i+1]+xcoor[i])
-            else:
-                xa = (xcoor[i+1]-xcoor[i])/dy*(ya-ycoor[i])+xcoor[i]
-                
-            xcoor = np.insert(xcoor, i+1, xa)
-            ycoor = np.insert(ycoor, i+1, ya)
-            
-    # add last point that falls within main branch
-    xcoor = np.append(xcoor, a/2.)
-    ycoor = np.append(ycoor, ya)
-    
-    # remove points above ya           
-    ind_sub = (ycoor<=np.sqrt(3.)/2.*a)
+    ya_seg = ya[poly_half[:-1]]
+    y0 = ycoor[:-1]
+    y1 = ycoor[1:]
+    cross = ((y0<ya_seg)&(y1>=ya_seg))|((y0>ya_seg)&(y1<=ya_seg))
+    cross[hoff[1:]-1] = False
+    iseg = np.nonzero(cross)[0]
+    xa = (xcoor[iseg+1]-xcoor[iseg])/(ycoor[iseg+1]-ycoor[iseg])*(ya_seg[iseg]-ycoor[iseg])+xcoor[iseg]
+
+    # add last point that falls within main branch, and insert all new points at once
+    iend = hoff+nhalf
+    xcoor = np.insert(xcoor, np.concatenate((iseg+1, iend)), np.concatenate((xa, a/2.)))
+    ycoor = np.insert(ycoor, np.concatenate((iseg+1, iend)), np.concatenate((ya_seg[iseg], ya)))
+    poly_half = np.insert(poly_half, np.concatenate((iseg+1, iend)),
+                          np.concatenate((poly_half[iseg], np.arange(npoly))))
+
+    # remove points above ya
+    ind_sub = (ycoor<=np.sqrt(3.)/2.*a[poly_half])
     xcoor = xcoor[ind_sub]
     ycoor = ycoor[ind_sub]
-    
+    poly_half = poly_half[ind_sub]
+    nhalf = np.bincount(poly_half, minlength=npoly)
+    hoff = np.cumsum(nhalf)-nhalf
+
     # flip over half sector to create full sector
-    xsec = np.concatenate((-xcoor[::-1], xcoor[1:]))
-    ysec = np.concatenate((ycoor[::-1], ycoor[1:]))
-    
-    # rotate sector 60 degrees and concatenate with previous sector
-    xrot, yrot = geom.rotate(xsec, ysec, -60.)
-    xhex = np.concatenate((xsec, xrot[1:]))
-    yhex = np.concatenate((ysec, yrot[1:]))
-
-    # repeat until we have the entire crystal
-    for i in range(4):
-        xrot, yrot = geom.rotate(xsec, ysec, -(i+2)*60.)
-        xhex = np.concatenate((xhex, xrot[1:]))
-        yhex = np.concatenate((yhex, yrot[1:]))
-    
-    return xhex, yhex
+    nsec = 2*nhalf-1
+    soff = np.cumsum(nsec)-nsec
+    poly_sec = np.repeat(np.arange(npoly), nsec)
+    loc = np.arange(np.sum(nsec))-soff[poly_sec]
+    hind = hoff[poly_sec]+np.abs(loc-nhalf[poly_sec]+1)
+    xsec = np.where(loc<nhalf[poly_sec], -xcoor[hind], xcoor[hind])
+    ysec = ycoor[hind]
+
+    # rotate sector by multiples of 60 degrees, dropping the repeated first point of each sector
+    nfull = 6*nsec-5
+    foff = np.cumsum(nfull)-nfull
+    xhex = np.empty([np.sum(nfull)])
+    yhex = np.empty([np.sum(nfull)])
+    xhex[foff] = xsec[soff]
+    yhex[foff] = ysec[soff]
+    keep = loc>0
+    for i in range(6):
+        if i==0:
+            xrot, yrot = xsec, ysec
+        else:
+            xrot, yrot = geom.rotate(xsec, ysec, -i*60.)
+        ind_full = foff[poly_sec]+i*(nsec[poly_sec]-1)+loc
+        xhex[ind_full[keep]] = xrot[keep]
+        yhex[ind_full[keep]] = yrot[keep]
+
+    offsets = np.concatenate(([0], np.cumsum(nfull)))
+    return xhex, yhex, offsets
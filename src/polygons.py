@@ -1,6 +1,7 @@
 import numpy as np
 from crystal_dda.polygon_utils import hexagon, stellar, branched_planar
-from crystal_dda.geometry import in_polygon
+from crystal_dda.polygon_utils import hexagon_batch, stellar_batch, branched_planar_batch
+from crystal_dda.geometry import diameter, polygon_area, edge_index, points_in_index, points_in_polygon
 
 class Polygon():
     '''
@@ -18,10 +19,132 @@ class Polygon():
     Polygon
         The returned `Polygon` class.
     '''
+    __slots__ = ('_x', '_y', '_cache', '_custom')
+
+    # shape classes built with mirror symmetry about both the x and y axes
+    _symmetric = False
+
     def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        
+        self._set_vertices(x, y)
+        self._custom = True
+
+    @property
+    def x(self):
+        '''
+        The (read-only) x points of the polygon.
+        '''
+        if self._x is None:
+            self._set_vertices(*self._build())
+        return self._x
+
+    @x.setter
+    def x(self, x):
+        self._set_vertices(x, self.y)
+        self._custom = True
+
+    @property
+    def y(self):
+        '''
+        The (read-only) y points of the polygon.
+        '''
+        if self._y is None:
+            self._set_vertices(*self._build())
+        return self._y
+
+    @y.setter
+    def y(self, y):
+        self._set_vertices(self.x, y)
+        self._custom = True
+
+    @property
+    def params(self):
+        '''
+        The dict of parameters defining the polygon (the polygon points for general polygons, and for shape
+        class polygons whose points have been set).
+        '''
+        if type(self).__slots__ is Polygon.__slots__ or self._custom:
+            return {'x':self.x.tolist(), 'y':self.y.tolist()}
+        return {k:getattr(self, k) for k in type(self).__slots__}
+
+    @property
+    def symmetric(self):
+        '''
+        True if the polygon has mirror symmetry about both the x and y axes from its shape class (False once
+        its points have been set).
+        '''
+        return self._symmetric and not self._custom
+
+    def _set_vertices(self, x, y):
+        # store read-only copies so that cached properties cannot go stale through in-place changes
+        self._x = np.array(x, dtype=float)
+        self._y = np.array(y, dtype=float)
+        self._x.flags.writeable = False
+        self._y.flags.writeable = False
+        self._cache = {}
+
+    def _defer_vertices(self):
+        # polygon points of shape classes are built from the parameters on first use
+        self._x = None
+        self._y = None
+        self._cache = {}
+        self._custom = False
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    @property
+    def diameter(self):
+        '''
+        The maximum distance between polygon points (from rotating calipers on the convex hull).
+        '''
+        return self._cached('diameter', lambda: diameter(self.x, self.y))
+
+    @property
+    def area(self):
+        '''
+        The area enclosed by the polygon.
+        '''
+        return self._cached('area', lambda: polygon_area(self.x, self.y))
+
+    @property
+    def perimeter(self):
+        '''
+        The length of the polygon boundary.
+        '''
+        return self._cached('perimeter', lambda: np.sum(np.hypot(np.roll(self.x, -1)-self.x,
+                                                                 np.roll(self.y, -1)-self.y)))
+
+    @property
+    def bbox(self):
+        '''
+        The (2,2) array of minimum and maximum polygon points along the x and y axes.
+        '''
+        return self._cached('bbox', lambda: np.array([[np.min(self.x), np.max(self.x)],
+                                                      [np.min(self.y), np.max(self.y)]]))
+
+    @property
+    def centroid(self):
+        '''
+        The (x,y) centroid of the area enclosed by the polygon.
+        '''
+        def compute():
+            xnext = np.roll(self.x, -1)
+            ynext = np.roll(self.y, -1)
+            cross = self.x*ynext-xnext*self.y
+            area6 = 3.*np.sum(cross)
+            return np.array([np.sum((self.x+xnext)*cross)/area6,
+                             np.sum((self.y+ynext)*cross)/area6])
+        return self._cached('centroid', compute)
+
+    @property
+    def edge_index(self):
+        '''
+        The row band index of the polygon edges used by `within` (from `geometry.edge_index`).
+        '''
+        return self._cached('edge_index', lambda: edge_index(self.x, self.y))
+
     def size(self):
         '''
         Get the maximum dimension for the polygon.
@@ -35,21 +158,13 @@ class Polygon():
         dmax : float
             The maximum distance between polygon points.
         '''
-        npoint = len(self.x)
-        
-        dmax = 0.
-        
-        # iterate over points and find largest distances
-        for i in range(npoint):
-            dmax_test = np.max((self.x[i]-self.x)**2.+(self.y[i]-self.y)**2.)
-            dmax = max(dmax, dmax_test)
-            
-        dmax = np.sqrt(dmax)
-        return dmax
+        return self.diameter
 
     def within(self, points):
         '''
         Return a boolean index list corresponding to whether each point is within the polygon boundary.
+        Only the polygon edges in the row band of each point are tested, and the edge index is built on
+        the first call and reused.
 
         Parameters
         ----------
@@ -61,7 +176,7 @@ class Polygon():
         indicator : ndarray
             The (N) length array of boolean indices.
         '''
-        indicator = in_polygon(self.x, self.y, points[:,0], points[:,1])
+        indicator = points_in_index(self.edge_index, points[:,0], points[:,1])
         return indicator
         
 class Hexagon(Polygon):
@@ -78,10 +193,15 @@ class Hexagon(Polygon):
     Hexagon
         The returned `Hexagon` class.
     '''
+    __slots__ = ('a',)
+    _symmetric = True
+
     def __init__(self, a):
         self.a = a
-        x, y = hexagon(a)
-        super(Hexagon, self).__init__(x, y)
+        self._defer_vertices()
+
+    def _build(self):
+        return hexagon(self.a)
         
 class Stellar(Polygon):
     '''
@@ -99,11 +219,16 @@ class Stellar(Polygon):
     Stellar
         The returned `Stellar` class.
     '''
+    __slots__ = ('fbranch', 'a')
+    _symmetric = True
+
     def __init__(self, fbranch, a):
         self.fbranch = fbranch
         self.a = a
-        x, y = stellar(fbranch, a)
-        super(Stellar, self).__init__(x, y)
+        self._defer_vertices()
+
+    def _build(self):
+        return stellar(self.fbranch, self.a)
         
 class BranchedPlanar(Polygon):
     '''
@@ -131,6 +256,9 @@ class BranchedPlanar(Polygon):
     BranchedPlanar
         The returned `BranchedPlanar` class.
     '''
+    __slots__ = ('a', 'amax', 'ac', 'ft', 'fb', 'fg', 'nsb')
+    _symmetric = True
+
     def __init__(self, a, amax, ac, ft, fb, fg, nsb):
         self.a = a
         self.amax = amax
@@ -139,5 +267,150 @@ class BranchedPlanar(Polygon):
         self.fb = fb
         self.fg = fg
         self.nsb = nsb
-        x, y = branched_planar(a, amax, ac, ft, fb, fg, nsb)
-        super(BranchedPlanar, self).__init__(x, y)
+        self._defer_vertices()
+
+    def _build(self):
+        return branched_planar(self.a, self.amax, self.ac, self.ft, self.fb, self.fg, self.nsb)
+
+class PolygonBatch():
+    '''
+    The class for batches of closed polygons, stored as the concatenated polygon points with the points of
+    polygon k given by x[offsets[k]:offsets[k+1]] and y[offsets[k]:offsets[k+1]].
+
+    Batches of hexagons, stellar crystals and branched planar crystals are built at once with the
+    `hexagon`, `stellar` and `branched_planar` constructors, and the sizes, areas and point tests of all
+    polygons are vectorized over the batch.
+
+    Parameters
+    ----------
+    x : ndarray
+        The concatenated x points of the polygons.
+    y : ndarray
+        The concatenated y points of the polygons.
+    offsets : ndarray
+        The (npoly+1) array of polygon start indices (polygons must have points).
+
+    Returns
+    -------
+    PolygonBatch
+        The returned `PolygonBatch` class.
+    '''
+    __slots__ = ('x', 'y', 'offsets', 'shape', 'params', '_cache')
+
+    def __init__(self, x, y, offsets, shape=None, params=None):
+        self.x = np.array(x, dtype=float)
+        self.y = np.array(y, dtype=float)
+        self.offsets = np.array(offsets, dtype=int)
+        for array in [self.x, self.y, self.offsets]:
+            array.flags.writeable = False
+        if np.any(np.diff(self.offsets)<1) or self.offsets[-1]!=len(self.x):
+            raise ValueError('polygon offsets must increase and end at the number of points.')
+        self.shape = shape
+        self.params = {} if params is None else params
+        self._cache = {}
+
+    @classmethod
+    def hexagon(cls, a):
+        '''
+        Create a batch of hexagons (see `Hexagon`), with array parameters.
+        '''
+        x, y, offsets = hexagon_batch(a)
+        return cls(x, y, offsets, Hexagon, {'a':np.ravel(np.asarray(a, dtype=float))})
+
+    @classmethod
+    def stellar(cls, fbranch, a):
+        '''
+        Create a batch of stellar crystals (see `Stellar`), with array parameters broadcast against each
+        other.
+        '''
+        x, y, offsets = stellar_batch(fbranch, a)
+        fbranch, a = [np.ravel(p).astype(float) for p in np.broadcast_arrays(fbranch, a)]
+        return cls(x, y, offsets, Stellar, {'fbranch':fbranch, 'a':a})
+
+    @classmethod
+    def branched_planar(cls, a, amax, ac, ft, fb, fg, nsb):
+        '''
+        Create a batch of branched planar crystals (see `BranchedPlanar`), with array parameters broadcast
+        against each other.
+        '''
+        x, y, offsets = branched_planar_batch(a, amax, ac, ft, fb, fg, nsb)
+        values = np.broadcast_arrays(*[np.atleast_1d(p) for p in [a, amax, ac, ft, fb, fg, nsb]])
+        params = {k:v.astype(float) for k, v in zip(BranchedPlanar.__slots__, values)}
+        params['nsb'] = params['nsb'].astype(int)
+        return cls(x, y, offsets, BranchedPlanar, params)
+
+    @classmethod
+    def from_polygons(cls, polys):
+        '''
+        Create a batch from a list of `Polygon` objects.
+        '''
+        npoint = [len(poly.x) for poly in polys]
+        x = np.concatenate([poly.x for poly in polys])
+        y = np.concatenate([poly.y for poly in polys])
+        return cls(x, y, np.concatenate(([0], np.cumsum(npoint))))
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def __getitem__(self, k):
+        '''
+        Get polygon k of the batch (as a shape class object for batches of a crystal shape).
+        '''
+        k = range(len(self))[k]
+        if self.shape is not None:
+            return self.shape(**{name:value[k].item() for name, value in self.params.items()})
+        return Polygon(self.x[self.offsets[k]:self.offsets[k+1]], self.y[self.offsets[k]:self.offsets[k+1]])
+
+    def size(self):
+        '''
+        Get the maximum dimension of each polygon.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dmax : ndarray
+            The maximum distance between the points of each polygon.
+        '''
+        if 'diameter' not in self._cache:
+            self._cache['diameter'] = diameter(self.x, self.y, self.offsets)
+        return self._cache['diameter']
+
+    @property
+    def area(self):
+        '''
+        The area enclosed by each polygon.
+        '''
+        if 'area' not in self._cache:
+            self._cache['area'] = polygon_area(self.x, self.y, self.offsets)
+        return self._cache['area']
+
+    def within(self, points, chunk_size=4096):
+        '''
+        Return a boolean index array corresponding to whether each point is within each polygon boundary.
+
+        Parameters
+        ----------
+        points : ndarray
+            The (N,2) array of x-y points that are being evaluated.
+        chunk_size : int, optional
+            The number of polygon points tested at a time (groups hold at least one polygon).
+
+        Returns
+        -------
+        indicator : ndarray
+            The (npoly,N) array of boolean indices.
+        '''
+        indicator = np.empty([len(self), len(points)], dtype=bool)
+        k0 = 0
+        while k0<len(self):
+            # group of polygons with up to chunk_size points
+            k1 = max(np.searchsorted(self.offsets, self.offsets[k0]+chunk_size, 'right')-1, k0+1)
+            start, end = self.offsets[k0], self.offsets[k1]
+            indicator[k0:k1] = points_in_polygon(self.x[start:end], self.y[start:end], points[:,0], points[:,1],
+                                                 self.offsets[k0:k1+1]-start)
+            k0 = k1
+        return indicator
+
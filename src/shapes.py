@@ -1,9 +1,15 @@
-import matplotlib.pyplot as plt
 import numpy as np
-from crystal_dda.polygons import Polygon, Hexagon
-from crystal_dda.geometry import in_polygon
-from scipy.spatial import Delaunay
-import pyvista as pv
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from crystal_dda.polygons import Hexagon, Stellar, BranchedPlanar
+from crystal_dda.geometry import in_polygon, fill_symmetric, scanline_fill, scanline_spans, in_hexagon
+from crystal_dda.geometry import points_in_index, euler_matrix, cell_fractions
+from crystal_dda.geometry import afrac_stellar, afrac_branched
+from crystal_dda.dipoles import DipoleSet, layer_ranges
+from crystal_dda.writers import write_extruded, write_extruded_chunks, write_columns
+from crystal_dda.cache import dipole_key
+from crystal_dda.mesh import extrude, write_stl, write_obj
+from crystal_dda.packed import write_packed
+from crystal_dda.instrument import stage
 
 class Crystal:
     '''
@@ -13,20 +19,26 @@ class Crystal:
     ----------
     poly : Polygon
         The `Polygon` object defining the 2D planar shape of the crystal.
-    c : float
-        The crystal basal-length dimension (c = h/2, where h is the crystal thickness).
+    c : float or callable
+        The crystal basal-length dimension (c = h/2, where h is the crystal thickness). For crystals of
+        varying thickness, a function `c(x, y)` giving the half thickness at arrays of planar positions
+        (e.g., from `radial_thickness` or `core_thickness`).
+    cache : DipoleCache, optional
+        The on-disk cache used by `create_dipoles` and `write_dipoles` (only for constant `c`).
         
     Returns
     -------
     Crystal
         The returned `Crystal` object.
     '''
-    def __init__(self, poly, c):
+    def __init__(self, poly, c, cache=None):
         self.poly = poly
         self.c = c
-        self.ix = np.array([])
-        self.iy = np.array([])
-        self.iz = np.array([])
+        self.cache = cache
+        self.dipoles = None
+        self._arrays = None
+        self._key = None
+        self._workers = None
         self.ndip = 0
 
     def create_mesh(self):
@@ -42,32 +54,61 @@ class Crystal:
         mesh : `pyvista.Dataset`
             The triangulated 3d mesh surface of the crystal.
         '''
-        # triangulate polygon
-        points = np.vstack((self.poly.x, self.poly.y)).T
-        tri = Delaunay(points)
+        import pyvista as pv
+        points, faces = self.mesh_arrays()
+        faces = np.concatenate((np.full([faces.shape[0],1], 3), faces), axis=1)
+        mesh = pv.PolyData(points, faces)
+        return mesh
+
+    def mesh_arrays(self):
+        '''
+        Get the points and triangles of the closed 3d mesh surface of the crystal, from the ear clipping
+        triangulation of the 2d polygon extruded between z = -c and z = c (only for constant `c`).
+
+        Parameters
+        ----------
+        None
 
-        # remove faces outside of the original polygon
-        faces = tri.simplices
-        nface = faces.shape[0]
+        Returns
+        -------
+        points : ndarray
+            The (N,3) array of mesh points.
+        faces : ndarray
+            The (M,3) array of point indices of the mesh triangles, ordered counterclockwise when viewed
+            from outside the crystal.
+        '''
+        if callable(self.c):
+            raise ValueError('meshes require a crystal of constant thickness c.')
+        with stage('mesh') as st:
+            points, faces = extrude(self.poly.x, self.poly.y, self.c)
+            st.npoint = len(points)
+        return points, faces
 
-        xfaces = points[faces,0]
-        yfaces = points[faces,1]
-        mid_points = np.vstack((np.mean(xfaces, axis=1),np.mean(yfaces, axis=1))).T
-        ind = self.poly.within(mid_points)
-        faces = faces[ind,:]
+    def write_mesh(self, file_name, binary=True):
+        '''
+        Write the 3d mesh surface of the crystal to an STL or OBJ file.
 
-        # create 2d surface mesh
-        nface = faces.shape[0]
-        npoint = len(self.poly.x)
-        faces = np.concatenate((np.full([nface,1], 3), faces), axis=1)
-        z = np.full([npoint], self.c)
-        surf = pv.PolyData(np.vstack((points[:,0],points[:,1],z)).T, faces)
+        Parameters
+        ----------
+        file_name : str
+            The output file name. Files ending in '.obj' (or '.obj.gz') are written in the Wavefront OBJ
+            format, and other files in the STL format.
+        binary : bool, optional
+            If True, write binary STL files, and otherwise ASCII STL files.
 
-        # extrude 2d mesh to 3d by length 0f 2*c
-        mesh = surf.extrude([0., 0., -2.*self.c], capping=True)
-        return mesh        
+        Returns
+        -------
+        None
+        '''
+        points, faces = self.mesh_arrays()
+        if str(file_name).endswith(('.obj', '.obj.gz')):
+            write_obj(file_name, points, faces)
+        else:
+            write_stl(file_name, points, faces, binary=binary)
+        return
 
-    def create_dipoles(self, dip_len):
+    def create_dipoles(self, dip_len, symmetric=False, method='scanline', workers=None, pool='thread',
+                       min_fraction=None):
         '''
         Fill the crystal with dimensionless dipole indices based on the crystal physical dimensions and the dipole spacing `dip_len`.
         
@@ -75,48 +116,585 @@ class Crystal:
         ----------
         dip_len : float
             The dipole spacing.
+        symmetric : bool, optional
+            If True, only test the grid points in one quadrant and mirror the result over the x and y axes.
+            This requires a polygon with mirror symmetry about both axes (e.g., `Hexagon`, `Stellar`, and
+            `BranchedPlanar`) and gives the same dipoles as the full test with about 1/4 of the point tests.
+            The quadrant is filled with the given `method`.
+        method : str, optional
+            The point-in-polygon method. 'scanline' (the default, which only needs numpy) finds the polygon
+            edge crossings once per grid row and fills the inside spans, and 'path' tests every grid point
+            with `matplotlib.path.Path`. Both give the same dipoles.
+        workers : int, optional
+            The number of workers that fill bands of scanline rows (along y) and get their footprint points, and
+            that later rescale and extrude the footprint into the 3d dipole arrays. If None or 1, the crystal
+            is filled serially. The dipoles and their order are the same for any number of workers. Symmetric
+            fills are not split into bands.
+        pool : str, optional
+            The worker pool, 'thread' or 'process' (scripts using processes need an
+            `if __name__ == '__main__':` guard). Extrusion always uses threads.
+        min_fraction : float, optional
+            If given, the exact area fraction of each grid cell (of the grid spacing, centered on a grid point)
+            inside the polygon is found, and the footprint has the cells with a fraction above `min_fraction`
+            instead of the cells with their center inside. Only the cells crossed by the polygon edges are
+            clipped to the polygon, and the other cells have fractions of 0 or 1. The fractions are kept as the
+            footprint `weight` of the dipoles (see `weights`), so that the weighted footprint area is the
+            polygon area on any grid. The fill method, symmetric fill and workers are not used.
+
+        If `c` is a function, each footprint column is filled with the dipole layers within the half thickness
+        `c(x, y)` at the column center from the midplane, and columns with no layers are left out of the
+        footprint. Only the 2d footprint is point tested.
+
+        If the crystal has a cache, the dipoles are loaded from the cache when present (without building the
+        polygon points or filling), and stored in the cache otherwise.
         
         Returns
         -------
         None
         '''
+        if method not in ['path', 'scanline']:
+            raise ValueError(f"unknown fill method '{method}'; use 'path' or 'scanline'.")
+        if symmetric and not self.poly.symmetric:
+            raise ValueError('symmetric fill requires a polygon with mirror symmetry about the x and y axes.')
+        if pool not in ['thread', 'process']:
+            raise ValueError(f"unknown worker pool '{pool}'; use 'thread' or 'process'.")
+        banded = workers is not None and workers>1 and not symmetric and min_fraction is None
+        self._workers = workers
+
+        cached = self.cache is not None and not callable(self.c) and min_fraction is None
+        if cached:
+            with stage('cache_get') as st:
+                key = dipole_key(self.poly, self.c, dip_len)
+                dipoles = self.cache.get(key)
+                if dipoles is not None:
+                    st.npoint = dipoles.nfoot
+            if dipoles is not None:
+                self.set_dipoles(dipoles)
+                self._key = key
+                return
+
         # fill in polygon with dipoles on grid spanned by polygon dmax
-        dmax = self.poly.size()
-        ndipx = int(dmax/dip_len)+1
-        xg2, yg2 = np.meshgrid(np.linspace(-dmax/2., dmax/2, ndipx),
-                               np.linspace(-dmax/2., dmax/2., ndipx), indexing='ij')
-        xgf= xg2.flatten()
-        ygf = yg2.flatten()
-
-        inpoly = in_polygon(self.poly.x, self.poly.y, xgf, ygf)
-        x_dip_poly = xgf[inpoly]
-        y_dip_poly = ygf[inpoly]
-
-        # rescale to dda domain (with min index values of 1)
-        ix_dip_poly = x_dip_poly/dip_len
-        iy_dip_poly = y_dip_poly/dip_len
-        ix_dip_poly = ix_dip_poly-np.min(ix_dip_poly)+1
-        iy_dip_poly = iy_dip_poly-np.min(iy_dip_poly)+1
-
-        # extrude 2d dipole indices to 3d along z axis
-        ndipz = int(2.*self.c/dip_len)+1
-        iz1d = np.arange(ndipz)+1
-        
-        ix3, iz3 = np.meshgrid(ix_dip_poly, iz1d, indexing='ij')
-        iy3, iz3 = np.meshgrid(iy_dip_poly, iz1d, indexing='ij')
-        ix_dip = ix3.flatten()
-        iy_dip = iy3.flatten()
-        iz_dip = iz3.flatten()
-        ndip = len(ix_dip)
-        
-        # set dipole indices for crystal
-        self.ix = ix_dip
-        self.iy = iy_dip
-        self.iz = iz_dip
-        self.ndip = ndip
+        with stage('size') as st:
+            dmax = self.poly.size()
+            st.npoint = len(self.poly.x)
+        with stage('grid') as st:
+            ndipx = int(dmax/dip_len)+1
+            xg = np.linspace(-dmax/2., dmax/2., ndipx)
+            st.npoint = ndipx**2
+
+        with stage('fill') as st:
+            if min_fraction is not None:
+                # cells crossed by the polygon edges replace the center test
+                inpoly = scanline_fill(self.poly.x, self.poly.y, xg, xg)
+                icell, jcell, frac = cell_fractions(self.poly.x, self.poly.y, xg, xg)
+                inpoly[icell, jcell] = frac>min_fraction
+            elif banded:
+                # footprint points of bands of scanline rows (along y), so that each band only finds the
+                # edge crossings of its own rows
+                bands = np.linspace(0, ndipx, min(4*workers, ndipx)+1).astype(int)
+                executor = ThreadPoolExecutor if pool=='thread' else ProcessPoolExecutor
+                with executor(workers) as ex:
+                    futures = [ex.submit(_fill_band, self.poly.x, self.poly.y, xg, j0, j1, method)
+                               for j0, j1 in zip(bands[:-1], bands[1:])]
+                    ij = [future.result() for future in futures]
+
+                    # interleave the bands into the (i-major) order of the serial fill, with the points
+                    # of each band in grid row i placed after those of the previous bands
+                    counts = np.array([band[2] for band in ij])
+                    first = np.cumsum(counts.T).reshape(ndipx, -1).T-counts
+                    i_dip_poly = np.empty([np.sum(counts)], dtype=np.intp)
+                    j_dip_poly = np.empty([np.sum(counts)], dtype=np.intp)
+                    if pool=='thread':
+                        futures = [ex.submit(_place_band, i_dip_poly, j_dip_poly, band, start)
+                                   for band, start in zip(ij, first)]
+                        for future in futures:
+                            future.result()
+                    else:
+                        for band, start in zip(ij, first):
+                            _place_band(i_dip_poly, j_dip_poly, band, start)
+            elif symmetric:
+                inpoly = fill_symmetric(self.poly.x, self.poly.y, xg, method=method)
+            elif method=='scanline':
+                inpoly = scanline_fill(self.poly.x, self.poly.y, xg, xg)
+            else:
+                xg2, yg2 = np.meshgrid(xg, xg, indexing='ij')
+                inpoly = in_polygon(self.poly.x, self.poly.y, xg2.flatten(), yg2.flatten())
+                inpoly = inpoly.reshape(xg2.shape)
+            st.npoint = ndipx**2
+
+        # set footprint dipoles to be extruded along z axis (with min index values of 1)
+        with stage('footprint') as st:
+            if not banded:
+                i_dip_poly, j_dip_poly = np.nonzero(inpoly)
+            st.npoint = len(i_dip_poly)
+            weight = None
+            if min_fraction is not None:
+                # fractions of the kept crossed cells (footprint points are sorted by i and then j)
+                weight = np.ones([len(i_dip_poly)])
+                kept = frac>min_fraction
+                pos = np.searchsorted(i_dip_poly*ndipx+j_dip_poly, icell[kept]*ndipx+jcell[kept])
+                weight[pos] = frac[kept]
+            if callable(self.c):
+                # layer range of each column from the half thickness at the column center
+                h = np.broadcast_to(self.c(xg[i_dip_poly], xg[j_dip_poly]), i_dip_poly.shape)
+                ndipz = int(2.*np.max(h, initial=0.)/dip_len)+1
+                kmin, kmax = layer_ranges(h, dip_len, ndipz)
+                incol = kmax>=kmin
+                dipoles = DipoleSet(i_dip_poly[incol], j_dip_poly[incol], xg, dip_len, ndipz,
+                                    kmin[incol], kmax[incol], None if weight is None else weight[incol])
+            else:
+                ndipz = int(2.*self.c/dip_len)+1
+                dipoles = DipoleSet(i_dip_poly, j_dip_poly, xg, dip_len, ndipz, weight=weight)
+            self.set_dipoles(dipoles)
+        if cached:
+            with stage('cache_put') as st:
+                self.cache.put(key, self.dipoles)
+                st.npoint = self.dipoles.nfoot
+            self._key = key
         
         return
 
+    def iter_footprint(self, dip_len, tile_size=1024):
+        '''
+        Iterate over the dimensionless x and y dipole indices of the 2d footprint in tiles of grid columns,
+        without holding the full dipole grid in memory.
+
+        The footprint is the same, and in the same order, as that of `create_dipoles` with `method='scanline'`.
+        The inside spans of all grid rows are found once (their size grows with the grid side length, not
+        its area), and each tile of `tile_size` grid columns is filled from the spans.
+
+        Parameters
+        ----------
+        dip_len : float
+            The dipole spacing.
+        tile_size : int, optional
+            The number of grid columns in each tile.
+
+        Yields
+        ------
+        ix : ndarray
+            The x dipole indices of the footprint points in the tile (with min index values of 1 over the
+            whole footprint).
+        iy : ndarray
+            The y dipole indices of the footprint points in the tile.
+        '''
+        xg, row, start, end = self._footprint_spans(dip_len)
+        if len(row)==0:
+            return
+        ix0 = xg[np.min(start)]/dip_len
+        iy0 = xg[np.min(row)]/dip_len
+        ngrid = len(xg)
+
+        for i0 in range(np.min(start), np.max(end), tile_size):
+            with stage('tile') as st:
+                # spans clipped to the tile, filled on a (tile column, row) grid
+                tstart = np.maximum(start, i0)
+                tend = np.minimum(end, i0+tile_size)
+                nspan = np.maximum(tend-tstart, 0)
+                i = np.arange(np.sum(nspan))-np.repeat(np.cumsum(nspan)-nspan-tstart+i0, nspan)
+                tile = np.zeros([tile_size, ngrid], dtype=bool)
+                tile[i, np.repeat(row, nspan)] = True
+                i, j = np.nonzero(tile)
+                st.npoint = len(i)
+            yield xg[i+i0]/dip_len-ix0+1, xg[j]/dip_len-iy0+1
+
+    def iter_dipoles(self, dip_len, tile_size=1024, chunk_size=65536):
+        '''
+        Iterate over chunks of the 3d dipole indices with bounded memory (see `iter_footprint`), in the order
+        of the arrays of `create_dipoles` with `method='scanline'`.
+
+        Parameters
+        ----------
+        dip_len : float
+            The dipole spacing.
+        tile_size : int, optional
+            The number of grid columns in each footprint tile.
+        chunk_size : int, optional
+            The maximum number of footprint points extruded in each chunk.
+
+        Yields
+        ------
+        ix : ndarray
+            The x dipole indices of the chunk.
+        iy : ndarray
+            The y dipole indices of the chunk.
+        iz : ndarray
+            The z dipole indices of the chunk.
+        '''
+        ndipz = self._ndipz(dip_len)
+        for ix, iy in self.iter_footprint(dip_len, tile_size=tile_size):
+            for start in range(0, len(ix), chunk_size):
+                nfoot = len(ix[start:start+chunk_size])
+                yield (np.repeat(ix[start:start+chunk_size], ndipz), np.repeat(iy[start:start+chunk_size], ndipz),
+                       np.tile(np.arange(ndipz)+1, nfoot))
+
+    def stream_dipoles(self, file_name, dip_len, tile_size=1024):
+        '''
+        Fill the crystal and write the dipole indices to a file in a single pass with bounded memory, giving
+        the same file as `create_dipoles` (with `method='scanline'`) followed by `write_dipoles`. The dipoles
+        are not kept by the crystal.
+
+        Parameters
+        ----------
+        file_name : str
+            The output file name (gzip compressed if it ends in '.gz').
+        dip_len : float
+            The dipole spacing.
+        tile_size : int, optional
+            The number of grid columns in each footprint tile.
+
+        Returns
+        -------
+        ndip : int
+            The number of dipoles written.
+        '''
+        xg, row, start, end = self._footprint_spans(dip_len)
+        ndipz = self._ndipz(dip_len)
+        nfoot = int(np.sum(end-start))
+        if nfoot==0:
+            print('error: the crystal has no dipoles at this dipole spacing.')
+            return 0
+
+        # bounding box of dipoles from the spans
+        dx = (xg[np.max(end)-1]-xg[np.min(start)])/dip_len+1
+        dy = (xg[np.max(row)]-xg[np.min(row)])/dip_len+1
+        header = "#generated by crystal-dda\n"+\
+                 "#shape: 'read'\n"+\
+                f"#box size: {dx:.0f}x{dy:.0f}x{ndipz:.0f}\n"
+        with stage('write') as st:
+            write_extruded_chunks(file_name, self.iter_footprint(dip_len, tile_size=tile_size),
+                                  np.arange(ndipz)+1, ('%d','%d','%d'), header=header)
+            st.npoint = nfoot*ndipz
+        return nfoot*ndipz
+
+    def _footprint_spans(self, dip_len):
+        # grid and inside spans of the grid rows for the footprint of create_dipoles
+        if callable(self.c):
+            raise ValueError('streamed fills require a crystal of constant thickness c.')
+        with stage('spans') as st:
+            dmax = self.poly.size()
+            xg = np.linspace(-dmax/2., dmax/2., int(dmax/dip_len)+1)
+            row, start, end = scanline_spans(self.poly.x, self.poly.y, xg, xg)
+            st.npoint = len(row)
+        return xg, row, start, end
+
+    def _ndipz(self, dip_len):
+        # number of dipole layers of a crystal of constant thickness
+        return int(2.*self.c/dip_len)+1
+
+    def create_dipoles_rotated(self, dip_len, alpha, beta, gamma, chunk_size=65536):
+        '''
+        Fill the crystal rotated by z-y-z Euler angles with dipoles on the lab-frame lattice of spacing `dip_len`.
+
+        Lattice points (at integer multiples of `dip_len` from the crystal center) are mapped into the crystal
+        frame and kept if they are inside the polygon with |z| <= c. Each lattice column along the lab z axis is
+        a line in the crystal frame, so it is first clipped to the bounding box of the crystal (skipping the
+        columns that miss it) and the inside runs of layers are then found from the crossings of the line with
+        the polygon edges, without testing each lattice point. Columns are processed `chunk_size` at a time. A
+        column may cross the rotated crystal more than once, so the dipoles are stored as runs of layers (see
+        `DipoleSet`).
+
+        Parameters
+        ----------
+        dip_len : float
+            The dipole spacing.
+        alpha : float
+            The first rotation angle about the z axis in degrees.
+        beta : float
+            The rotation angle about the new y axis in degrees.
+        gamma : float
+            The rotation angle about the new z axis in degrees.
+        chunk_size : int, optional
+            The number of lattice columns processed at a time.
+
+        Returns
+        -------
+        None
+        '''
+        if callable(self.c):
+            raise ValueError('rotated fills require a crystal of constant thickness c.')
+        rot = euler_matrix(alpha, beta, gamma)
+        inv = rot.T
+
+        # lab lattice index range of the rotated crystal bounding box
+        bbox = self.poly.bbox
+        body_lo = np.array([bbox[0,0], bbox[1,0], -self.c])
+        body_hi = np.array([bbox[0,1], bbox[1,1], self.c])
+        corners = np.array(np.meshgrid(*zip(body_lo, body_hi), indexing='ij')).reshape(3, -1)
+        lab = rot@corners
+        klo = np.floor(np.min(lab, axis=1)/dip_len).astype(int)
+        khi = np.ceil(np.max(lab, axis=1)/dip_len).astype(int)
+
+        # crystal-frame step along the lab z axis, and polygon in the frame (u, v) with u along the
+        # step projected onto the crystal plane
+        step = inv[:,2]*dip_len
+        slen = np.hypot(step[0], step[1])
+        if slen>1.e-9*dip_len:
+            cu, su = step[:2]/slen
+        else:
+            cu, su = 1., 0.
+        xpoly = np.asarray(self.poly.x, dtype=float)
+        ypoly = np.asarray(self.poly.y, dtype=float)
+        upoly = cu*xpoly+su*ypoly
+        vpoly = cu*ypoly-su*xpoly
+
+        ix2, iy2 = np.meshgrid(np.arange(klo[0], khi[0]+1), np.arange(klo[1], khi[1]+1), indexing='ij')
+        ix2 = ix2.ravel()
+        iy2 = iy2.ravel()
+        runs = []
+        with stage('fill_rotated') as st:
+            for start in range(0, len(ix2), chunk_size):
+                ix = ix2[start:start+chunk_size]
+                iy = iy2[start:start+chunk_size]
+                q0 = np.outer(inv[:,0], ix*dip_len)+np.outer(inv[:,1], iy*dip_len)
+
+                # clip columns to the crystal bounding box
+                nlo = np.full(len(ix), -np.inf)
+                nhi = np.full(len(ix), np.inf)
+                for k in range(3):
+                    if step[k]!=0.:
+                        n1 = (body_lo[k]-q0[k])/step[k]
+                        n2 = (body_hi[k]-q0[k])/step[k]
+                        nlo = np.maximum(nlo, np.minimum(n1, n2))
+                        nhi = np.minimum(nhi, np.maximum(n1, n2))
+                    else:
+                        nhi[(q0[k]<body_lo[k])|(q0[k]>body_hi[k])] = -np.inf
+                nlo = np.maximum(np.ceil(nlo), klo[2])
+                nhi = np.minimum(np.floor(nhi), khi[2])
+                hit = nlo<=nhi
+                ix, iy, q0, nlo, nhi = ix[hit], iy[hit], q0[:,hit], nlo[hit], nhi[hit]
+                st.npoint = st.npoint+len(ix)
+
+                if slen>1.e-9*dip_len:
+                    col, nstart, nend = self._column_spans(upoly, vpoly, cu*q0[0]+su*q0[1],
+                                                           cu*q0[1]-su*q0[0], slen)
+                    nstart = np.maximum(nstart, nlo[col])
+                    nend = np.minimum(nend, nhi[col])
+                else:
+                    # columns along the crystal z axis are inside or outside of the polygon throughout
+                    col = np.flatnonzero(points_in_index(self.poly.edge_index, q0[0], q0[1]))
+                    nstart, nend = nlo[col], nhi[col]
+                run = nstart<=nend
+                col = col[run]
+                runs.append(self._correct_runs(inv, dip_len, ix[col], iy[col], nstart[run], nend[run]))
+
+        # layer runs from the lowest occupied layer (with xy indices on a square grid covering the x and
+        # y ranges)
+        i, j, kmin, kmax = [np.concatenate([run[k] for run in runs]).astype(int) for k in range(4)]
+        nlo = min(klo[0], klo[1])
+        xg = np.arange(nlo, max(khi[0], khi[1])+1)*dip_len
+        k0 = np.min(kmin, initial=khi[2])
+        ndipz = np.max(kmax, initial=k0)-k0+1
+        self.set_dipoles(DipoleSet(i-nlo, j-nlo, xg, dip_len, ndipz, kmin-k0, kmax-k0))
+        return
+
+    def _prism_contains(self, inv, dip_len, ix, iy, iz):
+        # exact test of lab lattice points in the crystal
+        x, y, z = ix*dip_len, iy*dip_len, iz*dip_len
+        q = [inv[k,0]*x+inv[k,1]*y+inv[k,2]*z for k in range(3)]
+        return (np.abs(q[2])<=self.c)&points_in_index(self.poly.edge_index, q[0], q[1])
+
+    def _correct_runs(self, inv, dip_len, ix, iy, nstart, nend):
+        # correct rounding of the run ends by one step with the exact test, and merge runs that meet
+        contains = lambda n: self._prism_contains(inv, dip_len, ix, iy, n)
+        nstart = np.where(~contains(nstart), nstart+1, np.where(contains(nstart-1), nstart-1, nstart))
+        nend = np.where(~contains(nend), nend-1, np.where(contains(nend+1), nend+1, nend))
+        run = nstart<=nend
+        ix, iy, nstart, nend = ix[run], iy[run], nstart[run], nend[run]
+
+        # runs of a column stay in order after moving their ends by one step, so runs only meet their
+        # neighbors
+        order = np.lexsort((nstart, iy, ix))
+        ix, iy, nstart, nend = ix[order], iy[order], nstart[order], nend[order]
+        first = np.ones(len(ix), dtype=bool)
+        first[1:] = (ix[1:]!=ix[:-1])|(iy[1:]!=iy[:-1])|(nstart[1:]>nend[:-1]+1)
+        last = np.append(first[1:], True)[:len(ix)]
+        return ix[first], iy[first], nstart[first], nend[last]
+
+    def _column_spans(self, upoly, vpoly, u0, v0, slen):
+        # runs of steps n inside the polygon along the lines u = u0+n*slen at constant v = v0, from the
+        # edge crossings of each line (v0 < v <= v1 or v1 < v <= v0)
+        ua = upoly
+        va = vpoly
+        ub = np.roll(ua, -1)
+        vb = np.roll(va, -1)
+        order = np.argsort(v0)
+        vsort = v0[order]
+        kstart = np.searchsorted(vsort, np.minimum(va, vb), 'right')
+        kend = np.searchsorted(vsort, np.maximum(va, vb), 'right')
+        ncross = kend-kstart
+        edge = np.repeat(np.arange(len(ua)), ncross)
+        col = order[np.arange(np.sum(ncross))-np.repeat(np.cumsum(ncross)-ncross, ncross)+\
+                    np.repeat(kstart, ncross)]
+        v = v0[col]
+        ucross = ub[edge]-(vb[edge]-v)*(ua[edge]-ub[edge])/(va[edge]-vb[edge])
+
+        # pair sorted crossings of each line into inside runs
+        order = np.lexsort((ucross, col))
+        col = col[order][0::2]
+        nstart = np.ceil((ucross[order][0::2]-u0[col])/slen)
+        nend = np.floor((ucross[order][1::2]-u0[col])/slen)
+        return col, nstart, nend
+
+    def plan_dipoles(self, tol, dip_len_max=None, dip_len_min=None, ratio=0.95, nstable=5,
+                     reference='polygon', method='scanline'):
+        '''
+        Choose the coarsest dipole spacing whose footprint area fraction is within `tol` of the reference area
+        fraction, and fill the crystal with dipoles at that spacing.
+
+        Area fractions are relative to the hexagon of side length `a` (the crystal planar axis length, or half
+        the polygon maximum dimension for polygons without `a`), and the footprint area is the number of
+        footprint dipoles times `dip_len**2`. Spacings from `dip_len_max` down to `dip_len_min` are tried in
+        steps of `ratio`, counting only the footprint dipoles from the scanline spans of each grid, so the full
+        dipole set is built once for the chosen spacing. Because the footprint error oscillates with the grid
+        alignment, a spacing is only chosen if it and the next `nstable`-1 finer spacings all meet `tol`.
+
+        Parameters
+        ----------
+        tol : float
+            The maximum absolute area fraction error.
+        dip_len_max : float, optional
+            The coarsest dipole spacing to try (default is 1/20 of the polygon maximum dimension).
+        dip_len_min : float, optional
+            The finest dipole spacing to try (default is 1/1000 of the polygon maximum dimension).
+        ratio : float, optional
+            The ratio between successive dipole spacings.
+        nstable : int, optional
+            The number of successive spacings that must meet `tol`.
+        reference : str, optional
+            The reference area fraction. 'polygon' uses the exact polygon area, which the footprint converges to,
+            and 'analytic' uses the analytic area fraction of `Hexagon`, `Stellar` or `BranchedPlanar` polygons
+            (`geometry.afrac_stellar` and `geometry.afrac_branched`).
+        method : str, optional
+            The `create_dipoles` fill method for the chosen spacing.
+
+        Returns
+        -------
+        plan : dict
+            The chosen `dip_len`, the number of dipoles `ndip` and the area fraction `error`. If no run of
+            spacings meets `tol`, the finest spacing is chosen.
+        '''
+        if not 0.<ratio<1.:
+            raise ValueError('ratio must be between 0 and 1.')
+        if nstable<1:
+            raise ValueError('nstable must be at least 1.')
+        poly = self.poly
+        dmax = poly.size()
+        if dip_len_max is None:
+            dip_len_max = dmax/20.
+        if dip_len_min is None:
+            dip_len_min = dmax/1000.
+        if not 0.<dip_len_min<=dip_len_max:
+            raise ValueError(f'dip_len_min ({dip_len_min}) must be positive and no larger than dip_len_max '
+                             f'({dip_len_max}).')
+
+        # get reference area fraction
+        a = getattr(poly, 'a', dmax/2.)
+        area_hex = 3.*np.sqrt(3.)/2.*a**2.
+        if reference=='polygon':
+            afrac_ref = poly.area/area_hex
+        elif reference=='analytic' and isinstance(poly, BranchedPlanar):
+            afrac_ref = afrac_branched(poly.a, poly.amax, poly.ac, poly.ft, poly.fb, poly.fg, poly.nsb)
+        elif reference=='analytic' and isinstance(poly, Stellar):
+            afrac_ref = afrac_stellar(poly.fbranch)
+        elif reference=='analytic' and isinstance(poly, Hexagon):
+            afrac_ref = 1.
+        else:
+            raise ValueError(f"no '{reference}' reference area fraction for {type(poly).__name__} polygons.")
+
+        # count footprint dipoles on each grid from coarse to fine spacing until a run of nstable
+        # spacings meets tol
+        run = []
+        dip_len = float(dip_len_max)
+        while dip_len>=dip_len_min and len(run)<nstable:
+            xg = np.linspace(-dmax/2., dmax/2., int(dmax/dip_len)+1)
+            row, start, end = scanline_spans(poly.x, poly.y, xg, xg)
+            error = abs(np.sum(end-start)*dip_len**2./area_hex-afrac_ref)
+            last = (dip_len, error)
+            run = run+[last] if error<=tol else []
+            dip_len = dip_len*ratio
+
+        dip_len, error = run[0] if len(run)==nstable else last
+        self.create_dipoles(dip_len, method=method)
+        plan = {'dip_len':dip_len, 'ndip':self.ndip, 'error':float(error)}
+        return plan
+
+    def set_dipoles(self, dipoles):
+        '''
+        Set the dipoles of the crystal from an existing `DipoleSet`.
+
+        Parameters
+        ----------
+        dipoles : DipoleSet
+            The dipole set of the crystal.
+
+        Returns
+        -------
+        None
+        '''
+        self.dipoles = dipoles
+        self._arrays = None
+        self._key = None
+        self.ndip = dipoles.ndip
+        return
+
+    def dipole_arrays(self):
+        '''
+        Get the 3d dipole index arrays, building them from the dipole footprint on first use.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        ix : ndarray
+            The x dipole indices.
+        iy : ndarray
+            The y dipole indices.
+        iz : ndarray
+            The z dipole indices.
+        '''
+        if self._arrays is None:
+            if self.dipoles is None:
+                self._arrays = (np.array([]), np.array([]), np.array([]))
+            else:
+                with stage('extrude') as st:
+                    self._arrays = self.dipoles.arrays(workers=self._workers)
+                    st.npoint = self.ndip
+        return self._arrays
+
+    @property
+    def ix(self):
+        '''
+        The x dipole indices.
+        '''
+        return self.dipole_arrays()[0]
+
+    @property
+    def iy(self):
+        '''
+        The y dipole indices.
+        '''
+        return self.dipole_arrays()[1]
+
+    @property
+    def iz(self):
+        '''
+        The z dipole indices.
+        '''
+        return self.dipole_arrays()[2]
+
+    @property
+    def weights(self):
+        '''
+        The area fraction weight of each dipole (in the order of the dipole arrays), or None if the dipoles
+        were not filled with `min_fraction`.
+        '''
+        if self.dipoles is None or self.dipoles.weight is None:
+            return None
+        return np.repeat(self.dipoles.weight, self.dipoles.column_sizes())
+
     def write_dipoles(self, file_name):
         '''
         Write the dipole indices to a file.
@@ -124,23 +702,59 @@ class Crystal:
         Parameters
         ----------
         file_name : str
-            The output file name.
+            The output file name (gzip compressed if it ends in '.gz').
+
+        If the crystal has a cache and the dipoles came from `create_dipoles`, the file is copied from the
+        cache when present, and stored in the cache otherwise.
         
         Returns
         -------
         None
         '''
-        if len(self.ix)>0:
+        cached = self.cache is not None and self._key is not None
+        if self.ndip>0 and cached and self.cache.get_file(self._key, file_name):
+            return
+        if self.ndip>0:
             # get bounding box of dipoles
-            dx = np.max(self.ix)
-            dy = np.max(self.iy)
-            dz = np.max(self.iz)
+            dx, dy, dz = self.dipoles.bbox[:,1]
         
             header = "#generated by crystal-dda\n"+\
                      "#shape: 'read'\n"+\
                     f"#box size: {dx:.0f}x{dy:.0f}x{dz:.0f}\n"
-            np.savetxt(file_name, np.c_[self.ix, self.iy, self.iz],
-                   fmt=('%d','%d','%d'), header=header, comments='')
+            with stage('write') as st:
+                if self.dipoles.kmin is None:
+                    ix, iy = self.dipoles.footprint()
+                    iz = np.arange(self.dipoles.ndipz)+1
+                    write_extruded(file_name, ix, iy, iz, ('%d','%d','%d'), header=header)
+                else:
+                    write_columns(file_name, [self.dipole_arrays()], ('%d','%d','%d'), header=header)
+                st.npoint = self.ndip
+            if cached:
+                self.cache.put_file(self._key, file_name)
+        else:
+            # no dipoles have been filled
+            print('error: dipoles have not been filled for this crystal.'
+                  ' try running create_dipoles() first.')
+        return
+
+    def write_packed(self, file_name):
+        '''
+        Write the dipoles to a packed binary file, with the crystal shape parameters in the file header.
+        The file is read with `packed.PackedDipoles`, which also converts it to an ADDA shape file.
+
+        Parameters
+        ----------
+        file_name : str
+            The output file name.
+
+        Returns
+        -------
+        None
+        '''
+        if self.ndip>0:
+            params = {k:np.asarray(v).tolist() for k, v in self.poly.params.items()}
+            c = None if callable(self.c) else float(self.c)
+            write_packed(file_name, self.dipoles, shape=type(self.poly).__name__, params=params, c=c)
         else:
             # no dipoles have been filled
             print('error: dipoles have not been filled for this crystal.'
@@ -154,7 +768,7 @@ class Crystal:
         Parameters
         ----------
         file_name : str
-            The output file name.
+            The output file name (gzip compressed if it ends in '.gz').
         dip_len : float
             The dipole length.
         
@@ -162,17 +776,21 @@ class Crystal:
         -------
         None
         '''
-
-        # scale and center points
-        x = self.ix*dip_len
-        y = self.iy*dip_len
-        z = self.iz*dip_len
-
-        if len(x)>0:
-            x = x-np.mean(x)
-            y = y-np.mean(y)
-            z = z-np.mean(z)
-        
+        if self.ndip>0:
+            if self.dipoles.kmin is None:
+                # scale and center footprint points and layers (means are taken over the
+                # extruded columns, one at a time, to keep the output unchanged)
+                ndipz = self.dipoles.ndipz
+                ix, iy = self.dipoles.footprint()
+                x = ix*dip_len
+                y = iy*dip_len
+                z = (np.arange(ndipz)+1)*dip_len
+                x = x-np.mean(np.repeat(x, ndipz))
+                y = y-np.mean(np.repeat(y, ndipz))
+                z = z-np.mean(np.tile(z, self.dipoles.nfoot))
+            else:
+                # scale and center the dipoles of columns with varying layer ranges
+                x, y, z = [ind*dip_len-np.mean(ind*dip_len) for ind in self.dipole_arrays()]
         
             # get bounding box of dipoles
             dx = np.max(x)-np.min(x)
@@ -182,10 +800,131 @@ class Crystal:
             header = "#generated by crystal-dda\n"+\
                      "#shape: 'read'\n"+\
                     f"#box size: {dx:.0f}x{dy:.0f}x{dz:.0f}"
-            np.savetxt(file_name, np.c_[x, y, z],
-                   fmt=('%.4f','%.4f','%.4f'), header=header, comments='')
+            with stage('write') as st:
+                if self.dipoles.kmin is None:
+                    write_extruded(file_name, x, y, z, ('%.4f','%.4f','%.4f'), header=header)
+                else:
+                    write_columns(file_name, [(x, y, z)], ('%.4f','%.4f','%.4f'), header=header)
+                st.npoint = self.ndip
         else:
             # no dipoles have been filled
             print('error: dipoles have not been filled for this crystal.'
                   ' try running create_dipoles() first.')
         return
+
+# function to get the footprint points of the grid rows i0:i1 of a crystal fill (a module function so
+# that it can run in a process pool)
+def _fill_band(xpoly, ypoly, xg, j0, j1, method):
+    # footprint points (i-major) in the band of grid rows xg[j0:j1] and the number of points in each column
+    if method=='scanline':
+        inband = scanline_fill(xpoly, ypoly, xg, xg[j0:j1])
+    else:
+        xg2, yg2 = np.meshgrid(xg, xg[j0:j1], indexing='ij')
+        inband = in_polygon(xpoly, ypoly, xg2.flatten(), yg2.flatten()).reshape(xg2.shape)
+    i, j = np.nonzero(inband)
+    return i, j+j0, np.bincount(i, minlength=len(xg))
+
+def _place_band(i_dip, j_dip, band, start):
+    # copy the footprint points of a band to their footprint positions, given the position of the first
+    # point of the band in each column
+    i, j, count = band
+    pos = np.arange(len(i))+np.repeat(start-(np.cumsum(count)-count), count)
+    i_dip[pos] = i
+    j_dip[pos] = j
+    return
+
+def growth_series(a, amax, ac, ft, fb, fg, nsb, c, dip_len, method='scanline'):
+    '''
+    Generate filled branched planar crystals for a series of sizes from a single fill of the full-size crystal.
+
+    A branched planar crystal of size `a` is the full-size crystal clipped by the hexagon of side length `a`,
+    so each footprint is taken from the full-size footprint with a hexagon test. All crystals share the dipole
+    grid of the full-size crystal, and the dipole indices of each crystal start at 1 as with `Crystal.create_dipoles`.
+    Grid points lying exactly on a clipping hexagon are counted as inside.
+
+    Parameters
+    ----------
+    a : array_like
+        The crystal planar axis lengths of the series.
+    amax : float
+        The maximum size that characterizes the crystal geometry.
+    ac : float
+        The hexagonal core axis length.
+    ft : float
+        The main branch tip width fraction.
+    fb : float
+        The branch fractional coverage.
+    fg : float
+        The gap fraction of the crystal.
+    nsb : int
+        The number of subbranches of the crystal.
+    c : float
+        The crystal basal-length dimension.
+    dip_len : float
+        The dipole spacing.
+    method : str, optional
+        The `Crystal.create_dipoles` fill method for the full-size crystal.
+
+    Yields
+    ------
+    cr : Crystal
+        The filled crystal for each size in `a`.
+    '''
+    # fill full-size crystal
+    cr_full = Crystal(BranchedPlanar(amax, amax, ac, ft, fb, fg, nsb), c)
+    cr_full.create_dipoles(dip_len, method=method)
+    dips = cr_full.dipoles
+    xfoot = dips.xg[dips.i]
+    yfoot = dips.xg[dips.j]
+
+    # clip full-size footprint for each size
+    for asize in np.atleast_1d(a):
+        inhex = in_hexagon(asize, xfoot, yfoot)
+        cr = Crystal(BranchedPlanar(asize, amax, ac, ft, fb, fg, nsb), c)
+        cr.set_dipoles(DipoleSet(dips.i[inhex], dips.j[inhex], dips.xg, dip_len, dips.ndipz))
+        yield cr
+
+def radial_thickness(c_center, c_edge, r_edge):
+    '''
+    Get a half thickness function that decreases linearly with distance from the crystal center.
+
+    Parameters
+    ----------
+    c_center : float
+        The half thickness at the crystal center.
+    c_edge : float
+        The half thickness at and beyond the distance `r_edge` from the center.
+    r_edge : float
+        The distance from the center where the half thickness reaches `c_edge`.
+
+    Returns
+    -------
+    c : callable
+        The half thickness function `c(x, y)` for `Crystal`.
+    '''
+    def c(x, y):
+        r = np.minimum(np.sqrt(x**2.+y**2.)/r_edge, 1.)
+        return c_center+(c_edge-c_center)*r
+    return c
+
+def core_thickness(c_core, c_branch, ac):
+    '''
+    Get a half thickness function that is `c_core` over a hexagonal core and `c_branch` outside of it.
+
+    Parameters
+    ----------
+    c_core : float
+        The half thickness of the hexagonal core.
+    c_branch : float
+        The half thickness outside of the core.
+    ac : float
+        The hexagonal core axis length.
+
+    Returns
+    -------
+    c : callable
+        The half thickness function `c(x, y)` for `Crystal`.
+    '''
+    def c(x, y):
+        return np.where(in_hexagon(ac, x, y), c_core, c_branch)
+    return c
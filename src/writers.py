@@ -0,0 +1,136 @@
+import gzip
+import numpy as np
+
+def open_text(file_name):
+    '''
+    Open a text file for writing, with gzip compression if the file name ends in '.gz'.
+
+    Parameters
+    ----------
+    file_name : str
+        The output file name.
+
+    Returns
+    -------
+    file : file object
+        The opened text file.
+    '''
+    if str(file_name).endswith('.gz'):
+        return gzip.open(file_name, 'wt')
+    return open(file_name, 'w')
+
+def format_rows(fmt, columns, newline='\n'):
+    '''
+    Format equal-length columns as text rows with a single formatting call.
+
+    Parameters
+    ----------
+    fmt : sequence of str
+        The format of each column (e.g., ('%d','%d','%d')).
+    columns : sequence of ndarray
+        The columns to format.
+    newline : str, optional
+        The string ending each row.
+
+    Returns
+    -------
+    text : str
+        The formatted rows, matching the output of `numpy.savetxt` with the same formats.
+    '''
+    nrow = len(columns[0])
+    row = ' '.join(fmt)+newline
+    values = np.column_stack(columns).ravel().tolist()
+    return (row*nrow) % tuple(values)
+
+def write_columns(file_name, chunks, fmt, header=''):
+    '''
+    Stream chunks of columns to a text file.
+
+    Parameters
+    ----------
+    file_name : str
+        The output file name (gzip compressed if it ends in '.gz').
+    chunks : iterable
+        The chunks of columns to write, each a sequence of equal-length ndarrays.
+    fmt : sequence of str
+        The format of each column.
+    header : str, optional
+        The header written before the rows.
+
+    Returns
+    -------
+    None
+    '''
+    with open_text(file_name) as f:
+        if len(header)>0:
+            f.write(header+'\n')
+        for chunk in chunks:
+            f.write(format_rows(fmt, chunk))
+    return
+
+def write_extruded(file_name, x, y, z, fmt, header='', chunk_size=65536):
+    '''
+    Stream an extruded set of points to a text file, with rows ordered by footprint point and then by
+    layer. Each footprint point and each layer value is formatted only once.
+
+    Parameters
+    ----------
+    file_name : str
+        The output file name (gzip compressed if it ends in '.gz').
+    x : ndarray
+        The x values of the footprint points.
+    y : ndarray
+        The y values of the footprint points.
+    z : ndarray
+        The z values of the layers.
+    fmt : sequence of str
+        The format of the x, y and z columns.
+    header : str, optional
+        The header written before the rows.
+    chunk_size : int, optional
+        The number of rows formatted at a time (at least the rows of one footprint point).
+
+    Returns
+    -------
+    None
+    '''
+    write_extruded_chunks(file_name, [(x, y)], z, fmt, header=header, chunk_size=chunk_size)
+    return
+
+def write_extruded_chunks(file_name, chunks, z, fmt, header='', chunk_size=65536):
+    '''
+    Stream chunks of footprint points, each extruded over the same layers, to a text file (see
+    `write_extruded`).
+
+    Parameters
+    ----------
+    file_name : str
+        The output file name (gzip compressed if it ends in '.gz').
+    chunks : iterable
+        The chunks of footprint points to write, each an (x, y) pair of equal-length ndarrays.
+    z : ndarray
+        The z values of the layers.
+    fmt : sequence of str
+        The format of the x, y and z columns.
+    header : str, optional
+        The header written before the rows.
+    chunk_size : int, optional
+        The number of rows formatted at a time (at least the rows of one footprint point).
+
+    Returns
+    -------
+    None
+    '''
+    # rows for all layers of a footprint point, with a placeholder for the point
+    layers = ''.join([('\x00'+fmt[2]+'\n')%zk for zk in np.asarray(z).tolist()])
+    npoint = max(1, chunk_size//max(len(z), 1))
+
+    with open_text(file_name) as f:
+        if len(header)>0:
+            f.write(header+'\n')
+        for x, y in chunks:
+            for start in range(0, len(x), npoint):
+                points = format_rows(fmt[:2], (x[start:start+npoint], y[start:start+npoint]),
+                                     newline=' \x01')
+                f.write(''.join([layers.replace('\x00', p) for p in points.split('\x01')[:-1]]))
+    return
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from crystal_dda.polygons import BranchedPlanar
+from crystal_dda.shapes import Crystal, core_thickness
+from crystal_dda.aggregate import Aggregate
+from crystal_dda.geometry import euler_matrix
+
+# create filled crystal object
+def create_crystal(c=0.1):
+    cr = Crystal(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5), c)
+    cr.create_dipoles(0.04)
+    return cr
+
+# set of dipole index triples with min index values of 1
+def index_set(ix, iy, iz):
+    ix, iy, iz = [np.rint(ind-np.min(ind)+1).astype(int) for ind in [ix, iy, iz]]
+    return set(zip(ix.tolist(), iy.tolist(), iz.tolist()))
+
+def test_aggregate_single():
+    for c in [0.1, core_thickness(0.2, 0.05, 0.3)]:
+        cr = create_crystal(c)
+        dips = cr.dipoles
+        ag = Aggregate(0.04)
+        ag.add(cr)
+        assert ag.ndip == cr.ndip
+        nz = dips.column_sizes()
+        assert index_set(*ag.arrays()) == index_set(np.repeat(dips.i, nz), np.repeat(dips.j, nz), cr.iz)
+
+        # quarter turns keep every dipole
+        ag = Aggregate(0.04)
+        ag.add(cr, rotation=euler_matrix(90., 90., 0.))
+        assert ag.ndip == cr.ndip
+
+def test_aggregate_union():
+    cr = create_crystal()
+    dips = cr.dipoles
+    ix, iy, iz = np.repeat(dips.i, dips.ndipz), np.repeat(dips.j, dips.ndipz), cr.iz
+    ag = Aggregate(0.04)
+    ag.add(cr)
+    ag.add(cr, offset=(0.4, 0., 0.08))
+    union = index_set(np.concatenate((ix, ix+10)), np.concatenate((iy, iy)), np.concatenate((iz, iz+2)))
+    assert ag.ndip == len(union)
+    assert index_set(*ag.arrays()) == union
+    assert np.array_equal(ag.bbox[:,1]-ag.bbox[:,0]+1, [np.max(ix)-np.min(ix)+11, np.max(iy)-np.min(iy)+1, 8])
+
+def test_aggregate_write(tmp_path):
+    cr = create_crystal()
+    ag = Aggregate(0.04)
+    for alpha in [0., 30., 60.]:
+        ag.add(cr, offset=(alpha/100., 0., 0.), rotation=euler_matrix(alpha, 45., 0.))
+    ag.write_dipoles(str(tmp_path/'aggregate.txt'))
+    ind = np.loadtxt(tmp_path/'aggregate.txt', dtype=int)
+    assert ind.shape == (ag.ndip, 3)
+    assert np.array_equal(np.min(ind, axis=0), [1, 1, 1])
+    assert len(index_set(*ind.T)) == ag.ndip
+
+def test_aggregate_errors():
+    with pytest.raises(ValueError):
+        Aggregate(0.04).build()
+    with pytest.raises(ValueError):
+        Aggregate(0.04).add(Crystal(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5), 0.1))
@@ -0,0 +1,37 @@
+import os
+import numpy as np
+import pytest
+from crystal_dda.polygons import BranchedPlanar
+from crystal_dda.shapes import Crystal
+from crystal_dda.batch import generate_batch
+
+def test_generate_batch(tmp_path):
+    a = np.array([1., 1.8, 2.5, 3.])
+    params = {'a':a, 'amax':np.full([4], 3.), 'ac':np.full([4], 0.3),
+              'ft':np.full([4], 0.2), 'fb':np.full([4], 0.3),
+              'fg':np.full([4], 0.6), 'nsb':np.full([4], 5)}
+    dip_len = [0.05, 0.05, 0.04, 0.04]
+    items = generate_batch(params, 0.1, dip_len, out_dir=tmp_path, workers=2)
+    items_serial = generate_batch(params, 0.1, dip_len, workers=1)
+
+    for i in range(4):
+        cr = Crystal(BranchedPlanar(a[i], 3., 0.3, 0.2, 0.3, 0.6, 5), 0.1)
+        cr.create_dipoles(dip_len[i])
+        for item in [items[i], items_serial[i]]:
+            assert item['index'] == i
+            assert item['ndip'] == cr.ndip
+            assert np.array_equal(item['dipoles'].arrays()[0], cr.ix)
+            assert np.array_equal(item['dipoles'].arrays()[1], cr.iy)
+        cr.write_dipoles(tmp_path/'ref.txt')
+        with open(items[i]['file']) as f, open(tmp_path/'ref.txt') as fref:
+            assert f.read() == fref.read()
+
+def test_generate_batch_error():
+    # failed items release the shared memory of the other items
+    params = {'a':np.full([6], 1.), 'amax':np.full([6], 3.), 'ac':np.full([6], 0.3),
+              'ft':np.full([6], 0.2), 'fb':np.full([6], 0.3),
+              'fg':np.full([6], 0.6), 'nsb':np.full([6], 5)}
+    blocks = set(os.listdir('/dev/shm'))
+    with pytest.raises(ValueError):
+        generate_batch(params, 0.1, [0.05, -0.05, 0.05, 0.05, 0.05, 0.05], workers=2)
+    assert set(os.listdir('/dev/shm')) <= blocks
@@ -0,0 +1,84 @@
+import os
+import gzip
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from crystal_dda.polygons import Hexagon, BranchedPlanar
+from crystal_dda.shapes import Crystal
+from crystal_dda.cache import DipoleCache, dipole_key
+
+def test_dipole_key():
+    bp = BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5)
+    key = dipole_key(bp, 0.1, 0.05)
+    assert key == dipole_key(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5), 0.1, 0.05)
+    assert key != dipole_key(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 6), 0.1, 0.05)
+    assert key != dipole_key(bp, 0.1, 0.04)
+    assert key != dipole_key(bp, 0.2, 0.05)
+
+def test_cache_hit(tmp_path):
+    cache = DipoleCache(str(tmp_path/'cache'))
+    args = (2.5, 3., 0.3, 0.2, 0.3, 0.6, 5)
+    cr = Crystal(BranchedPlanar(*args), 0.1, cache=cache)
+    cr.create_dipoles(0.05, method='scanline')
+    cr.write_dipoles(str(tmp_path/'miss.txt'))
+
+    # cache hit skips building the polygon
+    bp = BranchedPlanar(*args)
+    cr_hit = Crystal(bp, 0.1, cache=cache)
+    cr_hit.create_dipoles(0.05)
+    assert bp._x is None
+    assert cr_hit.ndip == cr.ndip
+    assert np.array_equal(cr_hit.ix, cr.ix)
+    assert np.array_equal(cr_hit.iy, cr.iy)
+    assert np.array_equal(cr_hit.iz, cr.iz)
+
+    # shapes with reassigned points are keyed by their points
+    hx = Hexagon(1.)
+    key = dipole_key(hx, 0.1, 0.05)
+    cr = Crystal(hx, 0.1, cache=cache)
+    cr.create_dipoles(0.05)
+    hx = Hexagon(1.)
+    hx.x = 2*hx.x
+    hx.y = 2*hx.y
+    assert dipole_key(hx, 0.1, 0.05) != key
+    cr_scaled = Crystal(hx, 0.1, cache=cache)
+    cr_scaled.create_dipoles(0.05)
+    cr_ref = Crystal(Hexagon(2.), 0.1)
+    cr_ref.create_dipoles(0.05)
+    assert cr_scaled.ndip == cr_ref.ndip > cr.ndip
+
+    # cached dipole files match written files
+    cr_hit.write_dipoles(str(tmp_path/'hit.txt'))
+    cr_hit.write_dipoles(str(tmp_path/'hit.txt.gz'))
+    text = open(tmp_path/'miss.txt').read()
+    assert open(tmp_path/'hit.txt').read() == text
+    assert gzip.open(tmp_path/'hit.txt.gz', 'rt').read() == text
+
+def test_cache_eviction(tmp_path):
+    cache = DipoleCache(str(tmp_path))
+    keys = []
+    for a in [0.5, 0.6, 0.7]:
+        cr = Crystal(Hexagon(a), 0.1, cache=cache)
+        cr.create_dipoles(0.02)
+        keys.append(cr._key)
+        time.sleep(0.01)
+
+    # use first entry, then shrink cache to two entries
+    assert cache.get(keys[0]) is not None
+    cache.max_bytes = cache.nbytes()-1
+    cache.evict()
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+
+def put_dipoles(directory):
+    cr = Crystal(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5), 0.1, cache=DipoleCache(directory))
+    cr.create_dipoles(0.02)
+    return cr._key
+
+def test_cache_concurrent(tmp_path):
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        keys = list(pool.map(put_dipoles, [str(tmp_path)]*8))
+    assert len(set(keys)) == 1
+    assert os.listdir(tmp_path) == [keys[0]+'.npz']
+    assert DipoleCache(str(tmp_path)).get(keys[0]) is not None
@@ -0,0 +1,102 @@
+import numpy as np
+from crystal_dda.polygons import Hexagon, BranchedPlanar
+from crystal_dda.shapes import Crystal, core_thickness, radial_thickness
+from crystal_dda.cache import DipoleCache
+
+# create filled crystal object
+def create_crystal():
+    bp = BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5)
+    cr = Crystal(bp, 0.1)
+    cr.create_dipoles(0.04)
+    return cr
+
+def test_dipole_set():
+    cr = create_crystal()
+    dips = cr.dipoles
+    assert dips.i.dtype == np.int16
+    assert dips.ndip == cr.ndip
+    assert dips.ndip == dips.nfoot*dips.ndipz
+    assert cr._arrays is None
+
+    # compare lazy properties with full 3d arrays
+    ix, iy, iz = dips.arrays()
+    bbox = np.array([[np.min(ix), np.max(ix)],
+                     [np.min(iy), np.max(iy)],
+                     [np.min(iz), np.max(iz)]])
+    assert np.array_equal(dips.bbox, bbox)
+
+def test_layers():
+    cr = create_crystal()
+    nlayer = 0
+    for ix, iy, iz in cr.dipoles.layers():
+        ind = (cr.iz==iz)
+        assert np.array_equal(ix, cr.ix[ind])
+        assert np.array_equal(iy, cr.iy[ind])
+        nlayer = nlayer+1
+    assert nlayer == cr.dipoles.ndipz
+
+def test_columns_constant():
+    cr = create_crystal()
+    cr_col = Crystal(cr.poly, lambda x, y:0.1)
+    cr_col.create_dipoles(0.04)
+    assert cr_col.dipoles.kmin is not None
+    assert cr_col.ndip == cr.ndip
+    assert np.array_equal(cr_col.ix, cr.ix)
+    assert np.array_equal(cr_col.iy, cr.iy)
+    assert np.array_equal(cr_col.iz, cr.iz)
+
+def test_columns_tall():
+    # layer indices beyond the range of the footprint index type
+    cr = Crystal(Hexagon(0.05), 400.)
+    cr.create_dipoles(0.01)
+    cr_col = Crystal(Hexagon(0.05), lambda x, y:400.+0.*x)
+    cr_col.create_dipoles(0.01)
+    assert cr_col.dipoles.ndipz == cr.dipoles.ndipz > np.iinfo(cr_col.dipoles.i.dtype).max
+    assert np.max(cr_col.dipoles.kmax) == cr.dipoles.ndipz-1
+    assert cr_col.ndip == cr.ndip
+
+def test_columns():
+    bp = BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5)
+    for c in [core_thickness(0.2, 0.05, 0.3), radial_thickness(0.25, 0.02, 2.5)]:
+        cr = Crystal(bp, c)
+        cr.create_dipoles(0.04)
+        dips = cr.dipoles
+
+        # compare with point test of each grid point in the footprint box
+        full = Crystal(bp, 0.1)
+        full.create_dipoles(0.04)
+        xfoot = full.dipoles.xg[full.dipoles.i]
+        yfoot = full.dipoles.xg[full.dipoles.j]
+        zg = (np.arange(dips.ndipz)-(dips.ndipz-1)/2.)*0.04
+        inside = np.abs(zg[None,:])<=c(xfoot, yfoot)[:,None]
+        assert cr.ndip == np.sum(inside)
+        ifoot, kfoot = np.nonzero(inside)
+        ix, iy = full.dipoles.footprint()
+        assert np.array_equal(cr.ix, ix[ifoot]-np.min(ix[ifoot])+1)
+        assert np.array_equal(cr.iy, iy[ifoot]-np.min(iy[ifoot])+1)
+        assert np.array_equal(cr.iz, kfoot+1)
+        assert np.array_equal(dips.bbox[2], [np.min(cr.iz), np.max(cr.iz)])
+
+        # layers match full arrays
+        for ix_layer, iy_layer, iz in dips.layers():
+            ind = (cr.iz==iz)
+            assert np.array_equal(ix_layer, cr.ix[ind])
+            assert np.array_equal(iy_layer, cr.iy[ind])
+
+def test_columns_cache(tmp_path):
+    cr = Crystal(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5), core_thickness(0.2, 0.05, 0.3))
+    cr.create_dipoles(0.04)
+    cache = DipoleCache(str(tmp_path))
+    cache.put('columns', cr.dipoles)
+    dips = cache.get('columns')
+    assert np.array_equal(dips.kmin, cr.dipoles.kmin)
+    assert np.array_equal(dips.kmax, cr.dipoles.kmax)
+    assert dips.ndip == cr.ndip
+
+    # rows of written files
+    cr.write_dipoles(str(tmp_path/'dipoles.txt'))
+    cr.write_points(str(tmp_path/'points.txt'), 0.04)
+    assert np.loadtxt(tmp_path/'dipoles.txt').shape == (cr.ndip, 3)
+    points = np.loadtxt(tmp_path/'points.txt')
+    assert points.shape == (cr.ndip, 3)
+    assert np.allclose(np.mean(points, axis=0), 0., atol=1e-4)
@@ -0,0 +1,157 @@
+import numpy as np
+from crystal_dda.polygons import Hexagon, Stellar, BranchedPlanar
+from crystal_dda.geometry import in_polygon, scanline_fill, afrac_branched, dep_afrac_branched
+from crystal_dda.geometry import afrac_dda_subregion, afrac_stellar, polygon_area, triangulate
+from crystal_dda.geometry import points_in_polygon, euler_matrix, cell_fractions, clip_halfplane
+from crystal_dda.geometry import edge_index, points_in_index
+from crystal_dda.polygon_utils import hexagon, stellar, branched_planar, branched_planar_batch
+
+# set of polygons to test fill methods against
+def polygon_corpus():
+    polys = [Hexagon(1.), Hexagon(0.7), Stellar(0.3, 1.), Stellar(0.5, 2.),
+             BranchedPlanar(0.5, 3., 0.3, 0.3, 0.4, 0.6, 4),
+             BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5),
+             BranchedPlanar(3., 3., 0.1, 0.4, 0.5, 0.3, 5),
+             BranchedPlanar(3., 3., 0.2, 0.2, 0.6, 0.5, 12)]
+    return polys
+
+def test_scanline_fill():
+    for poly in polygon_corpus():
+        for dip_len in [0.1, 0.05, 0.013]:
+            dmax = poly.size()
+            xg = np.linspace(-dmax/2., dmax/2., int(dmax/dip_len)+1)
+            xg2, yg2 = np.meshgrid(xg, xg, indexing='ij')
+            inpoly = in_polygon(poly.x, poly.y, xg2.flatten(), yg2.flatten())
+            inscan = scanline_fill(poly.x, poly.y, xg, xg)
+            assert np.array_equal(inscan.flatten(), inpoly)
+
+def test_afrac_branched():
+    a = np.array([0.2, 0.3, 1., 1.8, 3.])
+    afrac_test = np.array([1., 1., 0.5359436391255565, 0.4338251581518231, 0.29471870248238136])
+    dep_afrac_test = np.array([1., 1., 0.42353117080396896, 0.3686284282244272, 0.10117705693465631])
+    assert np.array_equal(afrac_branched(a, 3., 0.3, 0.2, 0.3, 0.6, 5), afrac_test)
+    assert np.array_equal(dep_afrac_branched(a, 3., 0.3, 0.2, 0.3, 0.6, 5), dep_afrac_test)
+    assert afrac_branched(2., 3., 0.3, 0.2, 0.3, 1., 5) == 0.42075149518337357
+
+def test_afrac_branched_broadcast():
+    rng = np.random.default_rng(0)
+    amax = rng.uniform(1., 4., 200)
+    a = rng.uniform(0., 1., 200)*amax
+    ac = rng.uniform(0.05, 0.3, 200)*amax
+    ft = rng.uniform(0.1, 0.6, 200)
+    fb = rng.uniform(0.2, 0.8, [3,1])
+    fg = rng.uniform(0.2, 1., 200)
+    nsb = rng.integers(1, 12, 200)
+    for func in [afrac_branched, dep_afrac_branched]:
+        afrac = func(a, amax, ac, ft, fb, fg, nsb)
+        assert afrac.shape == (3,200)
+        for i in range(3):
+            for j in range(200):
+                afrac_scalar = func(a[j], amax[j], ac[j], ft[j], fb[i,0], fg[j], nsb[j])
+                assert np.ndim(afrac_scalar) == 0
+                assert afrac_scalar == afrac[i,j]
+
+def test_afrac_dda_subregion():
+    xhex, yhex = hexagon(1.)
+    assert np.abs(afrac_dda_subregion(xhex, yhex, *hexagon(2.))-1.) < 1.e-12
+    assert np.abs(afrac_dda_subregion(xhex, yhex, *hexagon(0.5))-0.25) < 1.e-12
+    xst, yst = stellar(0.3, 1.)
+    assert np.abs(afrac_dda_subregion(xhex, yhex, xst, yst)-afrac_stellar(0.3)) < 1.e-12
+
+    # monte carlo estimate is reproducible with seed
+    afrac_mc = afrac_dda_subregion(xhex, yhex, xst, yst, method='random', seed=0)
+    assert afrac_mc == afrac_dda_subregion(xhex, yhex, xst, yst, method='random', seed=0)
+    assert np.abs(afrac_mc-afrac_stellar(0.3)) < 0.02
+
+def test_afrac_dda_subregion_batch():
+    # clipping full size crystal at a gives area of crystal with size a
+    a = np.array([0.5, 1.2, 2., 2.7])
+    xhex, yhex = hexagon(2.)
+    x, y = branched_planar(3., 3., 0.3, 0.2, 0.3, 0.6, 5)
+    xb, yb, offsets = branched_planar_batch(a, 3., 0.3, 0.2, 0.3, 0.6, 5)
+    x05, y05 = branched_planar(0.5, 3., 0.3, 0.2, 0.3, 0.6, 5)
+    afrac = afrac_dda_subregion(xhex, yhex, [x, x05], [y, y05])
+    assert np.abs(afrac[0]-polygon_area(*branched_planar(2., 3., 0.3, 0.2, 0.3, 0.6, 5))/
+                  polygon_area(xhex, yhex)) < 1.e-12
+    assert np.abs(afrac[1]-polygon_area(x05, y05)/polygon_area(xhex, yhex)) < 1.e-12
+
+    afrac = afrac_dda_subregion(xhex, yhex, xb, yb, offsets=offsets)
+    for i in range(len(a)):
+        afrac_i = afrac_dda_subregion(xhex, yhex, xb[offsets[i]:offsets[i+1]], yb[offsets[i]:offsets[i+1]])
+        assert np.abs(afrac[i]-afrac_i) < 1.e-12
+
+def test_triangulate():
+    polys = polygon_corpus()+[BranchedPlanar(1., 2., 0.5, 0.4, 0.5, 0.9, 9),
+                              BranchedPlanar(2., 3., 0.3, 0.5, 0.8, 0.3, 15)]
+    for poly in polys:
+        tris = triangulate(poly.x, poly.y)
+        x = poly.x[tris]
+        y = poly.y[tris]
+        area = 0.5*((x[:,1]-x[:,0])*(y[:,2]-y[:,0])-(y[:,1]-y[:,0])*(x[:,2]-x[:,0]))
+        assert np.all(area>0.)
+        assert np.abs(np.sum(area)-poly.area) < 1.e-12*poly.area
+
+    # squares with points along the edges
+    x = np.array([0., 1., 2., 2., 2., 1., 0., 0.])
+    y = np.array([0., 0., 0., 1., 2., 2., 2., 1.])
+    tris = triangulate(x, y)
+    assert len(tris) == 6
+    assert np.array_equal(np.unique(tris), np.arange(8))
+
+def test_points_in_polygon():
+    rng = np.random.default_rng(3)
+    for poly in polygon_corpus():
+        dmax = poly.size()
+        x, y = rng.uniform(-dmax/2., dmax/2., [2, 20000])
+
+        # include grid points, which lie on polygon edges and vertices
+        xg = np.linspace(-dmax/2., dmax/2., int(dmax/0.05)+1)
+        xg2, yg2 = np.meshgrid(xg, xg, indexing='ij')
+        x = np.concatenate((x, xg2.flatten()))
+        y = np.concatenate((y, yg2.flatten()))
+        assert np.array_equal(points_in_polygon(poly.x, poly.y, x, y), in_polygon(poly.x, poly.y, x, y))
+
+def test_points_in_index():
+    rng = np.random.default_rng(4)
+    for poly in polygon_corpus():
+        dmax = poly.size()
+        x, y = rng.uniform(-dmax/2., dmax/2., [2, 5000])
+
+        # include grid points, which lie on polygon edges and vertices
+        xg = np.linspace(-dmax/2., dmax/2., int(dmax/0.05)+1)
+        xg2, yg2 = np.meshgrid(xg, xg, indexing='ij')
+        x = np.concatenate((x, xg2.flatten()))
+        y = np.concatenate((y, yg2.flatten()))
+        inpoly = points_in_polygon(poly.x, poly.y, x, y)
+        for nband in [None, 3, 40]:
+            index = edge_index(poly.x, poly.y, nband)
+            assert np.array_equal(points_in_index(index, x, y, chunk_size=3000), inpoly)
+
+def test_cell_fractions():
+    for poly in polygon_corpus():
+        dmax = poly.size()
+        xg = np.linspace(-dmax/2., dmax/2., int(dmax/0.2)+1)
+        dx = xg[1]-xg[0]
+        i, j, frac = cell_fractions(poly.x, poly.y, xg, xg)
+        inpoly = scanline_fill(poly.x, poly.y, xg, xg)
+
+        # clip copies of the polygon to every grid cell
+        xg2, yg2 = [ind.flatten() for ind in np.meshgrid(xg, xg, indexing='ij')]
+        xc, yc = np.tile(poly.x, len(xg2)), np.tile(poly.y, len(xg2))
+        offsets = np.arange(len(xg2)+1)*len(poly.x)
+        for nx, ny, d in [(-1., 0., -xg2), (1., 0., xg2), (0., -1., -yg2), (0., 1., yg2)]:
+            xc, yc, offsets = clip_halfplane(xc, yc, offsets, nx, ny, d+dx/2.)
+        frac_all = (polygon_area(xc, yc, offsets)/dx**2.).reshape(inpoly.shape)
+
+        # crossed cells have the clipped fractions and other cells are all inside or outside
+        assert np.allclose(frac, frac_all[i,j], rtol=0., atol=1.e-12)
+        crossed = np.zeros(inpoly.shape, dtype=bool)
+        crossed[i,j] = True
+        assert np.allclose(frac_all[~crossed], inpoly[~crossed], rtol=0., atol=1.e-12)
+        assert np.isclose((np.sum(inpoly[~crossed])+np.sum(frac))*dx**2., polygon_area(poly.x, poly.y))
+
+def test_euler_matrix():
+    rot = euler_matrix(30., 60., 10.)
+    assert np.allclose(rot@rot.T, np.eye(3), atol=1.e-15)
+    assert np.isclose(np.linalg.det(rot), 1.)
+    assert np.array_equal(euler_matrix(0., 90., 0.), [[0., 0., 1.], [0., 1., 0.], [-1., 0., 0.]])
@@ -0,0 +1,15 @@
+import sys
+import subprocess
+
+# import crystal_dda modules in a fresh interpreter and get the loaded modules (import times are
+# benchmarked in benchmarks/bench_output.py)
+def import_modules(modules):
+    code = 'import sys\n'+''.join([f'import {m}\n' for m in modules])+\
+           'print(" ".join(sorted(sys.modules)))'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+def test_fill_imports():
+    loaded = import_modules(['crystal_dda.shapes', 'crystal_dda.batch'])
+    heavy = ['matplotlib', 'pyvista', 'vtk', 'scipy']
+    assert [m for m in loaded if m.split('.')[0] in heavy] == []
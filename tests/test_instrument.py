@@ -0,0 +1,53 @@
+from crystal_dda.polygons import BranchedPlanar
+from crystal_dda.shapes import Crystal
+from crystal_dda.instrument import Recorder, stage, _recorder
+from crystal_dda.cache import DipoleCache
+
+def test_recorder_stages():
+    seen = []
+    with Recorder(callback=seen.append) as rec:
+        cr = Crystal(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5), 0.1)
+        cr.create_dipoles(0.05)
+        cr.ix
+    assert _recorder.get() is None
+    assert seen == rec.records
+
+    names = [record['stage'] for record in rec.records]
+    assert names == ['branched_planar', 'size', 'grid', 'fill', 'footprint', 'extrude']
+    totals = rec.summary()
+    assert totals['branched_planar']['npoint'] == len(cr.poly.x)
+    assert totals['fill']['npoint'] == cr.dipoles.xg.size**2
+    assert totals['footprint']['npoint'] == cr.dipoles.nfoot
+    assert totals['extrude']['npoint'] == cr.ndip
+    assert all([total['count'] == 1 and total['time'] >= 0. for total in totals.values()])
+    assert all([total['peak_alloc'] is None for total in totals.values()])
+
+def test_recorder_cache(tmp_path):
+    # cache hits record the footprint points of the cached dipoles
+    cache = DipoleCache(str(tmp_path/'cache'))
+    cr = Crystal(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5), 0.1, cache=cache)
+    cr.create_dipoles(0.05)
+    with Recorder() as rec:
+        cr_hit = Crystal(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5), 0.1, cache=cache)
+        cr_hit.create_dipoles(0.05)
+    assert [record['stage'] for record in rec.records] == ['cache_get']
+    assert rec.records[0]['npoint'] == cr.dipoles.nfoot > 0
+
+def test_recorder_memory():
+    with Recorder(memory=True) as rec:
+        cr = Crystal(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5), 0.1)
+        cr.create_dipoles(0.01)
+    totals = rec.summary()
+
+    # fill allocates at least the boolean grid
+    assert totals['fill']['peak_alloc'] >= cr.dipoles.xg.size**2
+    assert all([total['peak_alloc'] >= 0 for total in totals.values()])
+
+def test_recorder_off():
+    with stage('fill') as st:
+        st.npoint = 10
+    assert st.npoint == 0
+
+    rec = Recorder()
+    Crystal(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5), 0.1).create_dipoles(0.05)
+    assert rec.records == []
@@ -0,0 +1,52 @@
+import numpy as np
+from crystal_dda.polygons import Hexagon, Stellar, BranchedPlanar
+from crystal_dda.shapes import Crystal
+from crystal_dda.mesh import extrude, face_normals
+
+def test_extrude_closed():
+    polys = [Hexagon(1.), Stellar(0.3, 1.),
+             BranchedPlanar(0.5, 3., 0.3, 0.3, 0.4, 0.6, 4),
+             BranchedPlanar(3., 3., 0.2, 0.2, 0.6, 0.5, 12)]
+    for poly in polys:
+        points, faces = extrude(poly.x, poly.y, 0.1)
+
+        # each edge is shared by two faces in opposite directions
+        edges = np.concatenate((faces[:,[0,1]], faces[:,[1,2]], faces[:,[2,0]]))
+        assert len(np.unique(edges, axis=0)) == len(edges)
+        assert np.array_equal(np.unique(edges, axis=0), np.unique(edges[:,::-1], axis=0))
+
+        # enclosed volume from the divergence theorem
+        p0, p1, p2 = points[faces[:,0]], points[faces[:,1]], points[faces[:,2]]
+        volume = np.sum(p0*np.cross(p1, p2))/6.
+        assert np.abs(volume-poly.area*0.2) < 1.e-12
+
+def test_write_mesh(tmp_path):
+    cr = Crystal(BranchedPlanar(0.5, 3., 0.3, 0.3, 0.4, 0.6, 4), 0.1)
+    points, faces = cr.mesh_arrays()
+
+    cr.write_mesh(str(tmp_path/'crystal.stl'))
+    data = open(tmp_path/'crystal.stl', 'rb').read()
+    assert int(np.frombuffer(data[80:84], dtype='<u4')[0]) == len(faces)
+    assert len(data) == 84+50*len(faces)
+    facets = np.frombuffer(data[84:], dtype=[('normal', '<f4', 3), ('corners', '<f4', (3,3)),
+                                             ('attribute', '<u2')])
+    assert np.allclose(facets['corners'], points[faces], atol=1.e-7)
+    assert np.allclose(facets['normal'], face_normals(points, faces), atol=1.e-6)
+
+    cr.write_mesh(str(tmp_path/'crystal_ascii.stl'), binary=False)
+    lines = open(tmp_path/'crystal_ascii.stl').read().splitlines()
+    assert len(lines) == 2+7*len(faces)
+    assert lines[0] == 'solid crystal'
+
+    cr.write_mesh(str(tmp_path/'crystal.obj'))
+    lines = open(tmp_path/'crystal.obj').read().splitlines()
+    vertices = np.array([l.split()[1:] for l in lines if l.startswith('v ')], dtype=float)
+    obj_faces = np.array([l.split()[1:] for l in lines if l.startswith('f ')], dtype=int)-1
+    assert np.allclose(vertices, points)
+    assert np.array_equal(obj_faces, faces)
+
+def test_create_mesh():
+    poly = Stellar(0.3, 1.)
+    mesh = Crystal(poly, 0.1).create_mesh()
+    assert mesh.n_cells == len(extrude(poly.x, poly.y, 0.1)[1])
+    assert np.abs(mesh.volume-poly.area*0.2) < 1.e-9
@@ -0,0 +1,44 @@
+import gzip
+import numpy as np
+import pytest
+from crystal_dda.polygons import Hexagon, BranchedPlanar
+from crystal_dda.shapes import Crystal, core_thickness
+from crystal_dda.packed import PackedDipoles
+
+# create filled crystals with full columns, layer ranges and layer runs
+def create_crystals():
+    bp = BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5)
+    crystals = [Crystal(Hexagon(1.), 0.13), Crystal(bp, 0.13), Crystal(bp, core_thickness(0.2, 0.05, 0.3))]
+    for cr in crystals:
+        cr.create_dipoles(0.037)
+    cr = Crystal(bp, 0.1)
+    cr.create_dipoles_rotated(0.037, 30., 60., 10.)
+    crystals.append(cr)
+    return crystals
+
+def test_packed_roundtrip(tmp_path):
+    for cr, mode in zip(create_crystals(), ['footprint', 'footprint', 'grid', 'grid']):
+        cr.write_dipoles(tmp_path/'ref.txt')
+        ref = (tmp_path/'ref.txt').read_bytes()
+        cr.write_packed(tmp_path/'dipoles.dpk')
+        assert (tmp_path/'dipoles.dpk').stat().st_size < len(ref)
+
+        packed = PackedDipoles(tmp_path/'dipoles.dpk')
+        assert packed.mode == mode
+        assert packed.ndip == cr.ndip
+        assert packed.dip_len == cr.dipoles.dip_len
+        assert packed.header['crystal'] == type(cr.poly).__name__
+        assert packed.header['c'] == (None if callable(cr.c) else cr.c)
+
+        # indices (as written to text files) and text file match those of the crystal
+        for ind, ind_packed in zip(cr.dipole_arrays(), packed.arrays()):
+            assert np.array_equal(np.trunc(ind), ind_packed)
+        packed.write_dipoles(tmp_path/'packed.txt.gz', slab_size=7)
+        assert gzip.open(tmp_path/'packed.txt.gz', 'rb').read() == ref
+
+def test_packed_errors(tmp_path):
+    (tmp_path/'dipoles.txt').write_text('#generated by crystal-dda\n')
+    with pytest.raises(ValueError):
+        PackedDipoles(tmp_path/'dipoles.txt')
+    Crystal(Hexagon(1.), 0.13).write_packed(tmp_path/'dipoles.dpk')
+    assert not (tmp_path/'dipoles.dpk').exists()
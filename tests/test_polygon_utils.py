@@ -1,5 +1,7 @@
 import numpy as np
-from crystal_dda.polygon_utils import hexagon
+from crystal_dda.polygon_utils import hexagon, branched_planar, branched_planar_batch
+from crystal_dda.polygon_utils import hexagon_batch, stellar, stellar_batch, stellar_triangle
+from crystal_dda.geometry import rotate
 
 def test_hexagon():
     x, y = hexagon(1.)
@@ -8,3 +10,94 @@ def test_hexagon():
                            [0.,0.8660254,0.8660254,0.,-0.8660254,-0.8660254,0.]])
     diff = np.sum((points-points_test)**2.)
     assert diff<1.e-6
+
+def test_stellar_batch():
+    fbranch = np.array([0.1, 0.3, 0.77])
+    a = np.array([[0.5], [2.3]])
+    x, y, offsets = stellar_batch(fbranch, a)
+    assert np.array_equal(offsets, np.arange(7)*25)
+    for k, (fb, ak) in enumerate(zip(*[p.ravel() for p in np.broadcast_arrays(fbranch, a)])):
+        # stellar triangles inserted in each hexagon side
+        xh, yh = hexagon(ak)
+        xp, yp = [xh[0]], [yh[0]]
+        for i in range(6):
+            p1 = np.array([xh[i], yh[i]])
+            p2 = np.array([xh[i+1], yh[i+1]])
+            s1, s2, s3 = stellar_triangle(fb, p1, p2)
+            xp += [s1[0], s3[0], s2[0], p2[0]]
+            yp += [s1[1], s3[1], s2[1], p2[1]]
+        assert np.array_equal(x[offsets[k]:offsets[k+1]], xp)
+        assert np.array_equal(y[offsets[k]:offsets[k+1]], yp)
+        assert np.array_equal(stellar(fb, ak)[0], xp)
+
+    x, y, offsets = hexagon_batch([1., 2.])
+    assert np.array_equal(x[7:], 2.*hexagon(1.)[0])
+
+# first sectors of branched planar polygons from the original (loop) builder, for parameter sets where its
+# crossing loop did not skip any crossings
+branched_planar_sectors = [
+    ((1.0, 3., 0.5, 0.3, 0.8, 0.2, 1), 37,
+     [-0.5, -0.25, -0.0, -0.0, 0.0, 0.25, 0.5],
+     [0.8660254037844386, 0.8660254037844386, 0.4330127018922193, 0.4330127018922193, 0.4330127018922193,
+      0.8660254037844386, 0.8660254037844386]),
+    ((1.8, 3., 0.3, 0.2, 0.4, 0.6, 2), 97,
+     [-0.9, -0.7500000000000001, -0.43875000000000003, -0.12750000000000006, -0.03891509433962276, -0.0,
+      -0.16875, -0.0, -0.0, 0.0, 0.16875, 0.0, 0.03891509433962276, 0.12750000000000006, 0.43875000000000003,
+      0.7500000000000001, 0.9],
+     [1.5588457268119895, 1.5588457268119895, 1.0197449129561766, 1.5588457268119895, 1.5588457268119895,
+      0.8443747686898277, 0.5520911949125796, 0.25980762113533157, 0.25980762113533157, 0.25980762113533157,
+      0.5520911949125796, 0.8443747686898277, 1.5588457268119895, 1.5588457268119895, 1.0197449129561766,
+      1.5588457268119895, 1.5588457268119895]),
+    ((2.9, 3., 0.3, 0.3, 0.4, 0.6, 2), 133,
+     [-1.45, -1.2999999999999998, -1.11375, -0.9360849056603772, -0.5794811320754716, -0.84375,
+      -0.43875000000000003, -0.044575471698113336, -0.0, -0.16875, -0.0, -0.0, 0.0, 0.16875, 0.0,
+      0.044575471698113336, 0.43875000000000003, 0.84375, 0.5794811320754716, 0.9360849056603772, 1.11375,
+      1.2999999999999998, 1.45],
+     [2.5114736709748717, 2.5114736709748717, 2.1888792080651687, 2.496604178192913, 2.178952596125564,
+      1.7212254900215715, 1.0197449129561766, 1.7024752230245408, 0.8443747686898277, 0.5520911949125796,
+      0.25980762113533157, 0.25980762113533157, 0.25980762113533157, 0.5520911949125796, 0.8443747686898277,
+      1.7024752230245408, 1.0197449129561766, 1.7212254900215715, 2.178952596125564, 2.496604178192913,
+      2.1888792080651687, 2.5114736709748717, 2.5114736709748717])]
+
+def check_sectors(x, y, npoint, xsec, ysec):
+    # first sector matches and the other sectors are its rotations
+    assert len(x) == npoint
+    nsec = len(xsec)-1
+    assert np.array_equal(x[:nsec+1], xsec)
+    assert np.array_equal(y[:nsec+1], ysec)
+    for k in range(1, 6):
+        xrot, yrot = rotate(np.array(xsec), np.array(ysec), -60.*k)
+        assert np.array_equal(x[k*nsec+1:(k+1)*nsec+1], xrot[1:])
+        assert np.array_equal(y[k*nsec+1:(k+1)*nsec+1], yrot[1:])
+
+def test_branched_planar():
+    for args, npoint, xsec, ysec in branched_planar_sectors:
+        check_sectors(*branched_planar(*args), npoint, xsec, ysec)
+
+def test_branched_planar_batch():
+    params = np.array([args for args, npoint, xsec, ysec in branched_planar_sectors])
+    x, y, offsets = branched_planar_batch(*params.T[:6], params[:,6].astype(int))
+    assert len(offsets) == len(params)+1
+    for i, (args, npoint, xsec, ysec) in enumerate(branched_planar_sectors):
+        check_sectors(x[offsets[i]:offsets[i+1]], y[offsets[i]:offsets[i+1]], npoint, xsec, ysec)
+
+def test_branched_planar_crossings():
+    # the clipping line crosses sub-branch edges after an earlier crossing, which the original builder
+    # skipped (cutting the sub-branch tips with 73 points instead of 85)
+    x, y = branched_planar(1.21, 3., 0.21, 0.29, 0.1, 0.57, 1)
+    xsec = [-0.605, -0.5, -0.48825, -0.47650000000000003, -0.19750000000000006, -0.34875, -0.0, -0.0, 0.0,
+            0.34875, 0.19750000000000006, 0.47650000000000003, 0.48825, 0.5, 0.605]
+    ysec = [1.0478907385791707, 1.0478907385791707, 1.0275391415902364, 1.0478907385791707, 1.0478907385791707,
+            0.7859180539343781, 0.1818653347947321, 0.1818653347947321, 0.1818653347947321, 0.7859180539343781,
+            1.0478907385791707, 1.0478907385791707, 1.0275391415902364, 1.0478907385791707, 1.0478907385791707]
+    check_sectors(x, y, 85, xsec, ysec)
+
+def test_branched_planar_main_branch_clip():
+    # clipping line crosses the main branch after the last sub-branch
+    a, amax, ac, fb, nsb = 2.9, 3., 0.3, 0.3, 5
+    x, y = branched_planar(a, amax, ac, 0.2, fb, 0.6, nsb)
+    wmb = min(fb*(amax-ac)/nsb/np.sqrt(3.), ac/2.)
+    ya = np.sqrt(3.)/2.*a
+    xa = ac/2.-wmb+(ya-np.sqrt(3.)/2.*ac)/np.sqrt(3.)
+    assert np.min((x-xa)**2.+(y-ya)**2.) < 1.e-12
+    assert np.max(y) <= ya
@@ -1,5 +1,7 @@
 import numpy as np
-from crystal_dda.polygons import Hexagon, Stellar, BranchedPlanar
+from crystal_dda.polygons import Polygon, Hexagon, Stellar, BranchedPlanar, PolygonBatch
+from crystal_dda.geometry import in_polygon
+import pytest
 import matplotlib.pyplot as plt
 
 def test_hexagon():
@@ -86,3 +88,73 @@ def plot_branched_planar():
     ax.set_aspect(1.)
     plt.savefig('test.png')
     return
+
+def test_size_brute_force():
+    rng = np.random.default_rng(3)
+    polys = [Stellar(0.3, 1.), BranchedPlanar(0.5, 3., 0.3, 0.3, 0.4, 0.6, 4)]
+    for k in range(50):
+        polys.append(BranchedPlanar(rng.uniform(0.2, 3.), 3., 0.3, rng.uniform(0.1, 0.6),
+                                    rng.uniform(0.2, 0.8), rng.uniform(0.2, 0.9), int(rng.integers(1, 16))))
+    for poly in polys:
+        d2 = (poly.x[:,None]-poly.x)**2.+(poly.y[:,None]-poly.y)**2.
+        assert poly.size()==np.sqrt(np.max(d2))
+
+def test_cached_properties():
+    hx = Hexagon(1.)
+    assert np.abs(hx.area-1.5*np.sqrt(3.))<1.e-12
+    assert np.abs(hx.perimeter-6.)<1.e-12
+    assert np.allclose(hx.bbox, [[-1.,1.],[-np.sqrt(3.)/2.,np.sqrt(3.)/2.]])
+    assert np.allclose(hx.centroid, [0.,0.])
+    assert not hx.x.flags.writeable
+
+    # setting coordinates invalidates the cache and the shape class symmetry
+    assert hx.symmetric
+    hx.x = 2.*hx.x
+    hx.y = 2.*hx.y
+    assert np.abs(hx.size()-4.)<1.e-12
+    assert np.abs(hx.area-6.*np.sqrt(3.))<1.e-12
+    assert not hx.symmetric
+    assert Hexagon(1.).symmetric
+    assert not Polygon(hx.x, hx.y).symmetric
+
+def test_within():
+    bp = BranchedPlanar(3., 3., 0.2, 0.2, 0.6, 0.5, 12)
+    rng = np.random.default_rng(5)
+    points = rng.uniform(-3., 3., [5000, 2])
+    assert np.array_equal(bp.within(points), in_polygon(bp.x, bp.y, points[:,0], points[:,1]))
+
+    # the edge index is reused by later calls and rebuilt for new coordinates
+    index = bp.edge_index
+    bp.within(points)
+    assert bp.edge_index is index
+    bp.x = 0.5*bp.x
+    assert bp.edge_index is not index
+    assert np.array_equal(bp.within(points), in_polygon(bp.x, bp.y, points[:,0], points[:,1]))
+
+def test_polygon_batch():
+    rng = np.random.default_rng(6)
+    batches = [PolygonBatch.hexagon([0.5, 1., 2.]),
+               PolygonBatch.stellar(rng.uniform(0.1, 0.9, 5), 1.),
+               PolygonBatch.branched_planar(rng.uniform(1., 3., 6), 3., 0.3, 0.2, 0.3, 0.6, [1, 3, 5, 8, 12, 20])]
+    batches.append(PolygonBatch.from_polygons([batch[0] for batch in batches]))
+    points = rng.uniform(-3., 3., [2000, 2])
+    for batch in batches:
+        polys = [batch[k] for k in range(len(batch))]
+        assert np.array_equal(batch.size(), [poly.size() for poly in polys])
+        assert np.allclose(batch.area, [poly.area for poly in polys], rtol=1.e-12)
+        assert np.array_equal(batch.within(points, chunk_size=50), [poly.within(points) for poly in polys])
+        for k, poly in enumerate(polys):
+            assert np.array_equal(batch.x[batch.offsets[k]:batch.offsets[k+1]], poly.x)
+    assert isinstance(batches[2][1], BranchedPlanar) and batches[2][1].nsb == 3
+    assert type(batches[3][0]) is Polygon
+
+    # negative and out of range indices
+    for batch in batches:
+        assert np.array_equal(batch[-1].x, batch[len(batch)-1].x)
+        for k in [len(batch), -len(batch)-1]:
+            with pytest.raises(IndexError):
+                batch[k]
+
+    with pytest.raises(ValueError):
+        PolygonBatch([0., 1., 0.], [0., 0., 1.], [0, 2])
+
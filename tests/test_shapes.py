@@ -1,6 +1,10 @@
 import numpy as np
-from crystal_dda.polygons import Hexagon
-from crystal_dda.shapes import Crystal
+import pytest
+from crystal_dda.polygons import Polygon, Hexagon, Stellar, BranchedPlanar
+from crystal_dda.polygon_utils import hexagon
+from crystal_dda.shapes import Crystal, growth_series, radial_thickness
+from crystal_dda.geometry import in_polygon, in_hexagon, points_in_polygon, euler_matrix, polygon_area
+from crystal_dda.geometry import scanline_fill, fill_symmetric
 
 # create crystal object
 def create_crystal():
@@ -17,8 +21,199 @@ def test_create_dipoles():
     cr.create_dipoles(0.04)
     assert cr.ndip == 9702
     
-def test_write_dipoles():
+def test_write_dipoles(tmp_path):
     cr = create_crystal()
     cr.create_dipoles(0.04)
-    cr.write_dipoles('test.txt')
-    assert 0 == 0
+    cr.write_dipoles(tmp_path/'test.txt')
+    assert (tmp_path/'test.txt').exists()
+
+def test_create_dipoles_symmetric():
+    polys = [Hexagon(1.), Stellar(0.3, 1.),
+             BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5),
+             BranchedPlanar(3., 3., 0.1, 0.4, 0.5, 0.3, 5)]
+    for poly in polys:
+        for dip_len in [0.1, 0.04]:
+            cr = Crystal(poly, 0.1)
+            cr.create_dipoles(dip_len, method='path')
+            for method in ['path', 'scanline']:
+                cr_sym = Crystal(poly, 0.1)
+                cr_sym.create_dipoles(dip_len, symmetric=True, method=method)
+                assert cr_sym.ndip == cr.ndip
+                assert np.array_equal(cr_sym.ix, cr.ix)
+                assert np.array_equal(cr_sym.iy, cr.iy)
+                assert np.array_equal(cr_sym.iz, cr.iz)
+
+def test_create_dipoles_symmetric_fill(monkeypatch):
+    # symmetric fills test one quadrant with the fill method, and scanline fills never use matplotlib
+    methods = []
+    def fill_quadrant(xpoly, ypoly, xg, method):
+        methods.append(method)
+        return fill_symmetric(xpoly, ypoly, xg, method=method)
+    def no_path(*args):
+        raise AssertionError('in_polygon called by a scanline fill')
+    monkeypatch.setattr('crystal_dda.shapes.fill_symmetric', fill_quadrant)
+    monkeypatch.setattr('crystal_dda.geometry.in_polygon', no_path)
+    poly = BranchedPlanar(3., 3., 0.3, 0.2, 0.3, 0.6, 20)
+    for dip_len in [0.01, 0.0101]:
+        cr = Crystal(poly, 0.1)
+        cr.create_dipoles(dip_len)
+        cr_sym = Crystal(poly, 0.1)
+        cr_sym.create_dipoles(dip_len, symmetric=True, workers=2)
+        assert np.array_equal(cr_sym.dipoles.i, cr.dipoles.i)
+        assert np.array_equal(cr_sym.dipoles.j, cr.dipoles.j)
+    assert methods == ['scanline', 'scanline']
+
+def test_create_dipoles_symmetric_error():
+    x, y = hexagon(1.)
+    cr = Crystal(Polygon(x+0.1, y), 0.1)
+    with pytest.raises(ValueError):
+        cr.create_dipoles(0.04, symmetric=True)
+
+    # shape class polygons with shifted points
+    hx = Hexagon(1.)
+    hx.x = hx.x+0.1
+    with pytest.raises(ValueError):
+        Crystal(hx, 0.1).create_dipoles(0.04, symmetric=True)
+
+def test_create_dipoles_scanline():
+    polys = [Hexagon(1.), Stellar(0.3, 1.),
+             BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5)]
+    for poly in polys:
+        cr = Crystal(poly, 0.1)
+        cr.create_dipoles(0.04, method='path')
+        cr_scan = Crystal(poly, 0.1)
+        cr_scan.create_dipoles(0.04, method='scanline')
+        assert np.array_equal(cr_scan.ix, cr.ix)
+        assert np.array_equal(cr_scan.iy, cr.iy)
+        assert np.array_equal(cr_scan.iz, cr.iz)
+
+def test_create_dipoles_workers():
+    poly = BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5)
+    for c in [0.1, radial_thickness(0.2, 0.05, 3.)]:
+        for method in ['scanline', 'path']:
+            cr = Crystal(poly, c)
+            cr.create_dipoles(0.04, method=method)
+            for workers, pool in [(3, 'thread'), (2, 'process')]:
+                cr_par = Crystal(poly, c)
+                cr_par.create_dipoles(0.04, method=method, workers=workers, pool=pool)
+                assert np.array_equal(cr_par.dipoles.i, cr.dipoles.i)
+                assert np.array_equal(cr_par.dipoles.j, cr.dipoles.j)
+                for ind, ind_par in zip(cr.dipole_arrays(), cr_par.dipole_arrays()):
+                    assert np.array_equal(ind_par, ind)
+                    assert ind_par.dtype == ind.dtype
+    with pytest.raises(ValueError):
+        Crystal(poly, 0.1).create_dipoles(0.04, workers=2, pool='cluster')
+
+def test_create_dipoles_workers_rows(monkeypatch):
+    # bands of workers fill each scanline row once, so the work does not grow with the number of bands
+    rows = []
+    def scanline_rows(xpoly, ypoly, xg, yg):
+        rows.append(len(yg))
+        return scanline_fill(xpoly, ypoly, xg, yg)
+    monkeypatch.setattr('crystal_dda.shapes.scanline_fill', scanline_rows)
+    cr = Crystal(BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5), 0.1)
+    for workers in [None, 4]:
+        cr.create_dipoles(0.04, workers=workers)
+        assert sum(rows) == int(cr.poly.size()/0.04)+1
+        rows.clear()
+
+def test_create_dipoles_fraction():
+    poly = BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5)
+    cr = Crystal(poly, 0.1)
+    cr.create_dipoles(0.2)
+    assert cr.weights is None
+
+    # weighted footprint area is the polygon area, and thresholds keep the cells above the fraction
+    foot = set()
+    for min_fraction in [0.9, 0.5, 0.]:
+        cr_frac = Crystal(poly, 0.1)
+        cr_frac.create_dipoles(0.2, min_fraction=min_fraction)
+        dips = cr_frac.dipoles
+        dx = dips.xg[1]-dips.xg[0]
+        assert np.all((dips.weight>min_fraction)&(dips.weight<=1.))
+        assert len(cr_frac.weights) == cr_frac.ndip
+        foot_frac = set(zip(dips.i, dips.j))
+        assert foot <= foot_frac
+        foot = foot_frac
+    assert np.isclose(np.sum(dips.weight)*dx**2., polygon_area(poly.x, poly.y))
+    assert abs(cr.dipoles.nfoot*dx**2.-polygon_area(poly.x, poly.y)) > 0.01
+
+def test_growth_series():
+    amax = 3.
+    a = np.linspace(0.3, amax, 5)
+    series = list(growth_series(a, amax, 0.3, 0.2, 0.3, 0.6, 5, 0.1, 0.05))
+    assert len(series) == len(a)
+
+    # full-size crystal is unchanged
+    cr_full = Crystal(BranchedPlanar(amax, amax, 0.3, 0.2, 0.3, 0.6, 5), 0.1)
+    cr_full.create_dipoles(0.05)
+    assert np.array_equal(series[-1].ix, cr_full.ix)
+    assert np.array_equal(series[-1].iy, cr_full.iy)
+
+    # footprints match polygon test on full-size grid away from clipping hexagon
+    dips = cr_full.dipoles
+    x = dips.xg[dips.i]
+    y = dips.xg[dips.j]
+    for asize, cr in zip(a, series):
+        bp = BranchedPlanar(asize, amax, 0.3, 0.2, 0.3, 0.6, 5)
+        inpoly = in_polygon(bp.x, bp.y, x, y)
+        inhex = in_hexagon(asize, x, y)
+        onhex = in_hexagon(asize+1.e-9, x, y)&~in_hexagon(asize-1.e-9, x, y)
+        assert np.array_equal(inpoly[~onhex], inhex[~onhex])
+        assert cr.dipoles.nfoot == np.sum(inhex)
+        assert cr.ndip == np.sum(inhex)*dips.ndipz
+
+def test_plan_dipoles():
+    polys = [Hexagon(1.), Stellar(0.3, 1.), BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5)]
+    for poly in polys:
+        cr = Crystal(poly, 0.1)
+        plan = cr.plan_dipoles(0.01)
+        assert plan['error'] <= 0.01
+        assert plan['ndip'] == cr.ndip
+
+        # error matches filled footprint
+        area_hex = 3.*np.sqrt(3.)/2.*poly.a**2.
+        afrac = cr.dipoles.nfoot*plan['dip_len']**2./area_hex
+        assert np.abs(np.abs(afrac-poly.area/area_hex)-plan['error']) < 1.e-12
+
+    # no analytic area fraction for general polygons
+    x, y = hexagon(1.)
+    cr = Crystal(Polygon(x+0.1, y), 0.1)
+    with pytest.raises(ValueError):
+        cr.plan_dipoles(0.01, reference='analytic')
+
+    # invalid spacing ranges, ratios and run lengths
+    for kwargs in [{'dip_len_max':0.01, 'dip_len_min':0.02}, {'dip_len_min':0.}, {'ratio':1.}, {'ratio':0.},
+                   {'nstable':0}]:
+        with pytest.raises(ValueError):
+            cr.plan_dipoles(0.01, **kwargs)
+
+def test_create_dipoles_rotated():
+    dip_len = 0.08
+    poly = BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5)
+    angles = [(0., 0., 0.), (30., 60., 10.), (0., 90., 0.), (90., 90., 0.), (10., 180., 20.), (12., 1.e-7, 3.)]
+    for alpha, beta, gamma in angles:
+        cr = Crystal(poly, 0.1)
+        cr.create_dipoles_rotated(dip_len, alpha, beta, gamma, chunk_size=1000)
+
+        # compare with test of every lattice point around the crystal
+        inv = euler_matrix(alpha, beta, gamma).T
+        n = int(poly.size()/2./dip_len)+2
+        ind = np.array(np.meshgrid(*[np.arange(-n, n+1)]*3, indexing='ij')).reshape(3, -1)
+        x, y, z = ind*dip_len
+        q = [inv[k,0]*x+inv[k,1]*y+inv[k,2]*z for k in range(3)]
+        inside = (np.abs(q[2])<=0.1)&points_in_polygon(poly.x, poly.y, q[0], q[1])
+        assert cr.ndip == np.sum(inside)
+        ind = ind[:,inside]
+        ind = ind-np.min(ind, axis=1)[:,None]+1
+        dips = [np.rint(dip).astype(int) for dip in cr.dipole_arrays()]
+        assert set(zip(*dips)) == set(zip(*ind))
+
+        # lattice points are only listed once
+        dips = cr.dipoles
+        key = (dips.i.astype(int)*len(dips.xg)+dips.j)*dips.ndipz
+        assert len(np.unique(np.concatenate([k+np.arange(k0, k1+1) for k, k0, k1 in
+                                             zip(key, dips.kmin, dips.kmax)]))) == cr.ndip
+
+    with pytest.raises(ValueError):
+        Crystal(poly, lambda x, y:0.1).create_dipoles_rotated(dip_len, 0., 0., 0.)
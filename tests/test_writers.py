@@ -0,0 +1,95 @@
+import gzip
+import numpy as np
+from crystal_dda.polygons import Hexagon, BranchedPlanar
+from crystal_dda.shapes import Crystal
+import crystal_dda.writers
+from crystal_dda.writers import write_columns, write_extruded_chunks
+
+# create filled crystal objects
+def create_crystals():
+    crystals = []
+    for poly in [Hexagon(1.), BranchedPlanar(2.5, 3., 0.3, 0.2, 0.3, 0.6, 5)]:
+        cr = Crystal(poly, 0.13)
+        cr.create_dipoles(0.037)
+        crystals.append(cr)
+    return crystals
+
+def test_write_dipoles(tmp_path):
+    for cr in create_crystals():
+        # write reference file with np.savetxt
+        header = "#generated by crystal-dda\n"+\
+                 "#shape: 'read'\n"+\
+                f"#box size: {np.max(cr.ix):.0f}x{np.max(cr.iy):.0f}x{np.max(cr.iz):.0f}\n"
+        np.savetxt(tmp_path/'ref.txt', np.c_[cr.ix, cr.iy, cr.iz],
+                   fmt=('%d','%d','%d'), header=header, comments='')
+
+        cr.write_dipoles(tmp_path/'test.txt')
+        cr.write_dipoles(str(tmp_path/'test.txt.gz'))
+        ref = (tmp_path/'ref.txt').read_bytes()
+        assert (tmp_path/'test.txt').read_bytes() == ref
+        assert gzip.open(tmp_path/'test.txt.gz', 'rb').read() == ref
+
+def test_write_points(tmp_path):
+    dip_len = 0.037
+    for cr in create_crystals():
+        x = cr.ix*dip_len
+        y = cr.iy*dip_len
+        z = cr.iz*dip_len
+        x = x-np.mean(x)
+        y = y-np.mean(y)
+        z = z-np.mean(z)
+        header = "#generated by crystal-dda\n"+\
+                 "#shape: 'read'\n"+\
+                f"#box size: {np.ptp(x):.0f}x{np.ptp(y):.0f}x{np.ptp(z):.0f}"
+        np.savetxt(tmp_path/'ref.txt', np.c_[x, y, z],
+                   fmt=('%.4f','%.4f','%.4f'), header=header, comments='')
+
+        cr.write_points(tmp_path/'test.txt', dip_len)
+        assert (tmp_path/'test.txt').read_bytes() == (tmp_path/'ref.txt').read_bytes()
+
+def test_write_columns(tmp_path):
+    cr = create_crystals()[0]
+    chunks = [(cr.ix[:1000], cr.iy[:1000], cr.iz[:1000]),
+              (cr.ix[1000:], cr.iy[1000:], cr.iz[1000:])]
+    write_columns(tmp_path/'test.txt', chunks, ('%d','%d','%d'), header='#header')
+    dips = np.loadtxt(tmp_path/'test.txt', comments='#')
+    assert np.array_equal(dips, np.floor(np.c_[cr.ix, cr.iy, cr.iz]))
+
+def test_write_extruded_chunks(tmp_path, monkeypatch):
+    # chunks are limited to chunk_size rows (and at least one footprint point) for any number of layers
+    x = np.arange(50)
+    y = 2*np.arange(50)
+    text = ''.join([f'{xi} {yi} {zk}\n' for xi, yi in zip(x, y) for zk in range(1, 31)])
+    npoints = []
+    format_rows = crystal_dda.writers.format_rows
+    def format_points(fmt, columns, **kwargs):
+        npoints.append(len(columns[0]))
+        return format_rows(fmt, columns, **kwargs)
+    monkeypatch.setattr(crystal_dda.writers, 'format_rows', format_points)
+    for chunk_size, npoint in [(100, 3), (10, 1), (10000, 25)]:
+        write_extruded_chunks(tmp_path/'test.txt', [(x[:25], y[:25]), (x[25:], y[25:])], np.arange(30)+1,
+                              ('%d','%d','%d'), chunk_size=chunk_size)
+        assert (tmp_path/'test.txt').read_text() == text
+        assert max(npoints) == npoint
+        npoints.clear()
+
+def test_stream_dipoles(tmp_path):
+    for cr in create_crystals():
+        cr.write_dipoles(tmp_path/'ref.txt')
+        ref = (tmp_path/'ref.txt').read_bytes()
+
+        # stream with tiles smaller than the grid
+        cr_stream = Crystal(cr.poly, cr.c)
+        ndip = cr_stream.stream_dipoles(str(tmp_path/'stream.txt.gz'), 0.037, tile_size=7)
+        assert ndip == cr.ndip
+        assert cr_stream.dipoles is None
+        assert gzip.open(tmp_path/'stream.txt.gz', 'rb').read() == ref
+
+        # chunks of the streamed dipoles make up the full arrays
+        chunks = list(cr_stream.iter_dipoles(0.037, tile_size=5, chunk_size=100))
+        assert max([len(chunk[0]) for chunk in chunks]) <= 100*cr.dipoles.ndipz
+        for ind, ind_chunks in zip(cr.dipole_arrays(), zip(*chunks)):
+            assert np.array_equal(ind, np.concatenate(ind_chunks))
+        write_columns(tmp_path/'columns.txt', cr_stream.iter_dipoles(0.037), ('%d','%d','%d'),
+                      header=ref.decode().split('\n\n')[0]+'\n')
+        assert (tmp_path/'columns.txt').read_bytes() == ref